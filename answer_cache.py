@@ -0,0 +1,129 @@
+import threading
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+import streamlit as st
+
+from config import Settings
+from invalidation import on_doc_changed
+from lexical_index import extract_codes
+from memory_cache import TTLLRUCache
+
+
+class AnswerCache:
+    """
+    process_rag_query 결과 캐시
+    - 정확 일치: (scope, 정규화된 질문)
+    - 유사 일치: 같은 scope 안에서 질문 임베딩 cosine 유사도 >= similarity_threshold (질문의 에러 코드 집합도 같아야 함)
+    - scope = (doc_id_filter, out-of-scope 임계치) : 임계치가 바뀌면 답변도 달라질 수 있으므로 포함
+    - 문서가 재적재/삭제되면 그 문서를 참조했을 수 있는 항목만 무효화
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float, similarity_threshold: float):
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = TTLLRUCache(max_entries, ttl_s)
+        self._lock = threading.Lock()
+
+    def get_exact(self, scope: Hashable, norm_question: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get((scope, norm_question))
+        if entry is None:
+            return None
+        with self._lock:
+            self.exact_hits += 1
+        return dict(entry["result"])
+
+    def get_similar(
+        self, scope: Hashable, norm_question: str, query_embedding: List[float]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        에러 코드/모델명이 다른 질문("e-05 에러가 떠요" vs "e-06 에러가 떠요")은 임베딩이 거의 같아도
+        답이 다르므로, 질문에 든 코드 집합이 같은 항목만 후보로 봄
+        """
+        codes = frozenset(extract_codes(norm_question))
+        with self._lock:
+            snapshot = self._entries.items()
+        candidates = [
+            (k, e) for k, e in snapshot
+            if k[0] == scope and e["embedding"] is not None and e["codes"] == codes
+        ]
+        if candidates:
+            q = np.asarray(query_embedding, dtype=np.float32)
+            q = q / max(float(np.linalg.norm(q)), 1e-12)
+            sims = np.stack([e["embedding"] for _, e in candidates]) @ q
+            best = int(np.argmax(sims))
+            if float(sims[best]) >= self.similarity_threshold:
+                key, entry = candidates[best]
+                self._entries.get(key)  # LRU 순서 갱신
+                with self._lock:
+                    self.semantic_hits += 1
+                return dict(entry["result"])
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(
+        self,
+        scope: Hashable,
+        norm_question: str,
+        query_embedding: Optional[List[float]],
+        result: Dict[str, Any],
+        doc_ids: Iterable[int],
+    ) -> None:
+        """
+        query_embedding 이 None 이면(임베딩 없이 답한 코드 질문 등) 정확 일치로만 조회됨
+        """
+        emb = None
+        if query_embedding is not None:
+            emb = np.asarray(query_embedding, dtype=np.float32)
+            emb = emb / max(float(np.linalg.norm(emb)), 1e-12)
+        entry = {
+            "result": dict(result),
+            "embedding": emb,
+            "codes": frozenset(extract_codes(norm_question)),
+            "doc_ids": {int(d) for d in doc_ids if d is not None},
+        }
+        # invalidate_doc 와 직렬화: 무효화 도중 들어온 항목이 스냅샷 밖에서 지워지거나 남지 않도록
+        with self._lock:
+            self._entries.put((scope, norm_question), entry)
+
+    def invalidate_doc(self, doc_id: int) -> None:
+        with self._lock:
+            for key, entry in self._entries.items():
+                doc_id_filter = key[0][0]
+                if doc_id_filter is None or doc_id_filter == doc_id or doc_id in entry["doc_ids"]:
+                    self._entries.pop(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": self._entries.stats()["entries"],
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": ((self.exact_hits + self.semantic_hits) / total) if total else 0.0,
+        }
+
+
+def answer_cache_scope(settings: Settings, doc_id_filter: Optional[int]) -> Tuple[Optional[int], float]:
+    return (doc_id_filter, round(float(settings.similarity_threshold), 4))
+
+
+@st.cache_resource
+def _open_answer_cache(max_entries: int, ttl_s: float, similarity_threshold: float) -> AnswerCache:
+    cache = AnswerCache(max_entries, ttl_s, similarity_threshold)
+    on_doc_changed(cache.invalidate_doc)
+    return cache
+
+
+def get_answer_cache(settings: Settings) -> Optional[AnswerCache]:
+    if not settings.answer_cache_enabled:
+        return None
+    return _open_answer_cache(
+        settings.answer_cache_max_entries, settings.answer_cache_ttl_s, settings.answer_cache_similarity
+    )
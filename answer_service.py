@@ -1,56 +1,67 @@
-from typing import List, Dict, Any
+import re
+import time
+from typing import Iterator, List, Dict, Any, Optional
 from openai import OpenAI
+from context_packer import CONTEXT_SEPARATOR, format_context, pack_contexts
+from tracing import span, usage_attrs
 from utils_text import robust_json_loads
 
 
+# 답변 규칙 (JSON / 스트리밍 공통). 출력 형식만 경로별로 뒤에 덧붙임
+_SYSTEM_PROMPT_RULES = """너는 장비 매뉴얼 PDF에서 추출된 정보만을 근거로 답변하는 기술지원 전문가다.
+아래 제공되는 "매뉴얼 발췌"는 네가 참조할 수 있는 유일한 지식 창고다.
+
+[역할 및 지침]
+- 각 발췌문 상단의 [page=N] 태그는 해당 정보의 원본 페이지 번호다.
+- 사용자의 질문에 대해 "매뉴얼 발췌"에 명시된 절차와 수치만을 사용하여 답변한다.
+
+[절대 규칙]
+1. 정보 부재 시 대응: 질문에 대한 직접적인 해결책이 발췌 내용에 없다면, 추측하지 말고 "문서에 존재하지 않습니다." 라고만 답한다.
+2. 단계별 가이드: 답변은 반드시 한국어로, 실행 가능한 단계별(1., 2., 3.) 번호 목록으로 작성하라. 사족이나 배경 설명은 모두 배제한다.
+3. 정확한 인용: 답변에 사용된 정보가 포함된 모든 [page=N]의 N 숫자를 인용 페이지로 수집하라. 중복된 번호는 한 번만 기록한다.
+
+[검증 체크리스트]
+- 답변의 모든 문장이 발췌문에 근거하는가?
+- 외부 지식이나 상식으로 내용을 보충하지 않았는가?"""
+
+_SYSTEM_PROMPT = _SYSTEM_PROMPT_RULES + """
+
+[출력 형식]
+- 오직 순수한 JSON 객체 하나만 출력하라: {"answer": "<답변>", "cited_pages": [<인용 페이지 번호>, ...]}
+- 정보가 없으면 {"answer": "문서에 존재하지 않습니다.", "cited_pages": []}
+- 마크다운 코드 블록(```json)이나 앞뒤 설명을 절대 포함하지 마라. 출력의 시작은 '{', 끝은 '}'여야 한다."""
+
+
 def openai_answer_with_rag(
     client: OpenAI,
     model: str,
     question: str,
     contexts: List[Dict[str, Any]],
+    max_context_tokens: Optional[int] = None,
 ) -> Dict[str, Any]:
     """
-    contexts: [{"page_number": int, "content": str, "similarity": float}, ...]
+    contexts: [{"doc_id": int, "page_number": int, "chunk_index": int, "content": str, "similarity": float}, ...]
+    max_context_tokens: 지정하면 같은 페이지의 연속 chunk 를 합치고 토큰 예산 내로 패킹
     return: {"answer": str, "cited_pages": [int, ...]}
     """
-    ctx_lines = []
-    for c in contexts:
-        ctx_lines.append(f"[page={c['page_number']}, similarity={c['similarity']:.3f}]\n{c['content']}")
-    ctx_text = "\n\n---\n\n".join(ctx_lines)
-
-    system = (
-        """너는 장비 매뉴얼 PDF에서 추출된 정보만을 근거로 답변하는 기술지원 전문가다.
-            아래 제공되는 "매뉴얼 발췌"는 네가 참조할 수 있는 유일한 지식 창고다.
-
-            [역할 및 지침]
-            - 각 발췌문 상단의 [page=N] 태그는 해당 정보의 원본 페이지 번호다.
-            - 사용자의 질문에 대해 "매뉴얼 발췌"에 명시된 절차와 수치만을 사용하여 답변한다.
-
-            [절대 규칙]
-            1. 정보 부재 시 대응: 질문에 대한 직접적인 해결책이 발췌 내용에 없다면, 추측하지 말고 반드시 아래 JSON 구조를 반환하라:
-                {"answer": "문서에 존재하지 않습니다.", "cited_pages": []}
-
-            2. 단계별 가이드: 답변은 반드시 한국어로, 실행 가능한 단계별(1., 2., 3.) 번호 목록으로 작성하라. 사족이나 배경 설명은 모두 배제한다.
-
-            3. 정확한 인용: 답변에 사용된 정보가 포함된 모든 [page=N]의 N 숫자를 `cited_pages` 배열에 수집하라. 중복된 번호는 한 번만 기록한다.
-            4. 형식 엄수: 오직 순수한 JSON 객체 하나만 출력하라. 마크다운 코드 블록(```json)이나 앞뒤 설명을 절대 포함하지 마라. 출력의 시작은 '{', 끝은 '}'여야 한다.
-            
-            [검증 체크리스트]
-            - 답변의 모든 문장이 발췌문에 근거하는가?
-            - 외부 지식이나 상식으로 내용을 보충하지 않았는가?
-            - 출력 형식이 유효한 JSON인가?"""
-        )
+    if max_context_tokens:
+        contexts = pack_contexts(contexts, max_context_tokens, model)
+    ctx_text = CONTEXT_SEPARATOR.join(format_context(c) for c in contexts)
+
+    system = _SYSTEM_PROMPT
 
     user = f"사용자 질문:\n{question}\n\n매뉴얼 발췌:\n{ctx_text}\n"
 
-    resp = client.responses.create(
-        model=model,
-        input=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
-    )
-    text_out = resp.output_text
+    with span("openai.responses", model=model, contexts=len(contexts), bytes_out=len(user.encode("utf-8"))) as sp:
+        resp = client.responses.create(
+            model=model,
+            input=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": user},
+            ],
+        )
+        text_out = resp.output_text
+        sp.set(**usage_attrs(getattr(resp, "usage", None)))
 
     data = robust_json_loads((text_out or "").strip())
     if not data or "answer" not in data:
@@ -66,3 +77,108 @@ def openai_answer_with_rag(
 
     cited_pages = sorted(set(cited_pages))
     return {"answer": str(data.get("answer", "")).strip(), "cited_pages": cited_pages}
+
+
+# 스트리밍 출력 프로토콜: 답변 본문(평문)을 먼저 쓰고, 마지막 줄에 마커 + 인용 페이지 번호
+CITATION_MARKER = "[[CITED_PAGES]]"
+
+_STREAM_SYSTEM_PROMPT = _SYSTEM_PROMPT_RULES + f"""
+
+[출력 형식]
+- JSON 이나 마크다운 코드 블록을 쓰지 말고 답변 본문만 평문으로 먼저 출력하라.
+- 정보가 없으면 본문에 "문서에 존재하지 않습니다." 한 문장만 쓴다.
+- 본문이 끝나면 마지막 줄에 `{CITATION_MARKER}` 를 쓰고 그 뒤에 인용 페이지 번호(N)를 쉼표로 구분해 한 번씩 적어라.
+  예) {CITATION_MARKER} 3, 5
+  근거가 없으면 `{CITATION_MARKER}` 만 쓴다."""
+
+
+class AnswerStream:
+    """
+    openai_answer_with_rag 의 스트리밍 결과
+    - 반복하면 답변 본문 조각을 도착하는 대로 yield (인용 마커 이후는 내보내지 않음)
+    - 반복이 끝나면 result = {"answer": str, "cited_pages": [int, ...]}
+    """
+
+    def __init__(self, events, started_at: float):
+        self._events = events
+        self._t0 = started_at  # 요청(create 호출) 직전 시각: 연결/대기 시간까지 첫 토큰 시간에 포함
+        self.result: Optional[Dict[str, Any]] = None
+
+    def __iter__(self) -> Iterator[str]:
+        if self.result is not None:
+            yield self.result["answer"]
+            return
+
+        with span("openai.responses.stream") as sp:
+            try:
+                yield from self._consume(sp)
+            finally:
+                # 중간에 끊기면(rerun / 예외) 응답 스트림 연결을 바로 반환
+                close = getattr(self._events, "close", None)
+                if close is not None:
+                    close()
+
+    def _consume(self, sp) -> Iterator[str]:
+        buf = ""
+        emitted = 0
+        marker_at = -1
+        first_token_seen = False
+        for ev in self._events:
+            ev_type = getattr(ev, "type", "")
+            if ev_type == "response.completed":
+                sp.set(**usage_attrs(getattr(getattr(ev, "response", None), "usage", None)))
+            if ev_type != "response.output_text.delta":
+                continue
+            if ev.delta and not first_token_seen:
+                first_token_seen = True
+                sp.set(ttft_ms=round((time.perf_counter() - self._t0) * 1000.0, 1))
+            buf += ev.delta or ""
+            if marker_at >= 0:
+                continue
+            marker_at = buf.find(CITATION_MARKER)
+            # 마커가 조각 경계에 걸쳐 올 수 있으므로 마커 길이만큼은 보류
+            safe = marker_at if marker_at >= 0 else len(buf) - len(CITATION_MARKER) + 1
+            if safe > emitted:
+                yield buf[emitted:safe]
+                emitted = safe
+
+        if marker_at < 0:
+            if emitted < len(buf):
+                yield buf[emitted:]
+            answer, tail = buf, ""
+        else:
+            answer, tail = buf[:marker_at], buf[marker_at + len(CITATION_MARKER):]
+
+        answer = answer.strip()
+        self.result = {
+            "answer": answer or "문서에 존재하지 않습니다.",
+            "cited_pages": sorted({int(p) for p in re.findall(r"\d+", tail)}),
+        }
+
+
+def openai_answer_with_rag_stream(
+    client: OpenAI,
+    model: str,
+    question: str,
+    contexts: List[Dict[str, Any]],
+    max_context_tokens: Optional[int] = None,
+) -> AnswerStream:
+    """
+    Responses API 스트리밍 이벤트로 답변을 받는 버전 (첫 토큰부터 화면에 표시 가능)
+    return: AnswerStream (반복 후 .result 에 {"answer", "cited_pages"})
+    """
+    if max_context_tokens:
+        contexts = pack_contexts(contexts, max_context_tokens, model)
+    ctx_text = CONTEXT_SEPARATOR.join(format_context(c) for c in contexts)
+    user = f"사용자 질문:\n{question}\n\n매뉴얼 발췌:\n{ctx_text}\n"
+
+    started_at = time.perf_counter()
+    events = client.responses.create(
+        model=model,
+        input=[
+            {"role": "system", "content": _STREAM_SYSTEM_PROMPT},
+            {"role": "user", "content": user},
+        ],
+        stream=True,
+    )
+    return AnswerStream(events, started_at)
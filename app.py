@@ -1,22 +1,29 @@
-import hashlib
+import json
+import logging
 import streamlit as st
 
 from config import load_settings
 from clients import get_openai_client
-from ocr_service import extract_text_from_image_gpt41mini
-from ingest_service import ingest_pdf_to_supabase
-from retrieval_service import retrieve_contexts, list_docs, get_page_image_url
+from ocr_service import cached_ocr, get_ocr_cache, image_digest
+from transcription_service import get_transcript_cache, transcribe_audio
+from ingest_queue import get_ingest_queue
+from retrieval_service import retrieve_contexts, list_docs, get_page_image_url, get_query_embedding_cache
 from answer_service import openai_answer_with_rag
-from storage_service import delete_doc_and_assets
+from delete_queue import get_delete_queue
+from embedding_cache import get_embedding_cache
+from retrieval_backends import get_retrieval_backend, quantization_recall
+from answer_cache import get_answer_cache
+from metadata_cache import get_metadata_cache
 from utils_text import is_refusal_answer, merge_pages_cited_then_search
-from PIL import Image
-from io import BytesIO  # ✅ 추가
 
 from audio_recorder_streamlit import audio_recorder
 import os
-import tempfile
-from process_rag_query import process_rag_query
+from process_rag_query import process_rag_query, process_rag_query_stream
 from render import render_related_pages, get_related_pages
+from batch_runner import read_questions, run_batch
+from tracing import render_prometheus, start_trace
+
+logger = logging.getLogger(__name__)
 
 st.set_page_config(page_title="NexOps-가장 명확한 근거, 가장 빠른 현장 조치", layout="wide")
 settings = load_settings()
@@ -54,6 +61,8 @@ resize_max_px = st.sidebar.slider(
     help="업로드 이미지의 긴 변을 이 값 이하로 축소합니다. (OCR 비용/속도 최적화)",
 )
 
+show_timing = st.sidebar.checkbox("답변별 소요 시간 표시", value=False)
+
 
 # -------------------------
 # Admin
@@ -61,19 +70,144 @@ resize_max_px = st.sidebar.slider(
 if mode == "지식 자산 관리":
     st.subheader("매뉴얼 업로드 및 AI 지식 엔진 구축")
 
-    title = st.text_input("문서 제목(예: 장비A_매뉴얼)", value="")
-    pdf = st.file_uploader("PDF 업로드", type=["pdf"])
+    docs = list_docs(settings)
+
+    # 새 문서로 적재하거나, 기존 문서를 개정판 PDF로 업데이트(변경된 페이지만 반영)
+    target_options = [{"id": None, "title": "새 문서로 적재"}] + [
+        {"id": int(d["id"]), "title": f"#{d['id']} - {d['title']} (업데이트)"}
+        for d in docs
+    ]
+    target = st.selectbox("적재 대상", options=target_options, format_func=lambda x: x["title"], index=0)
+    update_doc_id = target["id"]
+
+    title = st.text_input(
+        "문서 제목(예: 장비A_매뉴얼, 여러 파일이면 파일명 사용)", value="", disabled=update_doc_id is not None
+    )
+    pdfs = st.file_uploader("PDF 업로드 (여러 개 선택 가능)", type=["pdf"], accept_multiple_files=True)
+
+    # 업데이트 대상은 PDF 1개만 허용
+    can_enqueue = bool(pdfs) and (update_doc_id is None or len(pdfs) == 1)
+    if st.button("적재 실행", type="primary", disabled=not can_enqueue):
+        ingest_queue = get_ingest_queue(settings)
+        for f in pdfs:
+            # 동일 PDF(파일 해시) 확인은 워커의 ingest_pdf_to_supabase 가 PDF 선점 후 한 번만 함 → 바로 완료 처리
+            pdf_bytes = f.getvalue()
+            doc_title = title if (title and len(pdfs) == 1) else os.path.splitext(f.name)[0]
+            job_id = ingest_queue.enqueue(doc_title, pdf_bytes, doc_id=update_doc_id)
+            st.success(f"적재 대기열에 추가했습니다: job #{job_id} | {doc_title}")
+        st.info("※ 적재는 백그라운드에서 진행됩니다. 브라우저를 닫거나 새로고침해도 계속 진행됩니다.")
+
+    st.subheader("적재 작업 진행 상황")
+    _fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+    @_fragment(run_every=2)
+    def render_ingest_jobs():
+        jobs = get_ingest_queue(settings).list_jobs(limit=20)
+        if not jobs:
+            st.caption("적재 작업이 없습니다.")
+            return
+        for job in jobs:
+            label = f"job #{job['id']} | {job['title']} | {job['status']}"
+            if job["result_doc_id"]:
+                label += f" | doc_id={job['result_doc_id']}"
+            detail = f"{job['pages_done']}/{job['page_count'] or '?'} pages, chunks {job['chunks_done']}"
+            if job["pages_per_s"]:
+                detail += f", {job['pages_per_s']:.2f} pages/s"
+            if job["eta_s"] is not None:
+                detail += f", ETA {int(job['eta_s'])}s"
+            ratio = (job["pages_done"] / job["page_count"]) if job["page_count"] else 0.0
+            st.progress(min(1.0, ratio), text=f"{label} — {detail}")
+            if job["status"] == "failed":
+                st.error(f"job #{job['id']} 실패: {job['error']}")
+                if st.button("재시도", key=f"retry_job_{job['id']}"):
+                    get_ingest_queue(settings).retry(job["id"])
+
+    render_ingest_jobs()
+
+    emb_cache = get_embedding_cache(settings)
+    if emb_cache:
+        cs = emb_cache.stats()
+        st.caption(
+            f"임베딩 캐시: hit {cs['hits']} / miss {cs['misses']} "
+            f"(hit rate {cs['hit_rate']:.1%}), 저장된 벡터 {cs['entries']}개"
+        )
+    qs = get_query_embedding_cache(settings).stats()
+    st.caption(
+        f"질문 임베딩 캐시: hit {qs['hits']} / miss {qs['misses']} "
+        f"(hit rate {qs['hit_rate']:.1%}), 저장된 질문 {qs['entries']}개"
+    )
+    answer_cache = get_answer_cache(settings)
+    if answer_cache:
+        acs = answer_cache.stats()
+        st.caption(
+            f"답변 캐시: 정확 일치 {acs['exact_hits']} / 유사 질문 {acs['semantic_hits']} / miss {acs['misses']} "
+            f"(hit rate {acs['hit_rate']:.1%}), 저장된 답변 {acs['entries']}개"
+        )
+    ocr_cache = get_ocr_cache(settings)
+    if ocr_cache:
+        ocs = ocr_cache.stats()
+        st.caption(
+            f"OCR 캐시: hit {ocs['hits']} / miss {ocs['misses']} "
+            f"(hit rate {ocs['hit_rate']:.1%}), 저장된 결과 {ocs['entries']}개"
+        )
+    transcript_cache = get_transcript_cache(settings)
+    if transcript_cache:
+        tcs = transcript_cache.stats()
+        st.caption(
+            f"음성 변환 캐시: hit {tcs['hits']} / miss {tcs['misses']} "
+            f"(hit rate {tcs['hit_rate']:.1%}), 저장된 결과 {tcs['entries']}개"
+        )
+    ms = get_metadata_cache(settings).stats()
+    st.caption(
+        f"메타데이터 캐시: 페이지 테이블 hit {ms['pages']['hits']} / miss {ms['pages']['misses']} "
+        f"(문서 {ms['pages']['entries']}개), 카탈로그 hit {ms['catalog']['hits']} / miss {ms['catalog']['misses']}"
+    )
+
+    with st.expander("질문 일괄 실행 / 캐시 예열 (JSONL)"):
+        st.caption(
+            '한 줄에 하나: {"question": "...", "doc_id_filter": 3} — 이 서버의 질문 임베딩/메타데이터 캐시를 채웁니다. '
+            "답변 캐시는 켜져 있을 때만 채워집니다."
+        )
+        batch_file = st.file_uploader("질문 JSONL", type=["jsonl"], key="batch_questions")
+        bc1, bc2 = st.columns(2)
+        batch_concurrency = bc1.number_input("동시 실행 수", min_value=1, max_value=16, value=4)
+        batch_rate = bc2.number_input("초당 최대 질문 수 (0 = 제한 없음)", min_value=0.0, value=2.0)
+        if batch_file and st.button("일괄 실행"):
+            items = read_questions(batch_file.getvalue().decode("utf-8").splitlines())
+            with st.spinner(f"{len(items)}개 질문 실행 중..."):
+                batch_results = []
+                summary = run_batch(
+                    settings,
+                    items,
+                    concurrency=int(batch_concurrency),
+                    rate_per_s=float(batch_rate),
+                    on_result=batch_results.append,
+                )
+            st.json(summary)
+            st.download_button(
+                "결과 JSONL 다운로드",
+                data="\n".join(json.dumps(r, ensure_ascii=False) for r in batch_results),
+                file_name="batch_results.jsonl",
+            )
 
-    if st.button("적재 실행", type="primary", disabled=not (title and pdf)):
-        with st.spinner("PDF를 페이지별로 처리하고, 임베딩을 생성하여 Supabase에 저장 중..."):
-            pdf_bytes = pdf.read()
-            doc_id, total_chunks = ingest_pdf_to_supabase(settings, pdf_bytes, title)
-        st.success(f"완료! doc_id={doc_id}, total_chunks={total_chunks}")
-        st.info("※ 목차 제외(DB레벨)는 is_toc 태깅이 필요하므로, 이 방식 적용 후에는 재적재가 반영됩니다.")
+    with st.expander("지표 (Prometheus text format)"):
+        st.caption(f"{settings.metrics_path} 에도 {settings.metrics_flush_interval_s:.0f}초 간격으로 기록됩니다.")
+        st.code(render_prometheus(), language="text")
+
+    if settings.retrieval_backend == "local":
+        with st.expander("로컬 벡터 인덱스 / 양자화 recall 점검"):
+            index = get_retrieval_backend(settings)
+            mem = index.memory_bytes()
+            st.caption(
+                f"벡터 {len(index.ids)}개, quantization={settings.local_index_quantization}, "
+                f"상주 메모리 {mem['resident'] / 1e6:.1f}MB (원본 {mem['full_precision'] / 1e6:.1f}MB)"
+            )
+            if st.button("recall@10 측정 (정확 검색 대비)"):
+                with st.spinner("측정 중..."):
+                    st.dataframe(quantization_recall(index, k=10))
 
     st.divider()
     st.subheader("적재된 문서 목록")
-    docs = list_docs(settings)
     if not docs:
         st.info("아직 적재된 문서가 없습니다.")
     else:
@@ -83,7 +217,6 @@ if mode == "지식 자산 관리":
     st.divider()
     st.subheader("문서 삭제 (DB + Storage 이미지)")
 
-    docs = list_docs(settings)
     if not docs:
         st.info("삭제할 문서가 없습니다.")
     else:
@@ -93,18 +226,33 @@ if mode == "지식 자산 관리":
 
         confirm = st.checkbox("정말 삭제합니다. (DB + Storage 이미지까지 삭제됨)", value=False)
         if st.button("선택 문서 삭제", type="secondary", disabled=not confirm):
-            with st.spinner(f"doc_id={del_doc_id} 삭제 중..."):
-                result = delete_doc_and_assets(settings, del_doc_id)
-
-            if result.get("ok"):
-                st.success(f"삭제 완료: doc_id={del_doc_id}")
-                st.write(f"- Storage 삭제: {result.get('storage_deleted', 0)}개")
-                failed = result.get("storage_failed", [])
-                if failed:
-                    st.warning(f"Storage 삭제 실패 {len(failed)}개 (권한/경로 확인 필요)")
-                    st.text("\n".join(failed[:50]))
-            else:
-                st.error(f"삭제 실패: {result.get('error')}")
+            try:
+                job_id = get_delete_queue(settings).delete(del_doc_id)
+                st.success(f"삭제 요청 완료: doc_id={del_doc_id} (검색/목록에서 바로 제외, 데이터 정리는 job #{job_id})")
+            except Exception as e:
+                st.error(f"삭제 실패: {e}")
+
+    @_fragment(run_every=2)
+    def render_delete_jobs():
+        jobs = get_delete_queue(settings).list_jobs(limit=10)
+        if not jobs:
+            return
+        st.caption("삭제 작업 진행 상황")
+        for job in jobs:
+            label = f"삭제 job #{job['id']} | doc_id={job['doc_id']} | {job['status']}"
+            detail = f"{job['steps_done']}/{job['steps_total'] or '?'} 요청"
+            if job["status"] == "done":
+                detail += f", Storage 삭제 {job['storage_deleted']}개"
+            ratio = (job["steps_done"] / job["steps_total"]) if job["steps_total"] else 0.0
+            st.progress(min(1.0, ratio), text=f"{label} — {detail}")
+            if job["storage_failed"]:
+                st.warning(f"job #{job['id']}: Storage 삭제 실패 {job['storage_failed']}개 (권한/경로 확인 필요)")
+            if job["status"] == "failed":
+                st.error(f"삭제 job #{job['id']} 실패: {job['error']}")
+                if st.button("재시도", key=f"retry_delete_job_{job['id']}"):
+                    get_delete_queue(settings).retry(job["id"])
+
+    render_delete_jobs()
 
 # -------------------------
 # Chatbot
@@ -141,6 +289,21 @@ else:
     if "finish_voice" not in st.session_state:
         st.session_state.finish_voice = False
 
+    # 직전 답변의 단계별 소요 시간 (사이드바)
+    if show_timing and st.session_state.get("last_trace"):
+        last_trace = st.session_state.last_trace
+        with st.sidebar:
+            st.markdown(f"**직전 답변 소요 시간: {last_trace['ms']:.0f} ms**")
+            st.dataframe(
+                [
+                    {"단계": "\u3000" * sp["depth"] + sp["name"], "ms": sp["ms"]}
+                    for sp in last_trace["spans"]
+                ],
+                hide_index=True,
+            )
+            if last_trace["cache"]:
+                st.caption(", ".join(f"{k}={v}" for k, v in last_trace["cache"].items()))
+
      # 채팅 히스토리
     if "chat" not in st.session_state:
         st.session_state.chat = []
@@ -155,7 +318,7 @@ else:
     # -------------------------
     # 질문 입력 / 전송 (OCR과 무관: 질문창 내용만 전송)
     # -------------------------
-    print(f"st.session_state.draft_question:{st.session_state.draft_question}")
+    logger.debug("draft_question: %s", st.session_state.draft_question)
     prompt = st.chat_input(
        st.session_state.draft_question
     )
@@ -205,67 +368,57 @@ else:
     if audio_bytes and audio_bytes != st.session_state.last_audio_bytes:
         st.session_state.last_audio_bytes = audio_bytes
         st.session_state.transcription_result = None  # 이전 결과 초기화
-        print("1 녹음 저장")
-        # 임시 파일로 저장
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
-            tmp_file.write(st.session_state.last_audio_bytes)
-            wav_path = tmp_file.name
+        logger.debug("녹음 저장")
         try:
-            # Whisper API 호출
             with st.spinner("🤖 음성을 텍스트로 변환 중..."):
-                with open(wav_path, "rb") as audio_file:
-                    client = get_openai_client(settings.openai_api_key)
-                    transcript = client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_file,
-                        language="ko",
-                        response_format="text"
-                    )
-        
+                client = get_openai_client(settings.openai_api_key)
+                with start_trace(settings, "transcription"):
+                    transcript, _ = transcribe_audio(settings, client, audio_bytes)
+
             # 결과 저장
-            st.session_state.transcription_result = transcript
-            print(f"음성변환: {transcript}")
-        
+            st.session_state.transcription_result = transcript or None
+            logger.debug("음성변환: %s", transcript)
+
         except Exception as e:
             st.error(f"❌ 변환 실패: {str(e)}")
             st.exception(e)
-        
-        finally:
-            # 임시 파일 삭제
-            try:
-                if os.path.exists(wav_path):
-                    os.remove(wav_path)
-            except Exception:
-                pass
-    
+
     # 5. 실제 질문 결정
     final_prompt = prompt or st.session_state.transcription_result 
     if final_prompt:
-        print("질문")   
+        logger.debug("질문: %s", final_prompt)
         st.session_state.draft_question = ""
 
         st.session_state.chat.append({"role": "user", "content": final_prompt})
         with st.chat_message("user"):
             st.markdown(final_prompt)
 
-        with st.chat_message("assistant"):
-            with st.spinner("검색 및 답변 생성 중..."):
-                result = process_rag_query(settings, final_prompt, doc_id_filter)
+        with start_trace(settings, "chat", doc_id_filter=doc_id_filter) as trace:
+            with st.chat_message("assistant"):
+                if settings.answer_streaming:
+                    # 검색까지만 spinner, 답변은 첫 토큰부터 바로 표시
+                    with st.spinner("검색 중..."):
+                        stream = process_rag_query_stream(settings, final_prompt, doc_id_filter)
+                    st.write_stream(stream)
+                    result = stream.result
+                else:
+                    with st.spinner("검색 및 답변 생성 중..."):
+                        result = process_rag_query(settings, final_prompt, doc_id_filter)
                 answer = result["answer"]
                 related_pages = result["related_pages"]
                 resolved_doc_id = result["resolved_doc_id"]
                 top1_similarity = result["top1_similarity"]
                 # # 유사도 정보 표시
                 # st.caption(f"top1 similarity = {top1_similarity:.3f} (threshold={settings.similarity_threshold:.2f})")
-                
-                # 답변 출력
-                # st.markdown(answer)
-            pages = get_related_pages(
-                settings=settings,
-                resolved_doc_id=resolved_doc_id,
-                related_pages=related_pages
-            )
-            # render_related_pages(pages)
+
+                # 인용 페이지가 확정된 뒤 관련 페이지 이미지 조회
+                pages = get_related_pages(
+                    settings=settings,
+                    resolved_doc_id=resolved_doc_id,
+                    related_pages=related_pages
+                )
+                # render_related_pages(pages)
+        st.session_state.last_trace = trace.to_dict()
         st.session_state.chat.append({
             "role": "assistant",
             "content": answer,
@@ -276,7 +429,7 @@ else:
         st.rerun()
     
     if img_file: 
-        print("이미지")   
+        logger.debug("이미지: %s", img_file.name)
         img_bytes = img_file.getvalue()
         mime = img_file.type or "image/png"
         if len(st.session_state.ocr_text) > 0:
@@ -301,36 +454,16 @@ else:
         #         pass
                 
 
-        # ✅ 최대 1024px로 자동 축소 (비율 유지)
-        try:
-            pil_img = Image.open(BytesIO(img_bytes))
-            pil_img.thumbnail((resize_max_px, resize_max_px), Image.LANCZOS)
-
-            buf = BytesIO()
-            # 원본 포맷을 최대한 유지 (없으면 PNG)
-            save_format = (pil_img.format or "PNG").upper()
-            if save_format not in ("PNG", "JPEG", "JPG", "WEBP"):
-                save_format = "PNG"
-
-            # JPEG로 저장할 때는 RGB 필요할 수 있음
-            if save_format in ("JPEG", "JPG") and pil_img.mode in ("RGBA", "P"):
-                pil_img = pil_img.convert("RGB")
-
-            pil_img.save(buf, format=save_format)
-            img_bytes = buf.getvalue()  # ✅ 이후 로직(OCR/미리보기/해시)에 축소본을 사용
-        except Exception:
-            # 축소 실패 시 원본 유지
-            pass
-
-        # ✅ 내용 기반 시그니처(해시): rerun(질문 전송)에도 동일 이미지면 OCR 재실행 안 함
-        digest = hashlib.sha256(img_bytes).hexdigest()
-        image_signature = f"{digest}"
-
-        # ✅ 새 이미지일 때만 OCR 실행
+        # ✅ 업로드 원본 바이트 해시를 먼저 계산: rerun(질문 전송)에 같은 이미지면 디코딩/축소/OCR 모두 건너뜀
+        digest = image_digest(img_bytes)
+        image_signature = f"{digest}:{resize_max_px}"
+
+        # ✅ 새 이미지일 때만 OCR 실행 (다른 사용자가 올린 같은 이미지면 OCR 캐시에서 바로 가져옴)
         if st.session_state.ocr_image_signature != image_signature:
-            with st.spinner("이미지에서 문자 추출 중 (gpt-4.1-mini)..."):
+            with st.spinner(f"이미지에서 문자 추출 중 ({settings.ocr_model})..."):
                 oai = get_openai_client(settings.openai_api_key)
-                ocr_text = extract_text_from_image_gpt41mini(oai, img_bytes, mime)
+                with start_trace(settings, "ocr"):
+                    ocr_text, _ = cached_ocr(settings, oai, img_bytes, mime, resize_max_px)
 
             st.session_state.ocr_image_signature = image_signature
             st.session_state.ocr_text = (ocr_text or "").strip()
@@ -0,0 +1,160 @@
+"""
+질문 JSONL 일괄 실행기 (평가 / 캐시 예열)
+
+입력 (한 줄에 하나):
+    {"question": "E-05 에러 해결 방법", "doc_id_filter": 3}
+    {"id": "q-17", "question": "필터 교체 주기는?"}
+
+실행:
+    python batch_runner.py questions.jsonl -o results.jsonl --concurrency 4 --rate 2
+
+캐시 예열 범위:
+- 관리 화면(app.py)에서 실행하면 서버 프로세스의 메모리 캐시(질문 임베딩 / 메타데이터 / 답변)를 채움
+  답변 캐시는 answer_cache_enabled 일 때만 채워짐 (꺼져 있으면 답변은 어디에도 저장되지 않음)
+- CLI 로 실행하면 서버와 다른 프로세스이므로 메모리 캐시는 남지 않고 디스크 임베딩 캐시만 채워짐
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from answer_cache import get_answer_cache
+from config import Settings, load_settings
+from process_rag_query import process_rag_query
+from rate_limiter import RateLimiter
+from retrieval_service import get_pages_images
+from tracing import span, start_trace
+
+
+def read_questions(lines: Iterable[str]) -> List[Dict[str, Any]]:
+    items = []
+    for n, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        obj = json.loads(line)
+        if not obj.get("question"):
+            raise ValueError(f"line {n}: question 이 없습니다.")
+        items.append(
+            {
+                "id": obj.get("id", n),
+                "question": obj["question"],
+                "doc_id_filter": int(obj["doc_id_filter"]) if obj.get("doc_id_filter") is not None else None,
+            }
+        )
+    return items
+
+
+def run_one(settings: Settings, item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    질문 하나 실행 → 답변 / 관련 페이지 / top1 similarity / 단계별 소요 시간(ms)
+    관련 페이지 이미지도 조회해서 메타데이터 캐시까지 채움
+    """
+    out: Dict[str, Any] = {"id": item["id"], "question": item["question"], "doc_id_filter": item["doc_id_filter"]}
+    with start_trace(settings, "batch_query", question_id=item["id"]) as trace:
+        try:
+            result = process_rag_query(settings, item["question"], item["doc_id_filter"])
+            if result["resolved_doc_id"] and result["related_pages"]:
+                with span("related_pages"):
+                    get_pages_images(settings, result["resolved_doc_id"], result["related_pages"])
+            out.update(result)
+            out["error"] = None
+        except Exception as e:
+            out["error"] = f"{type(e).__name__}: {e}"
+    out["timings_ms"] = {k: round(v, 1) for k, v in trace.stage_ms().items()}
+    out["total_ms"] = round(trace.duration_ms, 1)
+    out["cache"] = trace.cache
+    return out
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def run_batch(
+    settings: Settings,
+    items: List[Dict[str, Any]],
+    *,
+    concurrency: int = 4,
+    rate_per_s: float = 0.0,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    items 를 최대 concurrency 개 동시에, 초당 rate_per_s 건 이하로 실행
+    - 결과는 끝나는 순서대로 on_result 로 전달
+    - 답변 캐시가 꺼져 있으면 답변은 캐시되지 않음 (요약의 answer_cache_warmed 로 표시)
+    return: 요약 {"count", "errors", "wall_s", "qps", "p50_ms", "p95_ms", "stage_p50_ms", "answer_cache_warmed"}
+    """
+    limiter = RateLimiter(rate_per_s, burst=concurrency)
+    lock = threading.Lock()
+    results: List[Dict[str, Any]] = []
+
+    def _task(item):
+        limiter.acquire()
+        r = run_one(settings, item)
+        with lock:
+            results.append(r)
+            if on_result:
+                on_result(r)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+        list(ex.map(_task, items))
+    wall_s = time.perf_counter() - t0
+
+    ok = [r for r in results if not r["error"]]
+    stages = sorted({k for r in ok for k in r["timings_ms"]})
+    return {
+        "count": len(results),
+        "errors": len(results) - len(ok),
+        "wall_s": round(wall_s, 2),
+        "qps": round(len(results) / wall_s, 2) if wall_s > 0 else 0.0,
+        "p50_ms": percentile([r["total_ms"] for r in ok], 0.50),
+        "p95_ms": percentile([r["total_ms"] for r in ok], 0.95),
+        "stage_p50_ms": {
+            s: percentile([r["timings_ms"][s] for r in ok if s in r["timings_ms"]], 0.50) for s in stages
+        },
+        "answer_cache_warmed": get_answer_cache(settings) is not None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="질문 JSONL 일괄 실행 (평가 / 캐시 예열)")
+    parser.add_argument("input", help="질문 JSONL 경로 ('-' 이면 stdin)")
+    parser.add_argument("-o", "--output", default="-", help="결과 JSONL 경로 ('-' 이면 stdout)")
+    parser.add_argument("--concurrency", type=int, default=4, help="동시 실행 질문 수")
+    parser.add_argument("--rate", type=float, default=0.0, help="초당 최대 질문 수 (0 이면 제한 없음)")
+    args = parser.parse_args(argv)
+
+    settings = load_settings()
+    if args.input == "-":
+        items = read_questions(sys.stdin)
+    else:
+        with open(args.input, encoding="utf-8") as f:
+            items = read_questions(f)
+
+    out_f = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        summary = run_batch(
+            settings,
+            items,
+            concurrency=args.concurrency,
+            rate_per_s=args.rate,
+            on_result=lambda r: (out_f.write(json.dumps(r, ensure_ascii=False) + "\n"), out_f.flush()),
+        )
+    finally:
+        if out_f is not sys.stdout:
+            out_f.close()
+
+    print(json.dumps(summary, ensure_ascii=False), file=sys.stderr)
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
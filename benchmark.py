@@ -0,0 +1,269 @@
+"""
+오프라인 벤치마크 (OpenAI / Supabase 대신 fake_clients 사용, 네트워크 불필요)
+- tiktoken 인코딩 파일이 캐시에 없고 받을 수도 없으면 tokens.ApproxEncoding 으로 셈 (토큰 수는 근사치)
+
+측정 항목:
+- ingest: data/ 의 PDF 적재 (pages/s, 요청 수, 업로드 바이트)
+- chunk_text / make_chunks / is_toc_page / merge_pages_cited_then_search: 호출당 시간
+- process_rag_query: 단계별 지연 (answer_cache / embed / retrieve / generate / related_pages)
+
+실행:
+    python benchmark.py --openai-latency-ms 80 --supabase-latency-ms 15 -o .cache/bench/latest.json
+    python benchmark.py --baseline .cache/bench/latest.json   # 이전 결과 대비 변화 출력
+"""
+import argparse
+import dataclasses
+import glob
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import fitz  # PyMuPDF
+
+from batch_runner import percentile
+from chunker import make_chunks
+from clients import set_client_overrides
+from config import Settings
+from fake_clients import FakeLatency, FakeOpenAI, FakeSupabase
+from tracing import span, start_trace
+from utils_text import chunk_text, is_toc_page, merge_pages_cited_then_search
+
+
+def _bench_settings(work_dir: str) -> Settings:
+    """
+    캐시 / 저널은 임시 디렉터리에 두고(매 실행 cold start), 답변 캐시는 꺼서 매 질문이 실제 경로를 타게 함
+    """
+    return Settings(
+        openai_api_key="fake",
+        supabase_url="fake://supabase/",
+        supabase_service_key="fake",
+        embedding_cache_path=os.path.join(work_dir, "embeddings.sqlite3"),
+        ingest_journal_path=os.path.join(work_dir, "ingest_journal.sqlite3"),
+        ingest_queue_dir=os.path.join(work_dir, "ingest_queue"),
+        local_index_dir=os.path.join(work_dir, "vector_index"),
+        answer_cache_enabled=False,
+        trace_log_enabled=False,
+        metrics_path=os.path.join(work_dir, "metrics.prom"),
+    )
+
+
+def _micro(fn: Callable[[], Any], min_time_s: float = 0.5) -> Dict[str, float]:
+    """
+    fn 을 최소 min_time_s 동안 반복 실행한 호출당 시간
+    """
+    fn()  # warm-up (정규식 컴파일, 인코딩 로드 등)
+    calls = 0
+    t0 = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time_s:
+            break
+    return {"calls": calls, "per_call_us": round(elapsed / calls * 1e6, 2)}
+
+
+def _diff_requests(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, int]:
+    b = before["requests"]
+    return {k: v - b.get(k, 0) for k, v in after["requests"].items() if v - b.get(k, 0)}
+
+
+def bench_text(page_texts: List[str], settings: Settings) -> Dict[str, Any]:
+    full_text = "\n\n".join(page_texts)
+    rng = random.Random(0)
+    contexts = [
+        {"page_number": rng.randint(1, 60), "similarity": rng.uniform(0.2, 0.8), "content": ""} for _ in range(10)
+    ]
+    top1 = max(c["similarity"] for c in contexts)
+    return {
+        "chunk_text": {
+            "chars": len(full_text),
+            **_micro(lambda: [chunk_text(t, 900, 150) for t in page_texts]),
+        },
+        "make_chunks_token": {
+            "chars": len(full_text),
+            **_micro(lambda: [make_chunks(settings, t) for t in page_texts]),
+        },
+        "is_toc_page": {
+            "pages": len(page_texts),
+            **_micro(lambda: [is_toc_page(t) for t in page_texts]),
+        },
+        "merge_pages_cited_then_search": _micro(
+            lambda: merge_pages_cited_then_search([3, 7], contexts, 6, top1_similarity=top1)
+        ),
+    }
+
+
+def bench_ingest(settings: Settings, pdf_path: str, oai: FakeOpenAI, sb: FakeSupabase) -> Dict[str, Any]:
+    from ingest_service import ingest_pdf_to_supabase
+
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+    oai_before, sb_before = oai.stats(), sb.stats()
+
+    t0 = time.perf_counter()
+    doc_id, chunks = ingest_pdf_to_supabase(settings, pdf_bytes, os.path.splitext(os.path.basename(pdf_path))[0])
+    wall_s = time.perf_counter() - t0
+
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        page_count = doc.page_count
+    sb_after = sb.stats()
+    return {
+        "doc_id": doc_id,
+        "pdf_bytes": len(pdf_bytes),
+        "pages": page_count,
+        "chunks": chunks,
+        "wall_s": round(wall_s, 3),
+        "pages_per_s": round(page_count / wall_s, 2) if wall_s > 0 else 0.0,
+        "openai_requests": _diff_requests(oai_before, oai.stats()),
+        "supabase_requests": _diff_requests(sb_before, sb_after),
+        "bytes_sent": sb_after["bytes_sent"] - sb_before["bytes_sent"],
+        "storage_bytes": sb_after["storage_bytes"],
+        "throttled_ms": round(sb_after["throttled_ms"] - sb_before["throttled_ms"] + oai.stats()["throttled_ms"], 1),
+    }
+
+
+def _questions(page_texts: List[str], n: int) -> List[str]:
+    """
+    페이지 본문에서 뽑은 질문 (결정적: 고정 seed)
+    """
+    rng = random.Random(42)
+    lines = [ln.strip() for t in page_texts if not is_toc_page(t) for ln in t.splitlines() if len(ln.strip()) >= 12]
+    picked = rng.sample(lines, min(n, len(lines))) if lines else []
+    return [f"{ln[:60]} 방법은?" for ln in picked]
+
+
+def bench_query(
+    settings: Settings, page_texts: List[str], n_questions: int, oai: FakeOpenAI, sb: FakeSupabase
+) -> Dict[str, Any]:
+    from process_rag_query import process_rag_query
+    from retrieval_service import get_pages_images
+
+    questions = _questions(page_texts, n_questions)
+    oai_before, sb_before = oai.stats(), sb.stats()
+    per_stage: Dict[str, List[float]] = {}
+    totals: List[float] = []
+    answered = 0
+    for q in questions:
+        with start_trace(settings, "bench_query") as trace:
+            result = process_rag_query(settings, q, None)
+            if result["resolved_doc_id"] and result["related_pages"]:
+                with span("related_pages"):
+                    get_pages_images(settings, result["resolved_doc_id"], result["related_pages"])
+                answered += 1
+        totals.append(trace.duration_ms)
+        for stage, ms in trace.stage_ms().items():
+            per_stage.setdefault(stage, []).append(ms)
+
+    return {
+        "questions": len(questions),
+        "answered": answered,
+        "total_ms": {"p50": round(percentile(totals, 0.5), 2), "p95": round(percentile(totals, 0.95), 2)},
+        "stages_ms": {
+            s: {"p50": round(percentile(v, 0.5), 2), "p95": round(percentile(v, 0.95), 2)}
+            for s, v in sorted(per_stage.items())
+        },
+        "openai_requests": _diff_requests(oai_before, oai.stats()),
+        "supabase_requests": _diff_requests(sb_before, sb.stats()),
+    }
+
+
+def _flatten(obj: Any, prefix: str = "") -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            out.update(_flatten(v, f"{prefix}{k}."))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        out[prefix[:-1]] = float(obj)
+    return out
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], min_change: float = 0.05) -> List[str]:
+    """
+    이전 결과 대비 min_change(비율) 이상 바뀐 지표 목록
+    """
+    old, new = _flatten(baseline.get("results", {})), _flatten(current.get("results", {}))
+    lines = []
+    for key in sorted(old.keys() & new.keys()):
+        a, b = old[key], new[key]
+        if a and abs(b - a) / abs(a) >= min_change:
+            lines.append(f"{key}: {a:g} -> {b:g} ({(b - a) / abs(a):+.1%})")
+    return lines
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="오프라인 벤치마크 (fake OpenAI / Supabase)")
+    parser.add_argument("--pdf", default=None, help="적재할 PDF (기본: data/ 의 첫 번째 PDF)")
+    parser.add_argument("--questions", type=int, default=30, help="process_rag_query 질문 수")
+    parser.add_argument("--openai-latency-ms", type=float, default=80.0)
+    parser.add_argument("--openai-rps", type=float, default=0.0, help="OpenAI 초당 요청 한도 (0 = 없음)")
+    parser.add_argument("--supabase-latency-ms", type=float, default=15.0)
+    parser.add_argument("--supabase-per-kb-ms", type=float, default=0.05)
+    parser.add_argument("--supabase-rps", type=float, default=0.0, help="Supabase 초당 요청 한도 (0 = 없음)")
+    parser.add_argument("-o", "--output", default=None, help="결과 JSON 경로 (기본: .cache/bench/bench_<시각>.json)")
+    parser.add_argument("--baseline", default=None, help="비교할 이전 결과 JSON")
+    args = parser.parse_args(argv)
+
+    pdf_path = args.pdf or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "*.pdf")))[0]
+    with fitz.open(pdf_path) as doc:
+        page_texts = [page.get_text("text") or "" for page in doc]
+
+    work_dir = tempfile.mkdtemp(prefix="rag-bench-")
+    settings = _bench_settings(work_dir)
+    openai_latency = FakeLatency(base_ms=args.openai_latency_ms, rate_per_s=args.openai_rps)
+    supabase_latency = FakeLatency(
+        base_ms=args.supabase_latency_ms, per_kb_ms=args.supabase_per_kb_ms, rate_per_s=args.supabase_rps
+    )
+    oai = FakeOpenAI(openai_latency, embedding_dims=settings.embedding_dims)
+    sb = FakeSupabase(supabase_latency)
+    set_client_overrides(openai=oai, supabase=sb)
+
+    try:
+        results = {
+            "text": bench_text(page_texts, settings),
+            "ingest": bench_ingest(settings, pdf_path, oai, sb),
+            "query": bench_query(settings, page_texts, args.questions, oai, sb),
+        }
+    finally:
+        set_client_overrides()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "pdf": os.path.basename(pdf_path),
+            "openai_latency": dataclasses.asdict(openai_latency),
+            "supabase_latency": dataclasses.asdict(supabase_latency),
+        },
+        "results": results,
+    }
+
+    out_path = args.output or os.path.join(".cache", "bench", f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"결과 저장: {out_path}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            changes = compare(json.load(f), report)
+        print("\n".join(changes) if changes else "baseline 대비 5% 이상 바뀐 지표 없음", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
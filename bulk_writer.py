@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from tracing import span
+
+
+class BulkWriter:
+    """
+    row 들을 모아 두었다가 row 수 / payload 바이트 한도에 도달하면 한 번에 upsert
+    - on_conflict 키 기준 upsert 이므로 실패한 배치를 재시도해도 row 가 중복되지 않음
+    - 여러 스레드에서 add 해도 안전
+    """
+
+    def __init__(
+        self,
+        sb,
+        table: str,
+        on_conflict: str,
+        *,
+        max_rows: int = 500,
+        max_bytes: int = 2_000_000,
+        max_retries: int = 3,
+        backoff_s: float = 0.5,
+    ):
+        self.sb = sb
+        self.table = table
+        self.on_conflict = on_conflict
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+
+        self.rows_added = 0
+        self.rows_written = 0
+        self.requests = 0
+        self._rows: List[Dict[str, Any]] = []
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, row: Dict[str, Any]) -> None:
+        self.add_many([row])
+
+    def add_many(self, rows: List[Dict[str, Any]]) -> None:
+        ready: List[List[Dict[str, Any]]] = []
+        with self._lock:
+            self.rows_added += len(rows)
+            for row in rows:
+                size = len(json.dumps(row, ensure_ascii=False, default=str).encode("utf-8"))
+                if self._rows and self._bytes + size > self.max_bytes:
+                    ready.append(self._take())
+                self._rows.append(row)
+                self._bytes += size
+                if len(self._rows) >= self.max_rows:
+                    ready.append(self._take())
+        for batch in ready:
+            self._write(batch)
+
+    def flush(self) -> None:
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._write(batch)
+
+    def _take(self) -> List[Dict[str, Any]]:
+        batch = self._rows
+        self._rows = []
+        self._bytes = 0
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        """
+        - 일시적 오류(네트워크, 5xx, 429): 지수 백오프로 max_retries 회까지 재시도
+        - payload 초과 / statement timeout: 배치를 반으로 나눠서 기록
+        - 그 밖의 4xx / 스키마 / 제약 조건 오류: 바로 예외 (재시도해도 같은 결과)
+        - 배치 하나(분할 포함)의 전체 요청 수 제한: 2 * max_retries + 4 * log2(row 수)
+          (계속 timeout 이 나도 row 단위까지 쪼개며 수백 번 요청하지 않도록)
+        """
+        self._write_part(batch, [2 * self.max_retries + 4 * len(batch).bit_length()])
+
+    def _write_part(self, batch: List[Dict[str, Any]], budget: List[int]) -> None:
+        attempt = 0
+        while True:
+            budget[0] -= 1
+            try:
+                with span(f"supabase.upsert.{self.table}", rows=len(batch)):
+                    self.sb.table(self.table).upsert(batch, on_conflict=self.on_conflict).execute()
+                with self._lock:
+                    self.requests += 1
+                    self.rows_written += len(batch)
+                return
+            except Exception as e:
+                kind = classify_write_error(e)
+                if kind == "fatal" or budget[0] <= 0:
+                    raise
+                if kind == "split" and len(batch) > 1:
+                    mid = len(batch) // 2
+                    self._write_part(batch[:mid], budget)
+                    self._write_part(batch[mid:], budget)
+                    return
+                attempt += 1
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self.backoff_s * (2 ** (attempt - 1)))
+
+
+# SQLSTATE: 57014 = statement timeout (배치를 줄이면 성공할 수 있음)
+_SPLIT_SQLSTATES = {"57014"}
+# SQLSTATE class: 22 데이터 오류, 23 제약 조건, 28 인증, 42 문법/권한/없는 컬럼
+_FATAL_SQLSTATE_CLASSES = {"22", "23", "28", "42"}
+
+
+def _status_code(e: Exception) -> Optional[int]:
+    for obj in (e, getattr(e, "response", None)):
+        code = getattr(obj, "status_code", None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def classify_write_error(e: Exception) -> str:
+    """
+    PostgREST / HTTP 오류 분류: "split" (배치를 줄여서 재시도) / "fatal" (재시도 무의미) / "retry" (일시적)
+    """
+    code = str(getattr(e, "code", "") or "")
+    status = _status_code(e)
+    text = f"{type(e).__name__} {e}".lower()
+
+    if code in _SPLIT_SQLSTATES or status in (408, 413) or "too large" in text or "timeout" in text or "timed out" in text:
+        return "split"
+    if code.startswith("PGRST") or code[:2] in _FATAL_SQLSTATE_CLASSES:
+        return "fatal"
+    if status is not None and 400 <= status < 500 and status != 429:
+        return "fatal"
+    return "retry"
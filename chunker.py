@@ -0,0 +1,132 @@
+import re
+from typing import List, Optional, Tuple
+
+from config import Settings
+from tokens import count_tokens
+from utils_text import chunk_text
+
+# 목록 항목 시작: "1.", "1)", "(1)", "①", "-", "•", "▶" 등
+_LIST_ITEM_RE = re.compile(r"^\s*(?:\d{1,3}[.)]\s|\(\d{1,3}\)\s?|[①-⑳]|[-•·▶▷■□◆◇※*]\s?)")
+
+# 문장 경계: 종결 부호 뒤 공백 ("1." 같은 번호는 제외), 또는 한국어 종결 어미 뒤 공백
+_SENTENCE_END_RE = re.compile(
+    r"(?<=[^\d\s][.!?。！？])\s+"
+    r"|(?<=니다|세요|시오|하라|한다|된다|있음|없음|바람)\s+"
+)
+
+
+def _split_blocks(text: str) -> List[str]:
+    """
+    문단(빈 줄) → 목록 항목 단위 블록으로 분리
+    - 목록 항목이 아닌 줄은 앞 블록에 이어 붙임 (PDF 줄바꿈으로 끊긴 문장 복원)
+    - 줄바꿈은 유지해서 표 행 구분이 사라지지 않게 함
+    """
+    blocks: List[str] = []
+    for para in re.split(r"\n\s*\n", text):
+        cur: List[str] = []
+        for line in para.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if cur and _LIST_ITEM_RE.match(line):
+                blocks.append("\n".join(cur))
+                cur = []
+            cur.append(line)
+        if cur:
+            blocks.append("\n".join(cur))
+    return blocks
+
+
+def _split_oversized(unit: str, chunk_size: int, model: str, n_tokens: Optional[int] = None) -> List[Tuple[str, int]]:
+    """
+    chunk_size 를 넘는 단위를 줄 → 어절 → 글자 순으로 잘게 나눔
+    return: [(조각, 토큰 수)] — 토큰 수를 함께 돌려줘서 호출 측에서 다시 세지 않게 함
+    """
+    if n_tokens is None:
+        n_tokens = count_tokens(unit, model)
+    if n_tokens <= chunk_size:
+        return [(unit, n_tokens)]
+
+    for sep in ("\n", " "):
+        parts = [p for p in unit.split(sep) if p.strip()]
+        if len(parts) > 1:
+            # 조각별 토큰 수를 한 번만 세고 누적 (이어 붙인 문자열을 매번 다시 세면 O(n^2))
+            sep_tokens = count_tokens(sep, model)
+            out: List[Tuple[str, int]] = []
+            cur: List[str] = []
+            cur_tokens = 0
+            for p in parts:
+                n = count_tokens(p, model)
+                if cur and cur_tokens + sep_tokens + n > chunk_size:
+                    out.extend(_split_oversized(sep.join(cur), chunk_size, model, cur_tokens))
+                    cur, cur_tokens = [], 0
+                cur_tokens += (sep_tokens if cur else 0) + n
+                cur.append(p)
+            if cur:
+                out.extend(_split_oversized(sep.join(cur), chunk_size, model, cur_tokens))
+            return out
+
+    # 공백 없는 긴 문자열: 글자 단위로 자름 (한국어는 대략 1글자 ≈ 1토큰)
+    pieces = [unit[i:i + chunk_size] for i in range(0, len(unit), chunk_size)]
+    return [(piece, count_tokens(piece, model)) for piece in pieces]
+
+
+def _split_units_sized(text: str, chunk_size: int, model: str) -> List[Tuple[str, int]]:
+    """
+    문단/목록 항목/문장 경계를 따라 텍스트를 최소 단위로 분리
+    return: [(단위, 토큰 수)]
+    """
+    units: List[Tuple[str, int]] = []
+    for block in _split_blocks(text):
+        for sent in _SENTENCE_END_RE.split(block):
+            sent = sent.strip()
+            if sent:
+                units.extend(_split_oversized(sent, chunk_size, model))
+    return units
+
+
+def chunk_text_tokens(text: str, chunk_size: int, overlap: int, model: str) -> List[str]:
+    """
+    토큰 수 기준 chunking
+    - 문장/목록 단위를 chunk_size 토큰까지 채워서 chunk 구성
+    - overlap 은 직전 chunk 의 마지막 문장들(합계 overlap 토큰 이하)을 다음 chunk 앞에 반복
+    """
+    text = (text or "").strip()
+    if not text:
+        return []
+
+    sized = _split_units_sized(text, chunk_size, model)
+    units = [u for u, _ in sized]
+    sizes = [n for _, n in sized]
+
+    chunks: List[str] = []
+    cur: List[int] = []
+    cur_tokens = 0
+    for i, n in enumerate(sizes):
+        if cur and cur_tokens + n > chunk_size:
+            chunks.append("\n".join(units[j] for j in cur))
+            # 다음 chunk 앞에 붙일 overlap 문장 선택 (뒤에서부터)
+            carry: List[int] = []
+            carry_tokens = 0
+            for j in reversed(cur):
+                if carry_tokens + sizes[j] > overlap or carry_tokens + sizes[j] + n > chunk_size:
+                    break
+                carry.insert(0, j)
+                carry_tokens += sizes[j]
+            cur, cur_tokens = carry, carry_tokens
+        cur.append(i)
+        cur_tokens += n
+
+    if cur:
+        chunks.append("\n".join(units[j] for j in cur))
+    return chunks
+
+
+def make_chunks(settings: Settings, text: str) -> List[str]:
+    """
+    Settings.chunk_unit 에 따라 chunking ("token": 구조 기반 토큰 chunker, "char": 기존 글자 슬라이스)
+    """
+    if settings.chunk_unit == "char":
+        return chunk_text(text, settings.chunk_size, settings.chunk_overlap)
+    return chunk_text_tokens(text, settings.chunk_size, settings.chunk_overlap, settings.embedding_model)
+
@@ -1,13 +1,35 @@
+from typing import Any, Dict
+
 import streamlit as st
 from openai import OpenAI
 from supabase import create_client, Client
 
+# 벤치마크 / 오프라인 실행용 클라이언트 교체 (set_client_overrides 로 지정, None 이면 실제 클라이언트)
+_overrides: Dict[str, Any] = {"openai": None, "supabase": None}
+
+
+def set_client_overrides(openai: Any = None, supabase: Any = None) -> None:
+    _overrides["openai"] = openai
+    _overrides["supabase"] = supabase
+
 
 @st.cache_resource
-def get_openai_client(api_key: str) -> OpenAI:
+def _create_openai_client(api_key: str) -> OpenAI:
     return OpenAI(api_key=api_key)
 
 
 @st.cache_resource
-def get_supabase_client(url: str, key: str) -> Client:
+def _create_supabase_client(url: str, key: str) -> Client:
     return create_client(url, key)
+
+
+def get_openai_client(api_key: str) -> OpenAI:
+    if _overrides["openai"] is not None:
+        return _overrides["openai"]
+    return _create_openai_client(api_key)
+
+
+def get_supabase_client(url: str, key: str) -> Client:
+    if _overrides["supabase"] is not None:
+        return _overrides["supabase"]
+    return _create_supabase_client(url, key)
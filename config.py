@@ -12,6 +12,26 @@ class Settings:
 
     # Retrieval
     top_k: int = 10
+    retrieval_backend: str = "supabase"  # "supabase" (match_rag_chunks_v3 RPC) / "local" (프로세스 내 벡터 인덱스)
+    local_index_dir: str = ".cache/vector_index"
+    local_index_sync_interval_s: float = 30.0
+    local_index_quantization: str = "none"  # "none" / "int8" (4x) / "binary" (32x), 후보 검색용
+    local_index_rerank_shortlist: int = 100  # quantized 후보 중 원본 벡터로 재정렬할 개수
+
+    # Lexical (BM25, 글자 n-gram) 검색: 에러 코드/모델명 질문용, 벡터 결과와 RRF 결합
+    lexical_enabled: bool = True
+    lexical_ngram: int = 2
+    lexical_sync_interval_s: float = 30.0
+    rrf_k: int = 60
+
+    # 문서 라우팅: "전체 문서" 검색 시 문서 centroid 로 상위 doc_route_top_n 개 문서를 고른 뒤 그 안에서만 chunk 검색
+    # - centroid top1 cosine 이 doc_route_min_similarity 미만이거나,
+    #   라우팅된 검색의 top1 chunk similarity 가 doc_route_fallback_similarity 미만이면 전체 검색
+    doc_route_enabled: bool = True
+    doc_route_top_n: int = 3
+    doc_route_min_similarity: float = 0.20
+    doc_route_fallback_similarity: float = 0.30
+    doc_route_ttl_s: float = 300.0
 
     # UI slider default = 0.00
     similarity_threshold: float = 0.00
@@ -20,14 +40,110 @@ class Settings:
     max_related_pages: int = 6
 
     # Chunking
-    chunk_size: int = 900
-    chunk_overlap: int = 150
+    # - chunk_unit="token": 문단/목록/문장 경계 기반, chunk_size/chunk_overlap 은 토큰 수
+    # - chunk_unit="char" : 기존 글자 슬라이스 방식 (chunk_size=900, chunk_overlap=150 권장)
+    # - 기본값은 동봉 매뉴얼 기준 보정값: 한국어 900자 ≈ 750토큰이라 1000토큰이면 기존 char 900 과
+    #   chunk 수가 비슷하거나 적음 (48쪽: char 900 → 50개, token 1000 → 49개, token 600 → 55개)
+    chunk_unit: str = "token"
+    chunk_size: int = 1000
+    chunk_overlap: int = 100
+
+    # Prompt context 토큰 예산 (같은 페이지 연속 chunk 병합 후 similarity 순으로 채움, 0 이면 패킹 안 함)
+    # - 검색된 페이지는 예산이 모자라도 [page=N] 머리 + 본문 앞부분은 남김 (인용 가능한 페이지가 빠지지 않게)
+    context_max_tokens: int = 3000
+
+    # 답변 생성 중 관련 페이지 메타데이터 선조회 스레드 수 (0 이면 선조회 안 함)
+    query_prefetch_workers: int = 4
+
+    # 답변 스트리밍 (Responses API stream 이벤트, 첫 토큰부터 화면 표시)
+    answer_streaming: bool = True
 
     # Models
     chat_model: str = "gpt-4.1-mini"
     embedding_model: str = "text-embedding-3-small"
     embedding_dims: int = 1536
 
+    # Embedding batch (multi-input embeddings.create 요청 한도)
+    embed_batch_max_inputs: int = 256
+    embed_batch_max_tokens: int = 100_000
+
+    # Embedding cache (로컬 SQLite, 모델/dims/텍스트 해시 기준)
+    embedding_cache_enabled: bool = True
+    embedding_cache_path: str = ".cache/embeddings.sqlite3"
+    embedding_cache_max_entries: int = 500_000
+
+    # Query embedding cache (in-memory, 정규화된 질문 기준)
+    query_cache_max_entries: int = 4096
+    query_cache_ttl_s: float = 24 * 3600
+
+    # Answer cache (process_rag_query 결과, 정확 일치 + 유사 질문)
+    answer_cache_enabled: bool = True
+    answer_cache_similarity: float = 0.97
+    answer_cache_max_entries: int = 1024
+    answer_cache_ttl_s: float = 6 * 3600
+
+    # Metadata cache (문서 카탈로그 + 문서별 페이지 테이블, 적재/삭제 시 무효화)
+    metadata_cache_max_docs: int = 256
+    metadata_cache_ttl_s: float = 600.0
+
+    # OCR (업로드 원본 해시 기준 결과 캐시, 사용자/세션 간 공유)
+    ocr_model: str = "gpt-4.1-mini"
+    ocr_cache_enabled: bool = True
+    ocr_cache_path: str = ".cache/ocr.sqlite3"
+    ocr_cache_max_entries: int = 20_000
+
+    # Voice transcription (무음 제거 + mono/16kHz + 압축 후 업로드, 녹음 원본 해시 기준 결과 캐시)
+    transcription_model: str = "whisper-1"
+    transcription_language: str = "ko"
+    transcription_format: str = "ogg"  # ogg / mp3 / webm / wav (ffmpeg 없으면 wav 로 대체)
+    transcription_codec: str = "libopus"
+    transcription_bitrate: str = "24k"
+    transcription_sample_rate: int = 16000
+    transcription_silence_margin_db: float = 16.0
+    transcription_keep_silence_ms: int = 200
+    transcription_cache_enabled: bool = True
+    transcription_cache_path: str = ".cache/transcripts.sqlite3"
+    transcription_cache_max_entries: int = 5_000
+
+    # Tracing / metrics (요청별 JSON 로그 + Prometheus text 파일)
+    trace_log_enabled: bool = True
+    metrics_path: str = ".cache/metrics.prom"
+    metrics_flush_interval_s: float = 15.0
+
+    # Page images (원본 + 썸네일, format: webp / jpeg / png)
+    page_image_dpi: int = 160
+    page_image_format: str = "webp"
+    page_image_quality: int = 85
+    page_thumb_max_px: int = 360
+    page_thumb_format: str = "webp"
+    page_thumb_quality: int = 70
+
+    # Ingest pipeline (단계별 동시성)
+    ingest_render_workers: int = 4       # 렌더링 프로세스 수 (<=1 이면 현재 프로세스에서 렌더링)
+    ingest_io_workers: int = 8           # 이미지 업로드 / manual_pages 기록 스레드 수
+    ingest_embed_workers: int = 2        # 임베딩 + rag_chunks insert 스레드 수
+    ingest_max_inflight_pages: int = 16  # 앞서 렌더링해 둘 수 있는 최대 페이지 수
+
+    # Bulk DB writes (manual_pages / rag_chunks upsert 배치 한도)
+    db_batch_max_rows: int = 500
+    db_batch_max_bytes: int = 2_000_000
+    db_write_retries: int = 3
+
+    # Resumable ingest (체크포인트 저널)
+    ingest_journal_path: str = ".cache/ingest_journal.sqlite3"
+    ingest_checkpoint_pages: int = 25
+
+    # Background ingest queue (문서 단위 동시 적재 수)
+    ingest_queue_dir: str = ".cache/ingest_queue"
+    ingest_queue_workers: int = 2
+
+    # Document deletion (즉시 tombstone → 백그라운드에서 분할·병렬 purge)
+    delete_queue_path: str = ".cache/delete_queue.sqlite3"
+    delete_workers: int = 4            # purge 시 동시 요청 수
+    delete_pages_per_batch: int = 50   # rag_chunks / manual_pages delete 1회당 page_number 범위
+    delete_storage_batch: int = 100    # Storage remove 1회당 객체 수
+    delete_max_retries: int = 4
+
 
 def _ensure_trailing_slash(url: str) -> str:
     url = (url or "").strip()
@@ -44,4 +160,5 @@ def load_settings() -> Settings:
         openai_api_key=os.getenv("OPENAI_API_KEY", ""),
         supabase_url=_ensure_trailing_slash(os.getenv("SUPABASE_URL", "")),
         supabase_service_key=os.getenv("SUPABASE_SERVICE_ROLE_KEY", ""),
+        retrieval_backend=os.getenv("RETRIEVAL_BACKEND", "supabase"),
     )
@@ -0,0 +1,98 @@
+from typing import Any, Dict, List, Optional
+
+from tokens import count_tokens, get_encoding
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+
+def _overlap_len(prev: str, nxt: str, min_overlap: int = 8) -> int:
+    """
+    prev 의 끝과 nxt 의 앞이 겹치는 최대 길이 (min_overlap 미만이면 0)
+    """
+    max_len = min(len(prev), len(nxt))
+    if max_len < min_overlap:
+        return 0
+    tail = prev[-max_len:]
+    probe = nxt[:min_overlap]
+    i = tail.find(probe)
+    while i != -1:
+        # 가장 앞에서 시작하는 일치가 가장 긴 overlap
+        if nxt.startswith(tail[i:]):
+            return len(tail) - i
+        i = tail.find(probe, i + 1)
+    return 0
+
+
+def merge_page_chunks(contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    같은 (doc_id, page_number) 안에서 chunk_index 가 연속(또는 중복)인 chunk 를 하나로 합침
+    - 연속 chunk 사이의 chunk_overlap 반복 구간은 한 번만 남김
+    - 합친 블록의 similarity 는 구성 chunk 중 최댓값
+    """
+    groups: Dict[Any, List[Dict[str, Any]]] = {}
+    for c in contexts:
+        groups.setdefault((c.get("doc_id"), c["page_number"]), []).append(c)
+
+    blocks: List[Dict[str, Any]] = []
+    for (doc_id, page_number), items in groups.items():
+        items = sorted(items, key=lambda c: int(c.get("chunk_index") or 0))
+        cur: Optional[Dict[str, Any]] = None
+        for c in items:
+            ci = int(c.get("chunk_index") or 0)
+            if cur is not None and ci <= cur["last_chunk_index"] + 1:
+                if ci > cur["last_chunk_index"]:
+                    k = _overlap_len(cur["content"], c["content"])
+                    cur["content"] = cur["content"] + (c["content"][k:] if k else "\n" + c["content"])
+                    cur["last_chunk_index"] = ci
+                cur["similarity"] = max(cur["similarity"], float(c["similarity"]))
+                continue
+            cur = {
+                "doc_id": doc_id,
+                "page_number": page_number,
+                "chunk_index": ci,
+                "last_chunk_index": ci,
+                "content": c["content"],
+                "similarity": float(c["similarity"]),
+            }
+            blocks.append(cur)
+    return blocks
+
+
+def format_context(c: Dict[str, Any]) -> str:
+    return f"[page={c['page_number']}, similarity={c['similarity']:.3f}]\n{c['content']}"
+
+
+def pack_contexts(
+    contexts: List[Dict[str, Any]],
+    max_tokens: int,
+    model: str,
+    min_block_tokens: int = 64,
+) -> List[Dict[str, Any]]:
+    """
+    prompt 용 context 패킹
+    - merge_page_chunks 로 중복 제거 후 similarity 높은 블록부터 max_tokens(tiktoken 기준)까지 채움
+    - 모든 블록(페이지)은 [page=N] 머리 + 본문 앞 min_block_tokens 를 최소로 남김 → 검색된 페이지는 빠지지 않고 인용 가능
+      (블록 수 × 최소 분량이 max_tokens 보다 크면 그만큼은 예산을 넘김)
+    - 최소 분량을 뺀 나머지 예산은 similarity 높은 블록부터 본문 전체(안 되면 잘라서)로 채움
+    """
+    blocks = sorted(merge_page_chunks(contexts), key=lambda b: b["similarity"], reverse=True)
+    if not blocks:
+        return []
+    sep_tokens = count_tokens(CONTEXT_SEPARATOR, model)
+    enc = get_encoding(model)
+
+    bodies = [enc.encode(b["content"], disallowed_special=()) for b in blocks]
+    headers = [count_tokens(format_context({**b, "content": ""}), model) for b in blocks]
+    floors = [min(len(body), min_block_tokens) for body in bodies]
+    spare = max_tokens - sep_tokens * (len(blocks) - 1) - sum(headers) - sum(floors)
+
+    packed: List[Dict[str, Any]] = []
+    for b, body, floor in zip(blocks, bodies, floors):
+        extra = min(len(body) - floor, max(spare, 0))
+        spare -= extra
+        keep = floor + extra
+        if keep >= len(body):
+            packed.append(b)
+        else:
+            packed.append({**b, "content": enc.decode(body[:keep]).rstrip("�").rstrip()})
+    return packed
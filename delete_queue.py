@@ -0,0 +1,157 @@
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+
+import streamlit as st
+
+from config import Settings
+from storage_service import purge_doc, soft_delete_doc
+
+
+class DeleteQueue:
+    """
+    2단계 문서 삭제 큐
+    - delete(doc_id): tombstone(manual_docs.deleted_at) 기록 후 바로 반환 → 검색/목록에서 즉시 제외
+    - 워커 스레드가 purge_doc 으로 row / Storage 객체를 병렬·분할 삭제 (진행률 기록)
+    - SQLite 영속 큐: 재시작 시 running 이던 작업은 다시 queued, 실패한 작업은 retry 로 재실행
+    - 큐/워커는 프로세스 수명 동안 유지되므로 작업마다 최신 Settings(update_settings)로 삭제
+    """
+
+    _COLUMNS = (
+        "id", "doc_id", "status", "steps_done", "steps_total", "storage_deleted", "storage_failed",
+        "error", "created_at", "started_at", "finished_at",
+    )
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        d = os.path.dirname(settings.delete_queue_path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._conn = sqlite3.connect(settings.delete_queue_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS delete_queue ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " doc_id INTEGER NOT NULL,"
+            " status TEXT NOT NULL,"
+            " steps_done INTEGER DEFAULT 0,"
+            " steps_total INTEGER DEFAULT 0,"
+            " storage_deleted INTEGER DEFAULT 0,"
+            " storage_failed INTEGER DEFAULT 0,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL)"
+        )
+        with self._lock:
+            self._conn.execute("UPDATE delete_queue SET status = 'queued' WHERE status = 'running'")
+
+        self._thread = threading.Thread(target=self._worker_loop, name="delete-worker", daemon=True)
+        self._thread.start()
+
+    def update_settings(self, settings: Settings) -> None:
+        with self._lock:
+            self.settings = settings
+
+    def delete(self, doc_id: int) -> int:
+        """
+        tombstone 기록 + purge 작업 등록. tombstone 실패 시 예외 (작업은 등록하지 않음)
+        """
+        with self._lock:
+            settings = self.settings
+        soft_delete_doc(settings, doc_id)
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO delete_queue (doc_id, status, created_at) VALUES (?, 'queued', ?)",
+                (int(doc_id), time.time()),
+            )
+            job_id = int(cur.lastrowid)
+        self._wakeup.set()
+        return job_id
+
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM delete_queue ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(zip(self._COLUMNS, r)) for r in rows]
+
+    def _claim_next(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT id, doc_id FROM delete_queue WHERE status = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE delete_queue SET status = 'running', started_at = ?, error = NULL WHERE id = ?",
+                    (time.time(), row[0]),
+                )
+            self._conn.execute("COMMIT")
+        if not row:
+            return None
+        return {"id": row[0], "doc_id": row[1]}
+
+    def _update(self, job_id: int, **fields: Any) -> None:
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE delete_queue SET {cols} WHERE id = ?", list(fields.values()) + [job_id])
+
+    def _worker_loop(self) -> None:
+        while True:
+            job = self._claim_next()
+            if job is None:
+                self._wakeup.wait(timeout=2.0)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        with self._lock:
+            settings = self.settings
+        last_report = [0.0]
+
+        def _on_progress(done: int, total: int) -> None:
+            now = time.time()
+            if done < total and now - last_report[0] < 1.0:
+                return
+            last_report[0] = now
+            self._update(job_id, steps_done=done, steps_total=total)
+
+        try:
+            result = purge_doc(settings, job["doc_id"], on_progress=_on_progress)
+            self._update(
+                job_id,
+                status="done",
+                storage_deleted=result["storage_deleted"],
+                storage_failed=len(result["storage_failed"]),
+                finished_at=time.time(),
+            )
+        except Exception as e:
+            traceback.print_exc()
+            self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+
+    def retry(self, job_id: int) -> None:
+        self._update(job_id, status="queued", finished_at=None)
+        self._wakeup.set()
+
+
+@st.cache_resource
+def _open_delete_queue(path: str, _settings: Settings) -> DeleteQueue:
+    return DeleteQueue(_settings)
+
+
+def get_delete_queue(settings: Settings) -> DeleteQueue:
+    """
+    서버 프로세스당 하나의 삭제 큐/워커 (세션 간 공유), 이후 작업은 호출 측의 최신 settings 로 실행
+    """
+    queue = _open_delete_queue(settings.delete_queue_path, settings)
+    queue.update_settings(settings)
+    return queue
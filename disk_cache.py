@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class SqliteCache:
+    """
+    로컬 SQLite 기반 key -> bytes 캐시 (프로세스/세션 간 공유, 재시작 후에도 유지)
+    - max_entries 를 넘으면 가장 오래 사용되지 않은 항목부터 삭제 (LRU)
+    - hits / misses 카운터 제공
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._puts_since_trim = 0
+
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_last_used ON cache(last_used)")
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        found: Dict[str, bytes] = {}
+        uniq = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._lock:
+            # SQLite 변수 개수 제한(999)을 넘지 않도록 나눠서 조회
+            for i in range(0, len(uniq), 500):
+                part = uniq[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(f"SELECT key, value FROM cache WHERE key IN ({marks})", part).fetchall()
+                for k, v in rows:
+                    found[k] = v
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE cache SET last_used = ? WHERE key IN ({marks})", [now] + part
+                    )
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def put(self, key: str, value: bytes) -> None:
+        self.put_many([(key, value)])
+
+    def put_many(self, items: Iterable[Tuple[str, bytes]]) -> None:
+        now = time.time()
+        rows = [(k, v, now) for k, v in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO cache (key, value, last_used) VALUES (?, ?, ?)", rows)
+            self._puts_since_trim += len(rows)
+            # 매 put 마다 COUNT(*) 하지 않도록 일정량 쌓였을 때만 정리
+            if self._puts_since_trim >= max(1, self.max_entries // 100):
+                self._trim()
+                self._puts_since_trim = 0
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _trim(self) -> None:
+        n = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if n <= self.max_entries:
+            return
+        # 한도의 90% 까지 줄여서 매번 trim 되지 않게 함
+        excess = n - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_used ASC LIMIT ?)",
+            (excess,),
+        )
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
@@ -0,0 +1,112 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import streamlit as st
+
+from clients import get_supabase_client
+from config import Settings
+from invalidation import on_doc_changed
+from retrieval_backends import parse_pgvector
+from tracing import span
+
+
+class DocRouter:
+    """
+    "전체 문서" 검색용 문서 라우터
+    - 적재 시 계산해 둔 문서 centroid(manual_docs.centroid = 비-목차 chunk 임베딩 평균)를 정규화 행렬 하나로 보관
+    - 질문 임베딩과의 cosine 으로 상위 문서 몇 개만 고르고, chunk 검색은 그 문서들 안에서만 실행
+    - centroid 가 없는 문서(마이그레이션 이전 적재분)는 항상 후보에 포함
+    - 적재/삭제 시 notify_doc_changed 로 다음 조회 때 다시 로드
+    """
+
+    def __init__(self, sb, ttl_s: float):
+        self.sb = sb
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._loaded_at = 0.0
+        self.doc_ids = np.zeros(0, dtype=np.int64)
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.unrouted: List[int] = []
+
+    def invalidate_doc(self, doc_id: int) -> None:
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def _load(self) -> None:
+        rows: List[Dict[str, Any]] = []
+        page_size = 1000
+        start = 0
+        while True:
+            with span("supabase.select.manual_docs") as sp:
+                res = (
+                    self.sb.table("manual_docs")
+                    .select("id,centroid")
+                    .is_("deleted_at", "null")
+                    .order("id")
+                    .range(start, start + page_size - 1)
+                    .execute()
+                )
+                batch = res.data or []
+                sp.set(rows=len(batch))
+            rows.extend(batch)
+            if len(batch) < page_size:
+                break
+            start += page_size
+
+        routed = [(int(r["id"]), parse_pgvector(r["centroid"])) for r in rows if r.get("centroid")]
+        unrouted = [int(r["id"]) for r in rows if not r.get("centroid")]
+        if routed:
+            mat = np.asarray([v for _, v in routed], dtype=np.float32)
+            mat /= np.maximum(np.linalg.norm(mat, axis=1, keepdims=True), 1e-12)
+        else:
+            mat = np.zeros((0, 0), dtype=np.float32)
+
+        with self._lock:
+            self.doc_ids = np.asarray([d for d, _ in routed], dtype=np.int64)
+            self.centroids = mat
+            self.unrouted = unrouted
+            self._loaded_at = time.time()
+
+    def route(self, query_embedding: List[float], top_n: int, min_similarity: float) -> Optional[List[int]]:
+        """
+        return: 검색할 doc_id 목록, 라우팅할 필요가 없거나(문서 수 <= top_n) 신뢰도가 낮으면 None (전체 검색)
+        """
+        with self._lock:
+            stale = time.time() - self._loaded_at > self.ttl_s
+        if stale:
+            self._load()
+        with self._lock:
+            doc_ids, centroids, unrouted = self.doc_ids, self.centroids, list(self.unrouted)
+
+        if len(doc_ids) + len(unrouted) <= top_n or not len(doc_ids):
+            return None
+
+        q = np.asarray(query_embedding, dtype=np.float32)
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+        sims = centroids @ q
+        k = min(top_n, len(doc_ids))
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        if float(sims[top[0]]) < min_similarity:
+            return None
+        return [int(d) for d in doc_ids[top]] + unrouted
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"routed_docs": int(len(self.doc_ids)), "unrouted_docs": len(self.unrouted)}
+
+
+@st.cache_resource
+def _open_doc_router(ttl_s: float, _sb) -> DocRouter:
+    router = DocRouter(_sb, ttl_s)
+    on_doc_changed(router.invalidate_doc)
+    return router
+
+
+def get_doc_router(settings: Settings) -> Optional[DocRouter]:
+    if not settings.doc_route_enabled:
+        return None
+    sb = get_supabase_client(settings.supabase_url, settings.supabase_service_key)
+    return _open_doc_router(settings.doc_route_ttl_s, sb)
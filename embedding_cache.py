@@ -0,0 +1,51 @@
+import hashlib
+from array import array
+from typing import Dict, List, Optional
+
+import streamlit as st
+
+from config import Settings
+from disk_cache import SqliteCache
+
+
+class EmbeddingCache:
+    """
+    (임베딩 모델, dims, sha256(chunk text)) 를 키로 하는 content-addressed 임베딩 캐시
+    - 벡터는 float32 바이트로 저장 (pgvector 도 float4 이므로 정밀도 손실 없음)
+    """
+
+    def __init__(self, store: SqliteCache):
+        self.store = store
+
+    @staticmethod
+    def make_key(model: str, dims: int, text: str) -> str:
+        digest = hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+        return f"{model}:{dims}:{digest}"
+
+    def get_many(self, model: str, dims: int, texts: List[str]) -> List[Optional[List[float]]]:
+        keys = [self.make_key(model, dims, t) for t in texts]
+        found = self.store.get_many(keys)
+        out: List[Optional[List[float]]] = []
+        for k in keys:
+            blob = found.get(k)
+            out.append(array("f", blob).tolist() if blob is not None else None)
+        return out
+
+    def put_many(self, model: str, dims: int, texts: List[str], embs: List[List[float]]) -> None:
+        self.store.put_many(
+            (self.make_key(model, dims, t), array("f", e).tobytes()) for t, e in zip(texts, embs)
+        )
+
+    def stats(self) -> Dict[str, float]:
+        return self.store.stats()
+
+
+@st.cache_resource
+def _open_embedding_cache(path: str, max_entries: int) -> EmbeddingCache:
+    return EmbeddingCache(SqliteCache(path, max_entries))
+
+
+def get_embedding_cache(settings: Settings) -> Optional[EmbeddingCache]:
+    if not settings.embedding_cache_enabled:
+        return None
+    return _open_embedding_cache(settings.embedding_cache_path, settings.embedding_cache_max_entries)
@@ -0,0 +1,408 @@
+"""
+벤치마크용 결정적(deterministic) OpenAI / Supabase 대체 클라이언트
+- 네트워크 없이 clients.set_client_overrides 로 주입
+- 요청마다 설정한 지연(latency)을 주고, 초당 요청 한도를 넘으면 대기 (대기 시간은 throttled_ms 로 집계)
+- 요청 수 / 업로드 바이트 등은 stats() 로 조회
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from answer_service import CITATION_MARKER
+from rate_limiter import RateLimiter
+
+
+@dataclass
+class FakeLatency:
+    """
+    요청 지연 = base_ms + per_kb_ms * (요청 payload KB), rate_per_s 초과 시 대기 (0 이면 한도 없음)
+    """
+    base_ms: float = 0.0
+    per_kb_ms: float = 0.0
+    rate_per_s: float = 0.0
+
+
+class _Meter:
+    def __init__(self, latency: FakeLatency):
+        self.latency = latency
+        self.requests: Counter = Counter()
+        self.bytes_sent = 0
+        self.throttled_ms = 0.0
+        self._limiter = RateLimiter(latency.rate_per_s, burst=max(1, int(latency.rate_per_s)))
+        self._lock = threading.Lock()
+
+    def hit(self, endpoint: str, payload_bytes: int = 0) -> None:
+        t0 = time.perf_counter()
+        self._limiter.acquire()
+        waited = (time.perf_counter() - t0) * 1000.0
+        with self._lock:
+            self.requests[endpoint] += 1
+            self.bytes_sent += payload_bytes
+            self.throttled_ms += waited
+        delay_ms = self.latency.base_ms + self.latency.per_kb_ms * payload_bytes / 1024.0
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "requests_total": sum(self.requests.values()),
+                "bytes_sent": self.bytes_sent,
+                "throttled_ms": round(self.throttled_ms, 1),
+            }
+
+
+def _payload_size(obj: Any) -> int:
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    return len(json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+# ---------- OpenAI ----------
+def fake_embedding(text: str, dims: int) -> List[float]:
+    """
+    글자 bigram 을 해시해 더한 정규화 벡터 (같은 글자 조합을 많이 공유할수록 cosine 유사도가 높음)
+    """
+    v = np.zeros(dims, dtype=np.float32)
+    t = re.sub(r"\s+", " ", (text or "").casefold())
+    for i in range(max(1, len(t) - 1)):
+        h = int.from_bytes(hashlib.blake2b(t[i:i + 2].encode("utf-8"), digest_size=8).digest(), "little")
+        v[h % dims] += 1.0 if (h >> 63) & 1 else -1.0
+    n = float(np.linalg.norm(v))
+    return (v / n if n > 0 else v).tolist()
+
+
+class _FakeEmbeddings:
+    def __init__(self, owner: "FakeOpenAI"):
+        self._owner = owner
+
+    def create(self, model: str, input, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        self._owner.meter.hit("embeddings.create", _payload_size(texts))
+        dims = int(kwargs.get("dimensions") or self._owner.embedding_dims)
+        return SimpleNamespace(
+            data=[SimpleNamespace(index=i, embedding=fake_embedding(t, dims)) for i, t in enumerate(texts)]
+        )
+
+
+class _FakeResponses:
+    """
+    RAG 답변: 발췌 중 첫 [page=N] 블록의 앞부분을 답변으로, 그 페이지를 인용
+    - 시스템 프롬프트에 스트리밍 마커가 있으면 평문 + 마커 형식, 아니면 JSON
+    - stream=True 면 output_text.delta 이벤트로 stream_chunk_chars 글자씩 나눠서 반환
+    """
+
+    def __init__(self, owner: "FakeOpenAI"):
+        self._owner = owner
+
+    def _answer(self, input) -> str:
+        system = " ".join(str(m.get("content")) for m in input if m.get("role") == "system")
+        user = " ".join(str(m.get("content")) for m in input if m.get("role") == "user")
+        m = re.search(r"\[page=(\d+)[^\]]*\]\n(.{0,200})", user, flags=re.S)
+        if not m:
+            answer, pages = "문서에 존재하지 않습니다.", []
+        else:
+            answer, pages = "1. " + " ".join(m.group(2).split()), [int(m.group(1))]
+        if CITATION_MARKER in system:
+            return f"{answer}\n{CITATION_MARKER} {', '.join(str(p) for p in pages)}"
+        return json.dumps({"answer": answer, "cited_pages": pages}, ensure_ascii=False)
+
+    def create(self, model: str, input, stream: bool = False, **kwargs):
+        self._owner.meter.hit("responses.create", _payload_size(input))
+        # 이미지 입력(OCR)은 content 가 list, RAG 답변은 문자열 메시지
+        is_ocr = any(isinstance(m.get("content"), list) for m in input if isinstance(m, dict))
+        text = "E-05" if is_ocr else self._answer(input)
+        if not stream:
+            return SimpleNamespace(output_text=text)
+        n = self._owner.stream_chunk_chars
+        delay_s = self._owner.stream_delta_ms / 1000.0
+
+        def _events():
+            for i in range(0, len(text), n):
+                if delay_s:
+                    time.sleep(delay_s)
+                yield SimpleNamespace(type="response.output_text.delta", delta=text[i:i + n])
+            yield SimpleNamespace(type="response.completed")
+
+        return _events()
+
+
+class _FakeTranscriptions:
+    def __init__(self, owner: "FakeOpenAI"):
+        self._owner = owner
+
+    def create(self, model: str, file, **kwargs):
+        data = file.read() if hasattr(file, "read") else file
+        self._owner.meter.hit("audio.transcriptions.create", _payload_size(data))
+        return "E-05 에러 해결 방법"
+
+
+class FakeOpenAI:
+    def __init__(
+        self,
+        latency: Optional[FakeLatency] = None,
+        embedding_dims: int = 1536,
+        stream_chunk_chars: int = 8,
+        stream_delta_ms: float = 0.0,
+    ):
+        self.meter = _Meter(latency or FakeLatency())
+        self.embedding_dims = embedding_dims
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_delta_ms = stream_delta_ms
+        self.embeddings = _FakeEmbeddings(self)
+        self.responses = _FakeResponses(self)
+        self.audio = SimpleNamespace(transcriptions=_FakeTranscriptions(self))
+
+    def stats(self) -> Dict[str, Any]:
+        return self.meter.stats()
+
+
+# ---------- Supabase ----------
+class _FakeQuery:
+    """
+    PostgREST 쿼리 빌더 중 이 코드베이스가 쓰는 부분만 구현
+    (select / insert / upsert / update / delete + eq / gt / gte / lte / is_ / order / range / limit)
+    """
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self._db = db
+        self._table = table
+        self._op = "select"
+        self._cols: Optional[List[str]] = None
+        self._payload: Any = None
+        self._on_conflict: Optional[str] = None
+        self._filters: List[Any] = []
+        self._order: Optional[Any] = None
+        self._offset = 0
+        self._limit: Optional[int] = None
+
+    def select(self, cols: str = "*"):
+        self._cols = None if cols.strip() == "*" else [c.strip() for c in cols.split(",")]
+        return self
+
+    def insert(self, rows):
+        self._op, self._payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict: Optional[str] = None):
+        self._op, self._payload, self._on_conflict = "upsert", rows, on_conflict
+        return self
+
+    def update(self, values: Dict[str, Any]):
+        self._op, self._payload = "update", values
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    def eq(self, col: str, value):
+        self._filters.append(lambda r: r.get(col) == value)
+        return self
+
+    def gt(self, col: str, value):
+        self._filters.append(lambda r: r.get(col) is not None and r.get(col) > value)
+        return self
+
+    def gte(self, col: str, value):
+        self._filters.append(lambda r: r.get(col) is not None and r.get(col) >= value)
+        return self
+
+    def lte(self, col: str, value):
+        self._filters.append(lambda r: r.get(col) is not None and r.get(col) <= value)
+        return self
+
+    def is_(self, col: str, value):
+        # PostgREST is.null 만 지원
+        self._filters.append(lambda r: r.get(col) is None)
+        return self
+
+    def order(self, col: str, desc: bool = False):
+        self._order = (col, desc)
+        return self
+
+    def range(self, start: int, end: int):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def _match(self, r: Dict[str, Any]) -> bool:
+        return all(f(r) for f in self._filters)
+
+    def execute(self):
+        return self._db._execute(self)
+
+
+class _FakeBucket:
+    def __init__(self, db: "FakeSupabase", name: str):
+        self._db = db
+        self._name = name
+
+    def upload(self, path: str, file: bytes, file_options: Optional[Dict[str, Any]] = None):
+        self._db.meter.hit("storage.upload", len(file))
+        with self._db._lock:
+            self._db.objects[(self._name, path)] = bytes(file)
+        return SimpleNamespace(path=path)
+
+    def remove(self, paths: List[str]):
+        self._db.meter.hit("storage.remove", _payload_size(paths))
+        with self._db._lock:
+            for p in paths:
+                self._db.objects.pop((self._name, p), None)
+        return []
+
+    def get_public_url(self, path: str) -> str:
+        return f"fake://{self._name}/{path}"
+
+
+class _FakeStorage:
+    def __init__(self, db: "FakeSupabase"):
+        self._db = db
+
+    def list_buckets(self):
+        self._db.meter.hit("storage.list_buckets")
+        return [{"name": b} for b in self._db.buckets]
+
+    def create_bucket(self, name: str, public: bool = False, **kwargs):
+        self._db.meter.hit("storage.create_bucket")
+        self._db.buckets.add(name)
+
+    def from_(self, name: str) -> _FakeBucket:
+        return _FakeBucket(self._db, name)
+
+
+class FakeSupabase:
+    """
+    in-memory 테이블 + 스토리지 + match_rag_chunks_v3 / match_rag_chunks_docs (numpy cosine) / refresh_doc_centroid RPC
+    """
+
+    def __init__(self, latency: Optional[FakeLatency] = None):
+        self.meter = _Meter(latency or FakeLatency())
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.objects: Dict[Any, bytes] = {}
+        self.buckets = set()
+        self.storage = _FakeStorage(self)
+        self._next_id: Counter = Counter()
+        self._vectors: Dict[int, Any] = {}  # rag_chunks id -> (embedding 문자열, 파싱된 벡터)
+        self._lock = threading.RLock()
+
+    def table(self, name: str) -> _FakeQuery:
+        return _FakeQuery(self, name)
+
+    def rpc(self, name: str, payload: Dict[str, Any]):
+        handlers = {
+            "match_rag_chunks_v3": self._match_chunks,
+            "match_rag_chunks_docs": self._match_chunks,
+            "refresh_doc_centroid": self._refresh_doc_centroid,
+        }
+        if name not in handlers:
+            raise ValueError(f"unknown rpc: {name}")
+        db = self
+
+        class _Rpc:
+            def execute(self_inner):
+                db.meter.hit(f"rpc.{name}", _payload_size(payload))
+                return SimpleNamespace(data=handlers[name](payload))
+
+        return _Rpc()
+
+    def _refresh_doc_centroid(self, payload: Dict[str, Any]) -> None:
+        doc_id = payload["p_doc_id"]
+        with self._lock:
+            rows = [r for r in self.tables.get("rag_chunks", []) if r["doc_id"] == doc_id and not r.get("is_toc")]
+            centroid = None
+            if rows:
+                centroid = json.dumps(np.mean([self._vector(r) for r in rows], axis=0).tolist())
+            for d in self.tables.get("manual_docs", []):
+                if d["id"] == doc_id:
+                    d["centroid"] = centroid
+
+    def _match_chunks(self, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        q = np.asarray(json.loads(payload["query_embedding"]), dtype=np.float32)
+        doc_ids = payload.get("doc_ids")
+        if doc_ids is None and payload.get("doc_id_filter") is not None:
+            doc_ids = [payload["doc_id_filter"]]
+        with self._lock:
+            rows = [
+                r for r in self.tables.get("rag_chunks", [])
+                if not r.get("is_toc") and (doc_ids is None or r["doc_id"] in doc_ids)
+            ]
+        if not rows:
+            return []
+        mat = np.stack([self._vector(r) for r in rows])
+        sims = mat @ q / np.maximum(np.linalg.norm(mat, axis=1) * max(float(np.linalg.norm(q)), 1e-12), 1e-12)
+        best = np.argsort(-sims)[: int(payload["match_count"])]
+        keys = ("id", "doc_id", "page_number", "chunk_index", "content")
+        return [{**{k: rows[i][k] for k in keys}, "similarity": float(sims[i])} for i in best]
+
+    def _vector(self, row: Dict[str, Any]) -> np.ndarray:
+        cached = self._vectors.get(row["id"])
+        if cached is None or cached[0] is not row["embedding"]:
+            cached = (row["embedding"], np.asarray(json.loads(row["embedding"]), dtype=np.float32))
+            self._vectors[row["id"]] = cached
+        return cached[1]
+
+    def _execute(self, q: _FakeQuery):
+        self.meter.hit(f"{q._op}.{q._table}", _payload_size(q._payload) if q._payload is not None else 0)
+        with self._lock:
+            table = self.tables.setdefault(q._table, [])
+            if q._op == "insert":
+                rows = q._payload if isinstance(q._payload, list) else [q._payload]
+                out = [self._insert(q._table, table, r) for r in rows]
+                return SimpleNamespace(data=[dict(r) for r in out])
+            if q._op == "upsert":
+                keys = [k.strip() for k in (q._on_conflict or "id").split(",")]
+                out = []
+                for r in q._payload if isinstance(q._payload, list) else [q._payload]:
+                    existing = next((e for e in table if all(e.get(k) == r.get(k) for k in keys)), None)
+                    if existing is not None:
+                        existing.update(r)
+                        out.append(existing)
+                    else:
+                        out.append(self._insert(q._table, table, r))
+                return SimpleNamespace(data=[dict(r) for r in out])
+            matched = [r for r in table if q._match(r)]
+            if q._op == "update":
+                for r in matched:
+                    r.update(q._payload)
+                return SimpleNamespace(data=[dict(r) for r in matched])
+            if q._op == "delete":
+                self.tables[q._table] = [r for r in table if not q._match(r)]
+                return SimpleNamespace(data=[dict(r) for r in matched])
+
+            if q._order:
+                col, desc = q._order
+                matched.sort(key=lambda r: (r.get(col) is None, r.get(col)), reverse=desc)
+            end = None if q._limit is None else q._offset + q._limit
+            matched = matched[q._offset:end]
+            if q._cols is not None:
+                matched = [{c: r.get(c) for c in q._cols} for r in matched]
+            return SimpleNamespace(data=[dict(r) for r in matched])
+
+    def _insert(self, name: str, table: List[Dict[str, Any]], row: Dict[str, Any]) -> Dict[str, Any]:
+        r = dict(row)
+        if "id" not in r:
+            self._next_id[name] += 1
+            r["id"] = self._next_id[name]
+        r.setdefault("created_at", time.strftime("%Y-%m-%dT%H:%M:%S"))
+        table.append(r)
+        return r
+
+    def stats(self) -> Dict[str, Any]:
+        s = self.meter.stats()
+        s["rows"] = {name: len(rows) for name, rows in self.tables.items()}
+        s["storage_objects"] = len(self.objects)
+        s["storage_bytes"] = sum(len(b) for b in self.objects.values())
+        return s
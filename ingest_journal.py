@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+
+import streamlit as st
+
+from config import Settings
+
+
+class IngestJournal:
+    """
+    적재 작업 저널 (로컬 SQLite)
+    - 파일 해시 단위로 작업(doc_id, 진행 상태)과 커밋 완료된 페이지를 기록
+    - 적재가 중간에 실패해도 같은 PDF를 다시 적재하면 마지막 체크포인트 이후부터 이어서 진행
+    - claim/release: 같은 PDF를 동시에 두 작업이 적재(같은 doc 으로 이어서 적재)하지 않도록 프로세스 안에서 선점
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._active: Set[str] = set()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingest_jobs ("
+            " file_sha256 TEXT PRIMARY KEY,"
+            " doc_id INTEGER NOT NULL,"
+            " title TEXT,"
+            " page_count INTEGER,"
+            " status TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingest_pages ("
+            " file_sha256 TEXT NOT NULL,"
+            " page_number INTEGER NOT NULL,"
+            " PRIMARY KEY (file_sha256, page_number))"
+        )
+
+    def claim(self, file_sha256: str) -> bool:
+        """
+        이 PDF 적재를 선점. 이미 다른 작업이 적재 중이면 False
+        (저널은 서버 프로세스당 하나이고 적재도 그 프로세스의 워커에서만 실행되므로 프로세스 안 선점으로 충분)
+        """
+        with self._lock:
+            if file_sha256 in self._active:
+                return False
+            self._active.add(file_sha256)
+            return True
+
+    def release(self, file_sha256: str) -> None:
+        with self._lock:
+            self._active.discard(file_sha256)
+
+    def find_unfinished(self, file_sha256: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT doc_id, title, page_count FROM ingest_jobs WHERE file_sha256 = ? AND status = 'running'",
+                (file_sha256,),
+            ).fetchone()
+        if not row:
+            return None
+        return {"doc_id": int(row[0]), "title": row[1], "page_count": row[2]}
+
+    def start(self, file_sha256: str, doc_id: int, title: str, page_count: int, resume: bool = False) -> None:
+        """
+        작업 시작 기록. resume=False 면 같은 PDF의 이전 작업 체크포인트를 지움
+        (다른 doc 에 기록된 페이지를 새 doc 에 기록된 것으로 보고 건너뛰지 않도록)
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            if not resume:
+                self._conn.execute("DELETE FROM ingest_pages WHERE file_sha256 = ?", (file_sha256,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ingest_jobs (file_sha256, doc_id, title, page_count, status, updated_at)"
+                " VALUES (?, ?, ?, ?, 'running', ?)",
+                (file_sha256, doc_id, title, page_count, time.time()),
+            )
+            self._conn.execute("COMMIT")
+
+    def completed_pages(self, file_sha256: str) -> Set[int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page_number FROM ingest_pages WHERE file_sha256 = ?", (file_sha256,)
+            ).fetchall()
+        return {int(r[0]) for r in rows}
+
+    def checkpoint(self, file_sha256: str, pages: Iterable[int]) -> None:
+        rows = [(file_sha256, int(p)) for p in pages]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO ingest_pages (file_sha256, page_number) VALUES (?, ?)", rows
+            )
+            self._conn.execute(
+                "UPDATE ingest_jobs SET updated_at = ? WHERE file_sha256 = ?", (time.time(), file_sha256)
+            )
+            self._conn.execute("COMMIT")
+
+    def finish(self, file_sha256: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "UPDATE ingest_jobs SET status = 'done', updated_at = ? WHERE file_sha256 = ?",
+                (time.time(), file_sha256),
+            )
+            self._conn.execute("DELETE FROM ingest_pages WHERE file_sha256 = ?", (file_sha256,))
+            self._conn.execute("COMMIT")
+
+    def forget_doc(self, doc_id: int) -> None:
+        """
+        삭제된 문서의 미완료 작업 제거 (같은 PDF 재업로드가 삭제된 doc_id 로 이어지지 않도록)
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "DELETE FROM ingest_pages WHERE file_sha256 IN"
+                " (SELECT file_sha256 FROM ingest_jobs WHERE doc_id = ?)",
+                (int(doc_id),),
+            )
+            self._conn.execute("DELETE FROM ingest_jobs WHERE doc_id = ?", (int(doc_id),))
+            self._conn.execute("COMMIT")
+
+
+@st.cache_resource
+def _open_ingest_journal(path: str) -> IngestJournal:
+    return IngestJournal(path)
+
+
+def get_ingest_journal(settings: Settings) -> IngestJournal:
+    return _open_ingest_journal(settings.ingest_journal_path)
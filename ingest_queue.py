@@ -0,0 +1,208 @@
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+
+import streamlit as st
+
+from config import Settings
+from ingest_service import ingest_pdf_to_supabase, sha256_hex
+
+
+class IngestQueue:
+    """
+    백그라운드 PDF 적재 작업 큐 (로컬 워커 스레드 + SQLite 영속 큐)
+    - 업로드한 PDF는 queue_dir 에 저장되므로 브라우저 새로고침/서버 재시작 후에도 작업이 유지됨
+    - 워커 수(ingest_queue_workers)만큼 문서를 동시에 적재
+    - 재시작 시 running 상태였던 작업은 다시 queued 로 돌리고, 적재 저널로 이어서 진행
+    - 큐/워커는 프로세스 수명 동안 유지되므로 작업마다 최신 Settings(update_settings)로 적재
+      (queue_dir / 워커 수만 처음 값으로 고정)
+    """
+
+    _COLUMNS = (
+        "id", "title", "doc_id", "file_sha256", "status", "page_count", "pages_done", "chunks_done",
+        "result_doc_id", "total_chunks", "error", "created_at", "started_at", "finished_at",
+    )
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.queue_dir = settings.ingest_queue_dir
+        os.makedirs(self.queue_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._conn = sqlite3.connect(
+            os.path.join(self.queue_dir, "jobs.sqlite3"), check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingest_queue ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " title TEXT NOT NULL,"
+            " doc_id INTEGER,"
+            " file_sha256 TEXT NOT NULL,"
+            " pdf_path TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " page_count INTEGER DEFAULT 0,"
+            " pages_done INTEGER DEFAULT 0,"
+            " chunks_done INTEGER DEFAULT 0,"
+            " result_doc_id INTEGER,"
+            " total_chunks INTEGER,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL)"
+        )
+        with self._lock:
+            self._conn.execute("UPDATE ingest_queue SET status = 'queued' WHERE status = 'running'")
+
+        self._threads = [
+            threading.Thread(target=self._worker_loop, name=f"ingest-worker-{i}", daemon=True)
+            for i in range(max(1, settings.ingest_queue_workers))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def update_settings(self, settings: Settings) -> None:
+        with self._lock:
+            self.settings = settings
+
+    def enqueue(self, title: str, pdf_bytes: bytes, doc_id: Optional[int] = None) -> int:
+        file_sha256 = sha256_hex(pdf_bytes)
+        pdf_path = os.path.join(self.queue_dir, f"{file_sha256}.pdf")
+        if not os.path.exists(pdf_path):
+            tmp = pdf_path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(pdf_bytes)
+            os.replace(tmp, pdf_path)
+
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO ingest_queue (title, doc_id, file_sha256, pdf_path, status, created_at)"
+                " VALUES (?, ?, ?, ?, 'queued', ?)",
+                (title, doc_id, file_sha256, pdf_path, time.time()),
+            )
+            job_id = int(cur.lastrowid)
+        self._wakeup.set()
+        return job_id
+
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        최근 작업 목록 + 처리량(pages/s) / 남은 시간(ETA, 초)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM ingest_queue ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+        now = time.time()
+        jobs = []
+        for r in rows:
+            job = dict(zip(self._COLUMNS, r))
+            job["pages_per_s"] = 0.0
+            job["eta_s"] = None
+            if job["started_at"] and job["pages_done"]:
+                elapsed = (job["finished_at"] or now) - job["started_at"]
+                if elapsed > 0:
+                    job["pages_per_s"] = job["pages_done"] / elapsed
+                    if job["status"] == "running" and job["page_count"]:
+                        job["eta_s"] = (job["page_count"] - job["pages_done"]) / job["pages_per_s"]
+            jobs.append(job)
+        return jobs
+
+    def _claim_next(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT id, title, doc_id, pdf_path FROM ingest_queue WHERE status = 'queued'"
+                # 같은 PDF 작업이 실행 중이면 그 작업이 끝난 뒤에 꺼냄 (동시 적재 방지, 끝나면 동일 PDF 로 건너뜀)
+                " AND file_sha256 NOT IN (SELECT file_sha256 FROM ingest_queue WHERE status = 'running')"
+                " ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE ingest_queue SET status = 'running', started_at = ?, error = NULL WHERE id = ?",
+                    (time.time(), row[0]),
+                )
+            self._conn.execute("COMMIT")
+        if not row:
+            return None
+        return {"id": row[0], "title": row[1], "doc_id": row[2], "pdf_path": row[3]}
+
+    def _update(self, job_id: int, **fields: Any) -> None:
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE ingest_queue SET {cols} WHERE id = ?", list(fields.values()) + [job_id])
+
+    def _worker_loop(self) -> None:
+        while True:
+            job = self._claim_next()
+            if job is None:
+                self._wakeup.wait(timeout=2.0)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        with self._lock:
+            settings = self.settings
+        last_report = [0.0]
+
+        def _on_progress(pages_done: int, page_count: int, chunks_done: int) -> None:
+            # 진행률 기록은 1초에 한 번 정도로 제한 (마지막 보고는 항상 기록)
+            now = time.time()
+            if pages_done < page_count and now - last_report[0] < 1.0:
+                return
+            last_report[0] = now
+            self._update(job_id, pages_done=pages_done, page_count=page_count, chunks_done=chunks_done)
+
+        try:
+            with open(job["pdf_path"], "rb") as f:
+                pdf_bytes = f.read()
+            doc_id, total_chunks = ingest_pdf_to_supabase(
+                settings, pdf_bytes, job["title"], doc_id=job["doc_id"], on_progress=_on_progress
+            )
+            self._update(
+                job_id,
+                status="done",
+                result_doc_id=doc_id,
+                total_chunks=total_chunks,
+                finished_at=time.time(),
+            )
+            self._remove_pdf_if_unused(job["pdf_path"])
+        except Exception as e:
+            traceback.print_exc()
+            self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+
+    def retry(self, job_id: int) -> None:
+        self._update(job_id, status="queued", finished_at=None)
+        self._wakeup.set()
+
+    def _remove_pdf_if_unused(self, pdf_path: str) -> None:
+        with self._lock:
+            n = self._conn.execute(
+                "SELECT COUNT(*) FROM ingest_queue WHERE pdf_path = ? AND status IN ('queued', 'running', 'failed')",
+                (pdf_path,),
+            ).fetchone()[0]
+        if n == 0:
+            try:
+                os.remove(pdf_path)
+            except OSError:
+                pass
+
+
+@st.cache_resource
+def _open_ingest_queue(queue_dir: str, _settings: Settings) -> IngestQueue:
+    return IngestQueue(_settings)
+
+
+def get_ingest_queue(settings: Settings) -> IngestQueue:
+    """
+    서버 프로세스당 하나의 큐/워커 집합을 공유 (세션 간 공유), 이후 작업은 호출 측의 최신 settings 로 실행
+    """
+    queue = _open_ingest_queue(settings.ingest_queue_dir, settings)
+    queue.update_settings(settings)
+    return queue
@@ -1,72 +1,423 @@
-import time
-from typing import Tuple
+import hashlib
+from collections import deque
+from dataclasses import dataclass
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 import fitz  # PyMuPDF
 
+from bulk_writer import BulkWriter
 from clients import get_openai_client, get_supabase_client
 from config import Settings
-from utils_text import chunk_text, is_toc_page
-from retrieval_service import openai_embed, embedding_to_pgvector_str
-from storage_service import supabase_upload_png
+from ingest_journal import IngestJournal, get_ingest_journal
+from invalidation import notify_doc_changed
+from tokens import count_tokens
+from chunker import make_chunks
+from utils_text import is_toc_page
+from retrieval_service import cached_embed_many, embedding_to_pgvector_str
+from storage_service import supabase_upload_bytes
 
 
-def ingest_pdf_to_supabase(settings: Settings, pdf_bytes: bytes, title: str) -> Tuple[int, int]:
+_IMAGE_CONTENT_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+_IMAGE_EXTS = {"webp": "webp", "jpeg": "jpg", "png": "png"}
+
+
+@dataclass
+class RenderedPage:
+    page_number: int
+    text: str
+    image: bytes         # 원본 해상도 (page_image_dpi)
+    thumb: bytes         # 그리드용 썸네일 (긴 변 page_thumb_max_px)
+    image_sha256: str    # 렌더링된 픽셀 기준 해시 (인코딩 포맷과 무관)
+
+
+# 렌더링 워커 프로세스마다 한 번만 PDF를 연다 (fitz.Document 는 pickle 불가)
+_worker_doc = None
+
+
+def _init_render_worker(pdf_bytes: bytes) -> None:
+    global _worker_doc
+    _worker_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+
+
+def _encode_pixmap(pix, fmt: str, quality: int) -> bytes:
+    if fmt == "png":
+        return pix.tobytes("png")
+    return pix.pil_tobytes(format=fmt.upper(), quality=quality)
+
+
+def _render_page(doc, page_index: int, settings: Settings) -> RenderedPage:
+    page = doc.load_page(page_index)
+    text = page.get_text("text") or ""
+
+    pix = page.get_pixmap(dpi=settings.page_image_dpi)
+    image = _encode_pixmap(pix, settings.page_image_format, settings.page_image_quality)
+
+    # 썸네일은 원본을 줄이지 않고 낮은 배율로 다시 렌더링 (더 빠르고 선명함)
+    longest = max(page.rect.width, page.rect.height) or 1.0
+    scale = min(settings.page_thumb_max_px / longest, settings.page_image_dpi / 72.0)
+    thumb_pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale))
+    thumb = _encode_pixmap(thumb_pix, settings.page_thumb_format, settings.page_thumb_quality)
+
+    return RenderedPage(
+        page_number=page_index + 1,
+        text=text,
+        image=image,
+        thumb=thumb,
+        image_sha256=sha256_hex(pix.samples),
+    )
+
+
+def _render_page_in_worker(page_index: int, settings: Settings) -> RenderedPage:
+    return _render_page(_worker_doc, page_index, settings)
+
+
+def _iter_rendered_pages(settings: Settings, pdf_bytes: bytes, page_numbers: List[int]) -> Iterator[RenderedPage]:
+    """
+    렌더링 단계: page_numbers 의 페이지를 순서대로 렌더링해서 yield
+    - ingest_render_workers > 1 이면 프로세스 풀에서 렌더링
+    - 최대 ingest_max_inflight_pages 페이지까지만 앞서 렌더링 (backpressure)
+    """
+    if settings.ingest_render_workers <= 1:
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        for page_number in page_numbers:
+            yield _render_page(doc, page_number - 1, settings)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=settings.ingest_render_workers,
+        initializer=_init_render_worker,
+        initargs=(pdf_bytes,),
+    ) as pool:
+        window: deque = deque()
+        todo = deque(page_numbers)
+        while todo or window:
+            while todo and len(window) < settings.ingest_max_inflight_pages:
+                window.append(pool.submit(_render_page_in_worker, todo.popleft() - 1, settings))
+            yield window.popleft().result()
+
+
+def _submit_bounded(pool: ThreadPoolExecutor, inflight: Set[Future], limit: int, fn, *args) -> None:
+    """
+    in-flight 작업이 limit 이상이면 하나가 끝날 때까지 대기 후 제출 (실패는 즉시 전파)
+    """
+    while len(inflight) >= limit:
+        done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+        for f in done:
+            inflight.discard(f)
+            f.result()
+    inflight.add(pool.submit(fn, *args))
+
+
+def _drain(inflight: Set[Future]) -> None:
+    for f in list(inflight):
+        f.result()
+    inflight.clear()
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def find_doc_by_file_hash(settings: Settings, file_sha256: str) -> Optional[int]:
+    """
+    동일한 PDF(바이트 단위)가 이미 적재되어 있으면 그 doc_id 반환 (삭제 중인 문서는 제외)
+    """
+    sb = get_supabase_client(settings.supabase_url, settings.supabase_service_key)
+    res = (
+        sb.table("manual_docs")
+        .select("id")
+        .eq("file_sha256", file_sha256)
+        .is_("deleted_at", "null")
+        .limit(1)
+        .execute()
+    )
+    if res.data:
+        return int(res.data[0]["id"])
+    return None
+
+
+def _doc_is_live(sb, doc_id: int) -> bool:
+    res = sb.table("manual_docs").select("id,deleted_at").eq("id", doc_id).limit(1).execute()
+    return bool(res.data) and not res.data[0].get("deleted_at")
+
+
+def _load_page_hashes(sb, doc_id: int) -> Dict[int, Dict[str, Any]]:
+    res = (
+        sb.table("manual_pages")
+        .select("page_number,text_sha256,image_sha256,image_path,image_url,thumb_path,thumb_url")
+        .eq("doc_id", doc_id)
+        .execute()
+    )
+    return {int(r["page_number"]): r for r in (res.data or [])}
+
+
+def _remove_pages_after(sb, settings: Settings, doc_id: int, page_count: int, existing: Dict[int, Dict[str, Any]]) -> None:
+    """
+    개정판에서 페이지 수가 줄어든 경우, 남는 페이지의 row / 이미지 삭제
+    """
+    stale = [p for p in existing if p > page_count]
+    if not stale:
+        return
+    sb.table("rag_chunks").delete().eq("doc_id", doc_id).gt("page_number", page_count).execute()
+    sb.table("manual_pages").delete().eq("doc_id", doc_id).gt("page_number", page_count).execute()
+    paths = [existing[p][k] for p in stale for k in ("image_path", "thumb_path") if existing[p].get(k)]
+    if paths:
+        try:
+            sb.storage.from_(settings.storage_bucket).remove(paths)
+        except Exception:
+            pass
+
+
+def _upload_page(
+    sb,
+    page_writer: BulkWriter,
+    settings: Settings,
+    doc_id: int,
+    page: RenderedPage,
+    upload_images: bool,
+    prev: Optional[Dict[str, Any]],
+    toc_flag: bool,
+    text_sha256: str,
+) -> None:
+    """
+    원본 이미지 + 썸네일 업로드 후 manual_pages row 를 쓰기 버퍼에 추가
+    upload_images=False 이면 이미지는 그대로 두고(prev 의 경로/URL 유지) 해시/목차 플래그만 갱신
+    """
+    prev = prev or {}
+    if upload_images:
+        bucket = settings.storage_bucket
+        img_fmt, thumb_fmt = settings.page_image_format, settings.page_thumb_format
+        img_path = f"{doc_id}/page_{page.page_number:04d}.{_IMAGE_EXTS[img_fmt]}"
+        thumb_path = f"{doc_id}/thumb_{page.page_number:04d}.{_IMAGE_EXTS[thumb_fmt]}"
+        img_url = supabase_upload_bytes(sb, bucket, img_path, page.image, _IMAGE_CONTENT_TYPES[img_fmt])
+        thumb_url = supabase_upload_bytes(sb, bucket, thumb_path, page.thumb, _IMAGE_CONTENT_TYPES[thumb_fmt])
+
+        # 포맷이 바뀌어 경로가 달라졌으면 이전 이미지는 삭제 (best-effort)
+        old_paths = [prev.get(k) for k in ("image_path", "thumb_path")]
+        old_paths = [p for p in old_paths if p and p not in (img_path, thumb_path)]
+        if old_paths:
+            try:
+                sb.storage.from_(bucket).remove(old_paths)
+            except Exception:
+                pass
+    else:
+        img_path, img_url = prev.get("image_path"), prev.get("image_url")
+        thumb_path, thumb_url = prev.get("thumb_path"), prev.get("thumb_url")
+
+    # bulk upsert 는 모든 row 의 컬럼 구성이 같아야 하므로 이미지 컬럼도 항상 포함
+    row = {
+        "doc_id": doc_id,
+        "page_number": page.page_number,
+        "image_path": img_path,
+        "image_url": img_url,
+        "thumb_path": thumb_path,
+        "thumb_url": thumb_url,
+        "is_toc": toc_flag,
+        "text_sha256": text_sha256,
+        "image_sha256": page.image_sha256,
+    }
+
+    page_writer.add(row)
+
+
+def _embed_and_insert(chunk_writer: BulkWriter, oai, settings: Settings, rows: List[Dict[str, Any]]) -> None:
+    """
+    여러 페이지에서 모인 chunk row들을 한 번에 임베딩하고 rag_chunks 쓰기 버퍼에 추가
+    """
+    embs = cached_embed_many(settings, oai, [r["content"] for r in rows])
+    for r, emb in zip(rows, embs):
+        r["embedding"] = embedding_to_pgvector_str(emb)
+    chunk_writer.add_many(rows)
+
+
+def _make_writer(sb, settings: Settings, table: str, on_conflict: str) -> BulkWriter:
+    return BulkWriter(
+        sb,
+        table,
+        on_conflict,
+        max_rows=settings.db_batch_max_rows,
+        max_bytes=settings.db_batch_max_bytes,
+        max_retries=settings.db_write_retries,
+    )
+
+
+def ingest_pdf_to_supabase(
+    settings: Settings,
+    pdf_bytes: bytes,
+    title: str,
+    doc_id: Optional[int] = None,
+    on_progress: Optional[Callable[[int, int, int], None]] = None,
+) -> Tuple[int, int]:
+    """
+    렌더링(프로세스 풀) → 업로드/DB 기록(스레드 풀) → 임베딩/chunk insert(스레드 풀)
+    단계별로 겹쳐서 실행하는 파이프라인. 각 단계의 in-flight 수는 Settings 로 제한된다.
+
+    - doc_id 를 주면 기존 문서 업데이트 모드: 페이지별 텍스트/이미지 해시를 비교해서
+      바뀐 페이지만 이미지 재업로드 / rag_chunks 재작성
+    - 바이트 단위로 동일한 PDF가 이미 적재되어 있으면 아무것도 하지 않고 (그 doc_id, 0) 반환
+    - ingest_checkpoint_pages 페이지마다 모든 쓰기를 flush 하고 저널에 체크포인트를 남기므로,
+      중간에 실패한 같은 PDF를 다시 적재하면 커밋된 페이지는 건너뛰고 이어서 진행
+    - on_progress(pages_done, page_count, chunks_embedded) 로 진행 상황 보고
+    - 같은 PDF를 다른 작업이 적재 중이면 RuntimeError (두 작업이 같은 doc 으로 이어서 적재하지 않도록)
+    return: (doc_id, 새로 기록한 chunk 수)
+    """
+    journal = get_ingest_journal(settings)
+    file_sha256 = sha256_hex(pdf_bytes)
+    if not journal.claim(file_sha256):
+        raise RuntimeError("같은 PDF를 이미 다른 작업이 적재 중입니다. 끝난 뒤 다시 시도하세요.")
+    try:
+        return _ingest_claimed(settings, journal, file_sha256, pdf_bytes, title, doc_id, on_progress)
+    finally:
+        journal.release(file_sha256)
+
+
+def _ingest_claimed(
+    settings: Settings,
+    journal: IngestJournal,
+    file_sha256: str,
+    pdf_bytes: bytes,
+    title: str,
+    doc_id: Optional[int],
+    on_progress: Optional[Callable[[int, int, int], None]],
+) -> Tuple[int, int]:
     oai = get_openai_client(settings.openai_api_key)
     sb = get_supabase_client(settings.supabase_url, settings.supabase_service_key)
 
-    doc_row = sb.table("manual_docs").insert({"title": title, "file_name": f"{title}.pdf"}).execute()
-    doc_id = int(doc_row.data[0]["id"])
+    same_doc_id = find_doc_by_file_hash(settings, file_sha256)
+    if same_doc_id is not None:
+        return same_doc_id, 0
+
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        page_count = doc.page_count
+
+    done_pages: Set[int] = set()
+    resuming = False
+    unfinished = journal.find_unfinished(file_sha256)
+    if unfinished is not None and not _doc_is_live(sb, unfinished["doc_id"]):
+        # 저널의 문서가 그 사이 삭제(tombstone/purge)됐으면 이어서 적재하지 않고 새 문서로 적재
+        journal.forget_doc(unfinished["doc_id"])
+        unfinished = None
+    if unfinished is not None and doc_id in (None, unfinished["doc_id"]):
+        doc_id = unfinished["doc_id"]
+        done_pages = journal.completed_pages(file_sha256)
+        resuming = True
+
+    existing: Dict[int, Dict[str, Any]] = {}
+    if doc_id is None:
+        doc_row = sb.table("manual_docs").insert({"title": title, "file_name": f"{title}.pdf"}).execute()
+        doc_id = int(doc_row.data[0]["id"])
+    else:
+        existing = _load_page_hashes(sb, doc_id)
+    journal.start(file_sha256, doc_id, title, page_count, resume=resuming)
 
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
     total_chunks = 0
 
-    for page_index in range(doc.page_count):
-        page_number = page_index + 1
-        page = doc.load_page(page_index)
-
-        text = page.get_text("text") or ""
-        toc_flag = is_toc_page(text)
-
-        pix = page.get_pixmap(dpi=160)
-        png = pix.tobytes("png")
-
-        img_path = f"{doc_id}/page_{page_number:04d}.png"
-        img_url = supabase_upload_png(sb, settings.storage_bucket, img_path, png)
-
-        sb.table("manual_pages").upsert(
-            {
-                "doc_id": doc_id,
-                "page_number": page_number,
-                "image_path": img_path,
-                "image_url": img_url,
-                "is_toc": toc_flag,
-            },
-            on_conflict="doc_id,page_number",
-        ).execute()
-
-        chunks = chunk_text(text, settings.chunk_size, settings.chunk_overlap)
-        if not chunks:
-            continue
-
-        rows = []
-        for ci, chunk in enumerate(chunks):
-            emb = openai_embed(oai, settings.embedding_model, chunk)
-            if len(emb) != settings.embedding_dims:
-                raise ValueError(f"Embedding dims mismatch: got {len(emb)}, expected {settings.embedding_dims}")
-
-            rows.append(
-                {
-                    "doc_id": doc_id,
-                    "page_number": page_number,
-                    "chunk_index": ci,
-                    "content": chunk,
-                    "embedding": embedding_to_pgvector_str(emb),
-                    "is_toc": toc_flag,
-                }
+    _remove_pages_after(sb, settings, doc_id, page_count, existing)
+
+    # 페이지를 넘나들며 chunk를 모아 두었다가 배치 한도가 차면 한 번에 임베딩
+    pending: List[Dict[str, Any]] = []
+    pending_tokens = 0
+
+    upload_inflight: Set[Future] = set()
+    embed_inflight: Set[Future] = set()
+
+    # manual_pages / rag_chunks 는 페이지 단위가 아니라 크기 한도 단위로 모아서 bulk upsert
+    page_writer = _make_writer(sb, settings, "manual_pages", "doc_id,page_number")
+    chunk_writer = _make_writer(sb, settings, "rag_chunks", "doc_id,page_number,chunk_index")
+
+    todo_pages = [p for p in range(1, page_count + 1) if p not in done_pages]
+    uncommitted: List[int] = []
+    pages_committed = 0
+
+    with ThreadPoolExecutor(max_workers=settings.ingest_io_workers) as io_pool, \
+            ThreadPoolExecutor(max_workers=settings.ingest_embed_workers) as embed_pool:
+
+        def _commit() -> None:
+            """
+            지금까지 처리한 페이지의 업로드/임베딩/DB 쓰기를 모두 끝낸 뒤 저널에 체크포인트
+            """
+            nonlocal pending, pending_tokens, pages_committed
+            if pending:
+                _submit_bounded(
+                    embed_pool, embed_inflight, settings.ingest_embed_workers * 2,
+                    _embed_and_insert, chunk_writer, oai, settings, pending,
+                )
+                pending = []
+                pending_tokens = 0
+            # rag_chunks 를 먼저 기록: manual_pages 의 text_sha256 이 "이 페이지 chunk 반영 완료" 표시 역할
+            _drain(embed_inflight)
+            chunk_writer.flush()
+            _drain(upload_inflight)
+            page_writer.flush()
+            journal.checkpoint(file_sha256, uncommitted)
+            pages_committed += len(uncommitted)
+            uncommitted.clear()
+
+        for page in _iter_rendered_pages(settings, pdf_bytes, todo_pages):
+            page_number, text = page.page_number, page.text
+            # 직전 페이지들까지의 작업이 제출된 상태에서 체크포인트 (현재 페이지는 아직 미포함)
+            if len(uncommitted) >= settings.ingest_checkpoint_pages:
+                _commit()
+            uncommitted.append(page_number)
+            if on_progress:
+                on_progress(len(done_pages) + len(uncommitted) + pages_committed, page_count, chunk_writer.rows_added)
+
+            toc_flag = is_toc_page(text)
+            text_sha256 = sha256_hex(text.encode("utf-8"))
+
+            prev = existing.get(page_number)
+            # 이어서 적재할 때 체크포인트 밖의 페이지는 manual_pages 해시가 먼저 기록됐을 수 있으므로
+            # (버퍼가 차서 중간 flush 된 경우) 해시와 관계없이 chunk 를 다시 작성
+            text_changed = resuming or prev is None or prev.get("text_sha256") != text_sha256
+            image_changed = prev is None or prev.get("image_sha256") != page.image_sha256 or not prev.get("thumb_url")
+            if not (text_changed or image_changed):
+                continue
+
+            _submit_bounded(
+                io_pool, upload_inflight, settings.ingest_io_workers * 2,
+                _upload_page, sb, page_writer, settings, doc_id, page,
+                image_changed, prev, toc_flag, text_sha256,
             )
-            total_chunks += 1
-            if total_chunks % 60 == 0:
-                time.sleep(0.25)
 
-        sb.table("rag_chunks").insert(rows).execute()
+            if not text_changed:
+                continue
+            if prev is not None:
+                # 새 chunk 는 아래 임베딩 단계에서 insert 되므로 그 전에 기존 chunk 삭제
+                sb.table("rag_chunks").delete().eq("doc_id", doc_id).eq("page_number", page_number).execute()
+
+            chunks = make_chunks(settings, text)
+            for ci, chunk in enumerate(chunks):
+                pending.append(
+                    {
+                        "doc_id": doc_id,
+                        "page_number": page_number,
+                        "chunk_index": ci,
+                        "content": chunk,
+                        "is_toc": toc_flag,
+                    }
+                )
+                pending_tokens += count_tokens(chunk, settings.embedding_model)
+                total_chunks += 1
+
+            if len(pending) >= settings.embed_batch_max_inputs or pending_tokens >= settings.embed_batch_max_tokens:
+                _submit_bounded(
+                    embed_pool, embed_inflight, settings.ingest_embed_workers * 2,
+                    _embed_and_insert, chunk_writer, oai, settings, pending,
+                )
+                pending = []
+                pending_tokens = 0
+
+        _commit()
+
+    if on_progress:
+        on_progress(page_count, page_count, chunk_writer.rows_added)
+
+    # 문서 라우팅용 centroid (변경되지 않은 페이지의 chunk 까지 포함해야 하므로 DB 에서 평균)
+    sb.rpc("refresh_doc_centroid", {"p_doc_id": doc_id}).execute()
+
+    # 모든 페이지가 반영된 뒤에만 파일 해시를 기록 (중간 실패 시 재업로드가 skip 되지 않도록)
+    sb.table("manual_docs").update({"file_sha256": file_sha256}).eq("id", doc_id).execute()
+    journal.finish(file_sha256)
+    notify_doc_changed(doc_id)
 
     return doc_id, total_chunks
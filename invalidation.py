@@ -0,0 +1,20 @@
+from typing import Callable, List
+
+# 문서 단위 캐시/인덱스 무효화 훅
+# - 적재/삭제 코드는 notify_doc_changed(doc_id) 만 호출하고,
+#   각 캐시는 on_doc_changed 로 자기 무효화 함수를 등록한다.
+_handlers: List[Callable[[int], None]] = []
+
+
+def on_doc_changed(fn: Callable[[int], None]) -> Callable[[int], None]:
+    if fn not in _handlers:
+        _handlers.append(fn)
+    return fn
+
+
+def notify_doc_changed(doc_id: int) -> None:
+    for fn in list(_handlers):
+        try:
+            fn(int(doc_id))
+        except Exception:
+            pass
@@ -0,0 +1,256 @@
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set
+
+import streamlit as st
+
+from clients import get_supabase_client
+from config import Settings
+from invalidation import on_doc_changed
+from tracing import span
+
+# 에러 코드 / 모델명: E-05, E05, CDR-10028, AB12 ...
+_CODE_RE = re.compile(r"(?<![0-9a-z])[a-z]{1,6}-?\d{1,6}(?:-[0-9a-z]+)*(?![0-9a-z])")
+
+# 코드만 묻는 질문에서 함께 쓰이는 일반 단어 (이것 외의 단어가 있으면 일반/혼합 질문)
+_CODE_FILLER_WORDS = {
+    "에러", "오류", "코드", "에러코드", "오류코드", "해결", "방법", "해결방법", "조치", "원인", "의미", "뜻",
+    "표시", "발생", "모델", "제품", "error", "code", "model", "뭐야", "무엇", "무엇인가요", "어떻게",
+}
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "").casefold()
+
+
+def extract_codes(text: str) -> List[str]:
+    """
+    질문/본문에서 에러 코드·모델명 형태의 토큰 추출 (소문자, 중복 제거)
+    """
+    return list(dict.fromkeys(_CODE_RE.findall(_normalize(text))))
+
+
+def is_exact_code_query(question: str) -> bool:
+    """
+    코드(에러 코드/모델명)와 일반 단어만으로 이루어진 질문인지 판정
+    예) "E-05", "E-05 에러 해결 방법", "CDR-10028" -> True
+    """
+    t = _normalize(question)
+    codes = _CODE_RE.findall(t)
+    if not codes:
+        return False
+    rest = _CODE_RE.sub(" ", t)
+    words = re.findall(r"\w+", rest)
+    return all(w in _CODE_FILLER_WORDS for w in words)
+
+
+def tokenize(text: str, ngram: int) -> List[str]:
+    """
+    BM25 용 토큰: 어절별 글자 n-gram (한국어 조사/어미 변화에 강함) + 코드 토큰 전체
+    """
+    t = _normalize(text)
+    terms: List[str] = [f"#{c}" for c in _CODE_RE.findall(t)]
+    for word in re.findall(r"\w+", t):
+        if len(word) <= ngram:
+            terms.append(word)
+        else:
+            terms.extend(word[i:i + ngram] for i in range(len(word) - ngram + 1))
+    return terms
+
+
+class LexicalIndex:
+    """
+    rag_chunks content 에 대한 in-memory BM25 역색인
+    - rag_chunks 의 id 증가분만 가져오는 증분 sync, 문서가 바뀌면 그 문서만 다시 색인
+    """
+
+    def __init__(self, sb, ngram: int = 2, sync_interval_s: float = 30.0, k1: float = 1.2, b: float = 0.75):
+        self.sb = sb
+        self.ngram = ngram
+        self.sync_interval_s = sync_interval_s
+        self.k1 = k1
+        self.b = b
+
+        self._lock = threading.Lock()
+        self._last_sync = 0.0
+        self._dirty_docs: Set[int] = set()
+        self._max_id = -1
+        self._chunks: Dict[int, Dict[str, Any]] = {}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._total_len = 0
+
+    # ---------- sync ----------
+    def invalidate_doc(self, doc_id: int) -> None:
+        with self._lock:
+            self._dirty_docs.add(int(doc_id))
+            self._last_sync = 0.0
+
+    def _fetch(self, *, after_id: Optional[int] = None, doc_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        page_size = 1000
+        last_id = after_id if after_id is not None else -1
+        while True:
+            q = (
+                self.sb.table("rag_chunks")
+                .select("id,doc_id,page_number,chunk_index,content,is_toc")
+                .gt("id", last_id)
+            )
+            if doc_id is not None:
+                q = q.eq("doc_id", doc_id)
+            with span("supabase.select.rag_chunks") as sp:
+                res = q.order("id").limit(page_size).execute()
+                sp.set(rows=len(res.data or []))
+            batch = res.data or []
+            rows.extend(batch)
+            if len(batch) < page_size:
+                return rows
+            last_id = int(batch[-1]["id"])
+
+    def _add(self, row: Dict[str, Any]) -> None:
+        cid = int(row["id"])
+        if cid in self._chunks:
+            self._remove(cid)
+        tf = Counter(tokenize(row["content"], self.ngram))
+        length = sum(tf.values())
+        self._chunks[cid] = {
+            "id": cid,
+            "doc_id": int(row["doc_id"]),
+            "page_number": int(row["page_number"]),
+            "chunk_index": int(row["chunk_index"]),
+            "content": row["content"],
+            "is_toc": bool(row.get("is_toc")),
+            "tf": tf,
+            "len": length,
+        }
+        self._total_len += length
+        for term, n in tf.items():
+            self._postings.setdefault(term, {})[cid] = n
+        self._max_id = max(self._max_id, cid)
+
+    def _remove(self, cid: int) -> None:
+        ch = self._chunks.pop(cid)
+        self._total_len -= ch["len"]
+        for term in ch["tf"]:
+            plist = self._postings.get(term)
+            if plist is not None:
+                plist.pop(cid, None)
+                if not plist:
+                    del self._postings[term]
+
+    def sync(self, force: bool = False) -> int:
+        with self._lock:
+            if not force and time.time() - self._last_sync < self.sync_interval_s:
+                return 0
+            dirty = set(self._dirty_docs)
+            self._dirty_docs.clear()
+            max_id = self._max_id
+
+        added: List[Dict[str, Any]] = []
+        for d in dirty:
+            added.extend(self._fetch(doc_id=d))
+        added.extend(r for r in self._fetch(after_id=max_id) if int(r["doc_id"]) not in dirty)
+
+        with self._lock:
+            for cid in [c for c, ch in self._chunks.items() if ch["doc_id"] in dirty]:
+                self._remove(cid)
+            for r in added:
+                self._add(r)
+            self._last_sync = time.time()
+        return len(added)
+
+    # ---------- search ----------
+    def search(self, query: str, top_k: int, doc_id_filter: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        BM25 상위 top_k chunk. 각 row 에 "score"(BM25) 와
+        "exact_code"(질문의 코드가 본문에 독립된 코드 토큰으로 들어있는지) 포함
+        """
+        try:
+            self.sync()
+        except Exception:
+            if not self._chunks:
+                raise
+
+        terms = tokenize(query, self.ngram)
+        codes = extract_codes(query)
+        with self._lock:
+            n_docs = len(self._chunks)
+            if not n_docs or not terms:
+                return []
+            avg_len = self._total_len / n_docs
+            scores: Dict[int, float] = {}
+            for term, qtf in Counter(terms).items():
+                plist = self._postings.get(term)
+                if not plist:
+                    continue
+                idf = math.log(1.0 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+                for cid, tf in plist.items():
+                    ch = self._chunks[cid]
+                    if ch["is_toc"] or (doc_id_filter is not None and ch["doc_id"] != doc_id_filter):
+                        continue
+                    denom = tf + self.k1 * (1 - self.b + self.b * ch["len"] / avg_len)
+                    scores[cid] = scores.get(cid, 0.0) + qtf * idf * tf * (self.k1 + 1) / denom
+
+            best = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+            rows = []
+            for cid, score in best:
+                ch = self._chunks[cid]
+                rows.append(
+                    {
+                        "id": ch["id"],
+                        "doc_id": ch["doc_id"],
+                        "page_number": ch["page_number"],
+                        "chunk_index": ch["chunk_index"],
+                        "content": ch["content"],
+                        "score": score,
+                        # 본문에서 경계 단위로 추출한 코드 term 과 비교 (부분 문자열 X: "e-5" 가 "e-50" 에 매칭되지 않게)
+                        "exact_code": bool(codes) and all(f"#{c}" in ch["tf"] for c in codes),
+                    }
+                )
+        return rows
+
+
+def reciprocal_rank_fusion(
+    vector_rows: List[Dict[str, Any]],
+    lexical_rows: List[Dict[str, Any]],
+    top_k: int,
+    k: int = 60,
+) -> List[Dict[str, Any]]:
+    """
+    벡터 / 어휘 검색 결과를 RRF 로 합침 (score = Σ 1 / (k + rank))
+    - similarity 는 벡터 검색 값을 유지, 어휘 검색에만 나온 chunk 는 벡터 결과의 최저 similarity 로 채움
+      (top1 similarity / 관련 페이지 컷이 어휘 점수 때문에 올라가지 않도록)
+    """
+    fused: Dict[int, Dict[str, Any]] = {}
+    scores: Dict[int, float] = {}
+    for rows in (vector_rows, lexical_rows):
+        for rank, r in enumerate(rows, start=1):
+            cid = int(r["id"])
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (k + rank)
+            fused.setdefault(cid, dict(r))
+
+    floor_sim = min((float(r.get("similarity", -1.0)) for r in vector_rows), default=-1.0)
+    out = []
+    for cid in sorted(scores, key=lambda c: scores[c], reverse=True)[:top_k]:
+        r = fused[cid]
+        r.setdefault("similarity", floor_sim)
+        r["rrf_score"] = scores[cid]
+        out.append(r)
+    return out
+
+
+@st.cache_resource
+def _open_lexical_index(ngram: int, sync_interval_s: float, _sb) -> LexicalIndex:
+    index = LexicalIndex(_sb, ngram=ngram, sync_interval_s=sync_interval_s)
+    on_doc_changed(index.invalidate_doc)
+    return index
+
+
+def get_lexical_index(settings: Settings) -> Optional[LexicalIndex]:
+    if not settings.lexical_enabled:
+        return None
+    sb = get_supabase_client(settings.supabase_url, settings.supabase_service_key)
+    return _open_lexical_index(settings.lexical_ngram, settings.lexical_sync_interval_s, sb)
@@ -0,0 +1,96 @@
+from typing import Any, Dict, List, Set
+
+import streamlit as st
+
+from config import Settings
+from invalidation import on_doc_changed
+from memory_cache import TTLLRUCache
+from tracing import cache_event, span
+
+
+class MetadataCache:
+    """
+    read-through 메타데이터 캐시 (서버 프로세스 내 모든 세션이 공유)
+    - 문서별 페이지 테이블: {page_number: {"image_url", "thumb_url", "is_toc"}} 를 한 번의 조회로 로드
+    - 문서 카탈로그: list_docs 결과 (tombstone 된 문서 제외) + 삭제 중인 문서 id 집합
+    - 적재/삭제 시 notify_doc_changed 로 해당 문서 테이블과 카탈로그 무효화
+    """
+
+    _CATALOG_KEY = "catalog"
+
+    def __init__(self, max_docs: int, ttl_s: float):
+        self._pages = TTLLRUCache(max_docs, ttl_s)
+        self._catalog = TTLLRUCache(1, ttl_s)
+
+    def page_table(self, sb, doc_id: int) -> Dict[int, Dict[str, Any]]:
+        table = self._pages.get(int(doc_id))
+        cache_event("page_table", "hit" if table is not None else "miss")
+        if table is not None:
+            return table
+
+        table = {}
+        page_size = 1000
+        start = 0
+        while True:
+            with span("supabase.select.manual_pages") as sp:
+                res = (
+                    sb.table("manual_pages")
+                    .select("page_number,image_url,thumb_url,is_toc")
+                    .eq("doc_id", doc_id)
+                    .order("page_number")
+                    .range(start, start + page_size - 1)
+                    .execute()
+                )
+                rows = res.data or []
+                sp.set(rows=len(rows))
+            for r in rows:
+                table[int(r["page_number"])] = r
+            if len(rows) < page_size:
+                break
+            start += page_size
+
+        self._pages.put(int(doc_id), table)
+        return table
+
+    def _all_docs(self, sb) -> List[Dict[str, Any]]:
+        docs = self._catalog.get(self._CATALOG_KEY)
+        cache_event("doc_catalog", "hit" if docs is not None else "miss")
+        if docs is None:
+            with span("supabase.select.manual_docs") as sp:
+                res = (
+                    sb.table("manual_docs")
+                    .select("id,title,created_at,deleted_at")
+                    .order("created_at", desc=True)
+                    .execute()
+                )
+                docs = res.data or []
+                sp.set(rows=len(docs))
+            self._catalog.put(self._CATALOG_KEY, docs)
+        return docs
+
+    def doc_catalog(self, sb) -> List[Dict[str, Any]]:
+        return [d for d in self._all_docs(sb) if not d.get("deleted_at")]
+
+    def deleted_doc_ids(self, sb) -> Set[int]:
+        """
+        tombstone 은 기록됐지만 아직 purge 가 끝나지 않은 문서
+        """
+        return {int(d["id"]) for d in self._all_docs(sb) if d.get("deleted_at")}
+
+    def invalidate_doc(self, doc_id: int) -> None:
+        self._pages.pop(int(doc_id))
+        self._catalog.clear()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {"pages": self._pages.stats(), "catalog": self._catalog.stats()}
+
+
+@st.cache_resource
+def _open_metadata_cache(max_docs: int, ttl_s: float) -> MetadataCache:
+    cache = MetadataCache(max_docs, ttl_s)
+    on_doc_changed(cache.invalidate_doc)
+    return cache
+
+
+def get_metadata_cache(settings: Settings) -> MetadataCache:
+    return _open_metadata_cache(settings.metadata_cache_max_docs, settings.metadata_cache_ttl_s)
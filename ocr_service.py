@@ -1,9 +1,21 @@
 import base64
+import hashlib
+from io import BytesIO
+from typing import Optional, Tuple
+
+import streamlit as st
 from openai import OpenAI
+from PIL import Image
+
+from config import Settings
+from disk_cache import SqliteCache
+from tracing import cache_event, span, usage_attrs
 from utils_text import normalize_vertical_text
 
+OCR_MODEL = "gpt-4.1-mini"
 
-def extract_text_from_image_gpt41mini(client: OpenAI, image_bytes: bytes, mime: str) -> str:
+
+def extract_text_from_image_gpt41mini(client: OpenAI, image_bytes: bytes, mime: str, model: str = OCR_MODEL) -> str:
     """
     gpt-4.1-mini 기반 OCR
     - data URL(image_url)로 전달 (image_base64 사용 X)
@@ -12,27 +24,116 @@ def extract_text_from_image_gpt41mini(client: OpenAI, image_bytes: bytes, mime:
     b64 = base64.b64encode(image_bytes).decode("utf-8")
     image_url = f"data:{mime};base64,{b64}"
 
-    resp = client.responses.create(
-        model="gpt-4.1-mini",
-        input=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "input_text",
-                        "text": (
-                            "이 이미지에서 보이는 모든 텍스트를 추출하되, "
-                            "세로로 배치된 글자들은 사람이 읽기 쉬운 가로 문장으로 재구성해줘. "
-                            "의미 없는 한 글자씩의 줄바꿈은 제거하고, "
-                            "자연스러운 문장 단위로 공백을 사용해 표현해줘. "
-                            "추가 설명 없이 결과 텍스트만 출력해."
-                        )
-                    },
-                    {"type": "input_image", "image_url": image_url},
-                ],
-            }
-        ],
-    )
+    with span("openai.ocr", bytes_out=len(image_bytes)) as sp:
+        resp = client.responses.create(
+            model=model,
+            input=[
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "input_text",
+                            "text": (
+                                "이 이미지에서 보이는 모든 텍스트를 추출하되, "
+                                "세로로 배치된 글자들은 사람이 읽기 쉬운 가로 문장으로 재구성해줘. "
+                                "의미 없는 한 글자씩의 줄바꿈은 제거하고, "
+                                "자연스러운 문장 단위로 공백을 사용해 표현해줘. "
+                                "추가 설명 없이 결과 텍스트만 출력해."
+                            )
+                        },
+                        {"type": "input_image", "image_url": image_url},
+                    ],
+                }
+            ],
+        )
+        sp.set(**usage_attrs(getattr(resp, "usage", None)))
 
     raw = (resp.output_text or "").strip()
     return normalize_vertical_text(raw)
+
+
+def resize_image_bytes(image_bytes: bytes, max_px: int) -> bytes:
+    """
+    긴 변을 max_px 이하로 축소 (비율 유지, 원본 포맷 최대한 유지). 실패하면 원본 그대로
+    """
+    try:
+        pil_img = Image.open(BytesIO(image_bytes))
+        pil_img.thumbnail((max_px, max_px), Image.LANCZOS)
+
+        buf = BytesIO()
+        # 원본 포맷을 최대한 유지 (없으면 PNG)
+        save_format = (pil_img.format or "PNG").upper()
+        if save_format not in ("PNG", "JPEG", "JPG", "WEBP"):
+            save_format = "PNG"
+
+        # JPEG로 저장할 때는 RGB 필요할 수 있음
+        if save_format in ("JPEG", "JPG") and pil_img.mode in ("RGBA", "P"):
+            pil_img = pil_img.convert("RGB")
+
+        pil_img.save(buf, format=save_format)
+        return buf.getvalue()
+    except Exception:
+        return image_bytes
+
+
+class OcrCache:
+    """
+    (OCR 모델, 축소 px, sha256(업로드 원본 바이트)) 를 키로 하는 OCR 결과 캐시
+    - 원본 바이트 기준이므로 캐시 히트 시 이미지 디코딩/축소를 하지 않음
+    - SQLite 에 저장되어 사용자/세션/재시작 간 공유 (같은 표준 에러 화면 사진이 반복되는 경우)
+    """
+
+    def __init__(self, store: SqliteCache):
+        self.store = store
+
+    @staticmethod
+    def make_key(model: str, resize_max_px: int, digest: str) -> str:
+        return f"{model}:{int(resize_max_px)}:{digest}"
+
+    def get(self, model: str, resize_max_px: int, digest: str) -> Optional[str]:
+        blob = self.store.get(self.make_key(model, resize_max_px, digest))
+        return blob.decode("utf-8") if blob is not None else None
+
+    def put(self, model: str, resize_max_px: int, digest: str, text: str) -> None:
+        self.store.put(self.make_key(model, resize_max_px, digest), (text or "").encode("utf-8"))
+
+    def stats(self):
+        return self.store.stats()
+
+
+@st.cache_resource
+def _open_ocr_cache(path: str, max_entries: int) -> OcrCache:
+    return OcrCache(SqliteCache(path, max_entries))
+
+
+def get_ocr_cache(settings: Settings) -> Optional[OcrCache]:
+    if not settings.ocr_cache_enabled:
+        return None
+    return _open_ocr_cache(settings.ocr_cache_path, settings.ocr_cache_max_entries)
+
+
+def image_digest(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def cached_ocr(
+    settings: Settings, client: OpenAI, image_bytes: bytes, mime: str, resize_max_px: int
+) -> Tuple[str, bool]:
+    """
+    업로드 원본 바이트 해시로 OCR 캐시를 먼저 조회하고, 없을 때만 축소 → OCR → 캐시 저장
+    return: (OCR 텍스트, 캐시 히트 여부)
+    """
+    cache = get_ocr_cache(settings)
+    digest = image_digest(image_bytes)
+    if cache:
+        text = cache.get(settings.ocr_model, resize_max_px, digest)
+        cache_event("ocr", "hit" if text is not None else "miss")
+        if text is not None:
+            return text, True
+
+    with span("image.resize", bytes_in=len(image_bytes)):
+        resized = resize_image_bytes(image_bytes, resize_max_px)
+    text = extract_text_from_image_gpt41mini(client, resized, mime, model=settings.ocr_model)
+    if cache:
+        cache.put(settings.ocr_model, resize_max_px, digest, text)
+    return text, False
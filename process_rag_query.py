@@ -1,37 +1,95 @@
-from retrieval_service import retrieve_contexts
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+import streamlit as st
+
+from retrieval_service import retrieve_contexts, embed_query, prefetch_page_images
 from clients import get_openai_client
-from answer_service import openai_answer_with_rag
-from utils_text import is_refusal_answer, merge_pages_cited_then_search
+from answer_service import openai_answer_with_rag, openai_answer_with_rag_stream
+from answer_cache import get_answer_cache, answer_cache_scope
+from lexical_index import is_exact_code_query
+from tracing import cache_event, span
+from utils_text import is_refusal_answer, merge_pages_cited_then_search, normalize_question
 
-def process_rag_query(settings, question, doc_id_filter=None):
+REFUSAL_ANSWER = "문서에 존재하지 않습니다."
+
+
+@st.cache_resource
+def _get_prefetch_executor(workers: int) -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-prefetch")
+
+
+class _PagePrefetch:
     """
-    RAG 검색, 답변 생성, 임계값 검증 및 관련 페이지 추출을 처리하는 핵심 로직
+    검색 직후 관련 페이지 후보(contexts 의 모든 페이지) 메타데이터를 백그라운드로 미리 조회
+    - LLM 이 답변을 생성하는 동안 실행되어 get_related_pages 는 캐시만 읽게 됨
+    - 범위 외/거절로 끝나면 cancel() 로 아직 시작 안 한 작업은 취소, 진행 중인 작업은 남은 문서를 건너뜀
+    """
+
+    def __init__(self, settings, contexts):
+        self._cancel = threading.Event()
+        self._future = None
+        if settings.query_prefetch_workers > 0 and contexts:
+            self._future = _get_prefetch_executor(settings.query_prefetch_workers).submit(
+                prefetch_page_images, settings, contexts, self._cancel
+            )
+
+    def cancel(self) -> None:
+        self._cancel.set()
+        if self._future is not None:
+            self._future.cancel()
+
+
+def _lookup_and_retrieve(settings, question, doc_id_filter):
+    """
+    답변 캐시 조회 → (미스면) 질문 임베딩 + 검색 → 관련 페이지 메타데이터 선조회 시작
+    return: dict(cache, scope, norm_question, hit, q_emb, contexts, top1_similarity, prefetch)
     """
+    # 0. 답변 캐시 (정확 일치 → 유사 질문)
+    cache = get_answer_cache(settings)
+    scope = answer_cache_scope(settings, doc_id_filter)
+    norm_question = normalize_question(question)
+    state = {"cache": cache, "scope": scope, "norm_question": norm_question, "hit": None, "q_emb": None}
+    if cache:
+        with span("answer_cache"):
+            state["hit"] = cache.get_exact(scope, norm_question)
+        if state["hit"] is not None:
+            cache_event("answer", "exact")
+            return state
+
+    oai = get_openai_client(settings.openai_api_key)
+
+    # 코드만 묻는 질문은 어휘 색인으로 바로 찾으므로 임베딩(유사 질문 캐시 포함)을 건너뜀
+    if not (settings.lexical_enabled and is_exact_code_query(question)):
+        with span("embed"):
+            state["q_emb"] = embed_query(settings, oai, question)
+        if cache:
+            with span("answer_cache"):
+                state["hit"] = cache.get_similar(scope, norm_question, state["q_emb"])
+            if state["hit"] is not None:
+                cache_event("answer", "semantic")
+                return state
+    if cache:
+        cache_event("answer", "miss")
+
     # 1. 검색 (Retrieve)
-    contexts, top1_similarity = retrieve_contexts(settings, question, doc_id_filter=doc_id_filter)
-    
-    # 2. 범위 외 확인 (Out of Scope)
-    out_of_scope = (not contexts) or (top1_similarity < settings.similarity_threshold)
-    
-    cited_pages = []
-    answer = ""
-    
-    if out_of_scope:
-        answer = "문서에 존재하지 않습니다."
-    else:
-        # 3. 답변 생성 (Generate)
-        oai = get_openai_client(settings.openai_api_key)
-        out = openai_answer_with_rag(oai, settings.chat_model, question, contexts)
-        answer = out["answer"]
-        cited_pages = out.get("cited_pages", [])
+    with span("retrieve") as sp:
+        state["contexts"], state["top1_similarity"] = retrieve_contexts(
+            settings, question, doc_id_filter=doc_id_filter, query_embedding=state["q_emb"]
+        )
+        sp.set(rows=len(state["contexts"]), top1_similarity=round(state["top1_similarity"], 4))
+    state["prefetch"] = _PagePrefetch(settings, state["contexts"])
+    return state
 
-        # 4. 보수적 검증 (Threshold + 0.02)
-        if ("문서에 존재하지 않습니다" not in answer) and (top1_similarity < (settings.similarity_threshold + 0.02)):
-            answer = "문서에 존재하지 않습니다."
-            cited_pages = []
+
+def _finalize_result(settings, state, doc_id_filter, answer, cited_pages) -> Dict[str, Any]:
+    contexts = state["contexts"]
+    top1_similarity = state["top1_similarity"]
 
     # 5. 관련 페이지 및 문서 ID 정리
     if is_refusal_answer(answer):
+        state["prefetch"].cancel()
         related_pages = []
         resolved_doc_id = None
     else:
@@ -44,13 +102,124 @@ def process_rag_query(settings, question, doc_id_filter=None):
             max_drop=0.08,
         )
         resolved_doc_id = (
-            doc_id_filter if doc_id_filter is not None 
+            doc_id_filter if doc_id_filter is not None
             else (int(contexts[0]["doc_id"]) if contexts else None)
         )
 
-    return {
+    result = {
         "answer": answer,
         "related_pages": related_pages,
         "resolved_doc_id": resolved_doc_id,
         "top1_similarity": top1_similarity
-    }
\ No newline at end of file
+    }
+    if state["cache"]:
+        state["cache"].put(
+            state["scope"], state["norm_question"], state["q_emb"], result, doc_ids=[c["doc_id"] for c in contexts]
+        )
+    return result
+
+
+def process_rag_query(settings, question, doc_id_filter=None):
+    """
+    RAG 검색, 답변 생성, 임계값 검증 및 관련 페이지 추출을 처리하는 핵심 로직
+    - 같은(정규화 기준) 질문 또는 임베딩이 거의 같은 질문의 결과가 캐시에 있으면 바로 반환
+    - 단계별 span: answer_cache / embed / retrieve / generate (tracing.start_trace 안에서 호출하면 요청별로 수집)
+    """
+    state = _lookup_and_retrieve(settings, question, doc_id_filter)
+    if state["hit"] is not None:
+        return state["hit"]
+    contexts = state["contexts"]
+    top1_similarity = state["top1_similarity"]
+
+    # 2. 범위 외 확인 (Out of Scope)
+    out_of_scope = (not contexts) or (top1_similarity < settings.similarity_threshold)
+
+    cited_pages = []
+    answer = ""
+
+    if out_of_scope:
+        state["prefetch"].cancel()
+        answer = REFUSAL_ANSWER
+    else:
+        # 3. 답변 생성 (Generate)
+        oai = get_openai_client(settings.openai_api_key)
+        with span("generate"):
+            out = openai_answer_with_rag(
+                oai, settings.chat_model, question, contexts, max_context_tokens=settings.context_max_tokens
+            )
+        answer = out["answer"]
+        cited_pages = out.get("cited_pages", [])
+
+        # 4. 보수적 검증 (Threshold + 0.02)
+        if ("문서에 존재하지 않습니다" not in answer) and (top1_similarity < (settings.similarity_threshold + 0.02)):
+            answer = REFUSAL_ANSWER
+            cited_pages = []
+
+    return _finalize_result(settings, state, doc_id_filter, answer, cited_pages)
+
+
+class RagAnswerStream:
+    """
+    process_rag_query_stream 결과
+    - 반복하면 답변 텍스트 조각을 yield (st.write_stream 에 그대로 전달)
+    - 반복이 끝나면 result 에 process_rag_query 와 같은 형태의 dict
+    - rerun / 예외로 중간에 끊겨도 result 는 채움: 그때까지 흘려보낸 답변만 담고 관련 페이지 없음, 답변 캐시 X
+    """
+
+    def __init__(self, chunks: Iterable[str], finalize: Callable[[], Dict[str, Any]], top1_similarity: float = 0.0):
+        self._chunks = chunks
+        self._finalize = finalize
+        self._top1_similarity = top1_similarity
+        self.result: Optional[Dict[str, Any]] = None
+
+    def __iter__(self) -> Iterator[str]:
+        emitted = []
+        completed = False
+        try:
+            with span("generate"):
+                for chunk in self._chunks:
+                    emitted.append(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if self.result is None:
+                self.result = self._finalize() if completed else {
+                    "answer": "".join(emitted).strip() or REFUSAL_ANSWER,
+                    "related_pages": [],
+                    "resolved_doc_id": None,
+                    "top1_similarity": self._top1_similarity,
+                }
+
+
+def process_rag_query_stream(settings, question, doc_id_filter=None) -> RagAnswerStream:
+    """
+    process_rag_query 의 스트리밍 버전
+    - 캐시 조회 / 검색까지는 호출 시점에 끝내고, 답변 생성만 스트리밍
+    - 캐시 히트 / 범위 외 질문은 완성된 답변 하나를 그대로 yield
+    - 보수적 검증(Threshold + 0.02)은 top1 similarity 만으로 결정되므로 생성 전에 적용
+      (이미 화면에 흘려보낸 답변을 거절로 바꾸지 않도록)
+    """
+    state = _lookup_and_retrieve(settings, question, doc_id_filter)
+    hit = state["hit"]
+    if hit is not None:
+        return RagAnswerStream([hit["answer"]], lambda: hit)
+
+    contexts = state["contexts"]
+    top1_similarity = state["top1_similarity"]
+    if (not contexts) or (top1_similarity < settings.similarity_threshold + 0.02):
+        state["prefetch"].cancel()
+        return RagAnswerStream(
+            [REFUSAL_ANSWER], lambda: _finalize_result(settings, state, doc_id_filter, REFUSAL_ANSWER, [])
+        )
+
+    oai = get_openai_client(settings.openai_api_key)
+    stream = openai_answer_with_rag_stream(
+        oai, settings.chat_model, question, contexts, max_context_tokens=settings.context_max_tokens
+    )
+    return RagAnswerStream(
+        stream,
+        lambda: _finalize_result(
+            settings, state, doc_id_filter, stream.result["answer"], stream.result["cited_pages"]
+        ),
+        top1_similarity=top1_similarity,
+    )
@@ -1,5 +1,6 @@
 import streamlit as st
-from retrieval_service import  get_page_image_url
+from retrieval_service import get_pages_images
+from tracing import span
 
 def render_related_pages(pages):
     if len(pages) < 1:
@@ -20,13 +21,15 @@ def render_related_pages(pages):
                     if url == "":
                         st.write(f"p.{p} 이미지 없음")
                     else:
-                        st.image(url, caption=f"p.{p}", width="stretch")
+                        # 그리드에는 썸네일만 로드하고, 원본은 링크를 눌렀을 때만 받는다
+                        st.image(item.get("thumb_url") or url, caption=f"p.{p}", width="stretch")
+                        st.markdown(f"[원본 보기]({url})")
 
 
 def get_related_pages(settings, resolved_doc_id, related_pages, max_pages=6):
     """
     관련 페이지 이미지를 최대 max_pages까지 3열 그리드로 표시하고,
-    [{"page": p, "url": url}, ...] 형태로 반환한다.
+    [{"page": p, "url": url, "thumb_url": thumb_url}, ...] 형태로 반환한다.
     url 이 없는 경우 "" 로 대체한다.
     """
     results = []
@@ -37,19 +40,21 @@ def get_related_pages(settings, resolved_doc_id, related_pages, max_pages=6):
     # st.caption(f"관련 페이지 (최대 {max_pages}페이지, 페이지 순)")
 
     pages = related_pages[:max_pages]
+    with span("related_pages", pages=len(pages)):
+        images_by_page = get_pages_images(settings, resolved_doc_id, [int(p) for p in pages])
 
     for row_start in range(0, len(pages), 3):
         row_pages = pages[row_start:row_start + 3]
         # cols = st.columns(3)
 
         for idx, p in enumerate(row_pages):
-            url = get_page_image_url(settings, resolved_doc_id, int(p))
-            if url:
+            images = images_by_page.get(int(p))
+            if images:
                 # st.image(url, caption=f"p.{p}", width="stretch")
-                results.append({"page": p, "url": url})
+                results.append({"page": p, "url": images["url"], "thumb_url": images["thumb_url"]})
             else:
                 # st.write(f"p.{p} 이미지 없음")
-                results.append({"page": p, "url": ""})
+                results.append({"page": p, "url": "", "thumb_url": ""})
                 
 
     return results
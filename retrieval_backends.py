@@ -0,0 +1,470 @@
+import json
+import os
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import streamlit as st
+
+from clients import get_supabase_client
+from config import Settings
+from tracing import span
+from invalidation import on_doc_changed
+
+
+def embedding_to_pgvector_str(emb: List[float]) -> str:
+    return "[" + ",".join(f"{x:.8f}" for x in emb) + "]"
+
+
+def parse_pgvector(value: Any) -> List[float]:
+    """
+    PostgREST 가 돌려주는 pgvector 값("[0.1,0.2,...]" 문자열 또는 list)을 float list 로 변환
+    """
+    if isinstance(value, str):
+        return json.loads(value)
+    return list(value or [])
+
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def quantize_int8(vecs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    차원별 scale 을 쓰는 int8 scalar quantization (4배 압축)
+    return: (codes[n, d] int8, scale[d] float32), 복원값 ≈ codes * scale / 127
+    """
+    scale = np.maximum(np.abs(vecs).max(axis=0), 1e-12).astype(np.float32) if len(vecs) else np.ones(vecs.shape[1], np.float32)
+    codes = np.round(np.asarray(vecs) / scale * 127.0).astype(np.int8)
+    return codes, scale
+
+
+def quantize_binary(vecs: np.ndarray) -> np.ndarray:
+    """
+    부호 비트만 남기는 1-bit quantization (32배 압축), return: packed codes[n, d/8] uint8
+    """
+    return np.packbits(np.asarray(vecs) > 0, axis=1)
+
+
+def approx_scores(mode: str, codes: np.ndarray, scale: Optional[np.ndarray], q: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    quantized 코드로 근사 점수 계산 (클수록 유사)
+    - int8: 복원 벡터와의 내적, 한 번에 큰 float 행렬이 생기지 않도록 블록 단위 계산
+    - binary: -(hamming distance)
+    """
+    if mode == "int8":
+        qs = (q * scale / 127.0).astype(np.float32)
+        out = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), 65536):
+            part = rows[start:start + 65536]
+            out[start:start + len(part)] = codes[part].astype(np.float32) @ qs
+        return out
+    qbits = np.packbits(q > 0)
+    return -_POPCOUNT[np.bitwise_xor(codes[rows], qbits)].sum(axis=1, dtype=np.int32).astype(np.float32)
+
+
+class RetrievalBackend:
+    """
+    chunk 벡터 검색 백엔드 인터페이스
+    search() 는 similarity 내림차순으로
+    [{"id", "doc_id", "page_number", "chunk_index", "content", "similarity"}, ...] 를 반환한다.
+    is_toc 인 chunk 는 제외하고, doc_id_filter 가 있으면 그 문서 안에서만 검색한다.
+    search_docs() 는 여러 문서(문서 라우팅 결과) 안에서만 검색한다.
+    """
+
+    def search(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        doc_id_filter: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def search_docs(self, query_embedding: List[float], top_k: int, doc_ids: List[int]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+
+class SupabaseRpcBackend(RetrievalBackend):
+    """
+    Supabase match_rag_chunks_v3 RPC (pgvector) 검색
+    search_docs 는 match_rag_chunks_docs RPC (doc_ids bigint[]) 한 번으로 여러 문서를 검색
+    """
+
+    def __init__(self, sb):
+        self.sb = sb
+
+    def search(self, query_embedding, top_k, doc_id_filter=None):
+        payload = {
+            "query_embedding": embedding_to_pgvector_str(query_embedding),
+            "match_count": top_k,
+            "doc_id_filter": doc_id_filter,
+        }
+        with span("supabase.rpc.match_rag_chunks_v3", bytes_out=len(payload["query_embedding"])) as sp:
+            res = self.sb.rpc("match_rag_chunks_v3", payload).execute()
+            sp.set(rows=len(res.data or []))
+        return res.data or []
+
+    def search_docs(self, query_embedding, top_k, doc_ids):
+        payload = {
+            "query_embedding": embedding_to_pgvector_str(query_embedding),
+            "match_count": top_k,
+            "doc_ids": [int(d) for d in doc_ids],
+        }
+        with span("supabase.rpc.match_rag_chunks_docs", bytes_out=len(payload["query_embedding"])) as sp:
+            res = self.sb.rpc("match_rag_chunks_docs", payload).execute()
+            sp.set(rows=len(res.data or []))
+        return res.data or []
+
+
+class LocalVectorIndex(RetrievalBackend):
+    """
+    프로세스 내 벡터 인덱스
+    - 모든 chunk 임베딩을 정규화된 float32 연속 행렬 하나로 보관, 내적 한 번으로 top-k 계산
+    - index_dir 에 저장해 두고 재시작 시 memory-map 으로 로드
+    - rag_chunks 에서 id 증가분만 가져오는 증분 sync, 문서가 바뀌면 그 문서만 다시 로드
+    - sync 는 백그라운드 스레드에서 sync_interval_s 마다 + 적재/삭제 알림(invalidate_doc) 직후 실행
+      → 검색은 메모리의 인덱스만 읽음 (디스크 인덱스도 없는 첫 조회만 직접 sync)
+    """
+
+    _META_FIELDS = ("ids", "doc_ids", "page_numbers", "chunk_indexes", "is_toc")
+
+    def __init__(
+        self,
+        sb,
+        index_dir: str,
+        dims: int,
+        sync_interval_s: float = 30.0,
+        quantization: str = "none",
+        rerank_shortlist: int = 100,
+    ):
+        self.sb = sb
+        self.index_dir = index_dir
+        self.dims = dims
+        self.sync_interval_s = sync_interval_s
+        # quantization: "none" / "int8" / "binary"
+        # int8/binary 이면 RAM 에는 코드만 두고, 원본 float32 는 memory-map 으로 shortlist 재정렬에만 사용
+        self.quantization = quantization
+        self.rerank_shortlist = rerank_shortlist
+        self.codes: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+
+        self._lock = threading.Lock()
+        # check → fetch → merge 전체를 한 번에 하나만 (동시에 같은 row 를 두 번 가져와 붙이지 않도록)
+        self._sync_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._sync_thread: Optional[threading.Thread] = None
+        self._last_sync = 0.0
+        self._synced = False
+        self._dirty_docs: Set[int] = set()
+
+        self.vecs = np.zeros((0, dims), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int64)
+        self.page_numbers = np.zeros(0, dtype=np.int32)
+        self.chunk_indexes = np.zeros(0, dtype=np.int32)
+        self.is_toc = np.zeros(0, dtype=bool)
+        self.contents: List[str] = []
+        self._load()
+        self._synced = bool(len(self.ids))
+        self._quantize()
+
+    # ---------- persistence ----------
+    def _paths(self) -> Dict[str, str]:
+        return {
+            "vecs": os.path.join(self.index_dir, "vectors.f32.npy"),
+            "meta": os.path.join(self.index_dir, "meta.npz"),
+            "contents": os.path.join(self.index_dir, "contents.json"),
+        }
+
+    def _load(self) -> None:
+        paths = self._paths()
+        if not all(os.path.exists(p) for p in paths.values()):
+            return
+        try:
+            vecs = np.load(paths["vecs"], mmap_mode="r")
+            meta = np.load(paths["meta"])
+            with open(paths["contents"], "r", encoding="utf-8") as f:
+                contents = json.load(f)
+        except Exception:
+            return
+        if vecs.ndim != 2 or vecs.shape[1] != self.dims or len(contents) != vecs.shape[0]:
+            return
+        self.vecs = vecs
+        for name in self._META_FIELDS:
+            setattr(self, name, meta[name])
+        self.contents = contents
+
+    def _save(self) -> None:
+        os.makedirs(self.index_dir, exist_ok=True)
+        paths = self._paths()
+        # 저장 중 읽는 쪽이 깨진 파일을 보지 않도록 임시 파일에 쓰고 교체
+        with open(paths["vecs"] + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(self.vecs))
+        with open(paths["meta"] + ".tmp", "wb") as f:
+            np.savez(f, **{name: getattr(self, name) for name in self._META_FIELDS})
+        with open(paths["contents"] + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.contents, f, ensure_ascii=False)
+        for p in paths.values():
+            os.replace(p + ".tmp", p)
+
+    def _quantize(self) -> None:
+        if self.quantization == "int8":
+            self.codes, self.scale = quantize_int8(self.vecs)
+        elif self.quantization == "binary":
+            self.codes, self.scale = quantize_binary(self.vecs), None
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """
+        검색에 상주하는 벡터 메모리 (quantized 이면 코드만, 원본은 memory-map)
+        """
+        full = int(self.vecs.shape[0] * self.dims * 4)
+        codes = int(self.codes.nbytes) if self.codes is not None else 0
+        resident = codes if self.quantization in ("int8", "binary") else full
+        return {"full_precision": full, "codes": codes, "resident": resident}
+
+    # ---------- sync ----------
+    def invalidate_doc(self, doc_id: int) -> None:
+        """
+        문서가 재적재/삭제되면 해당 문서 row 를 지우고 다음 sync 때 다시 로드
+        """
+        with self._lock:
+            self._dirty_docs.add(int(doc_id))
+            self._last_sync = 0.0
+        self._wakeup.set()
+
+    def start_background_sync(self) -> None:
+        if self._sync_thread is None:
+            self._sync_thread = threading.Thread(target=self._sync_loop, name="vector-index-sync", daemon=True)
+            self._sync_thread.start()
+
+    def _sync_loop(self) -> None:
+        while True:
+            try:
+                self.sync(force=True)
+            except Exception:
+                traceback.print_exc()
+            self._wakeup.wait(timeout=self.sync_interval_s)
+            self._wakeup.clear()
+
+    def _fetch(self, *, after_id: Optional[int] = None, doc_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        page_size = 1000
+        last_id = after_id if after_id is not None else -1
+        while True:
+            q = (
+                self.sb.table("rag_chunks")
+                .select("id,doc_id,page_number,chunk_index,content,embedding,is_toc")
+                .gt("id", last_id)
+            )
+            if doc_id is not None:
+                q = q.eq("doc_id", doc_id)
+            res = q.order("id").limit(page_size).execute()
+            batch = res.data or []
+            rows.extend(batch)
+            if len(batch) < page_size:
+                return rows
+            last_id = int(batch[-1]["id"])
+
+    def _keep(self, mask: np.ndarray) -> None:
+        self.vecs = np.ascontiguousarray(self.vecs[mask])
+        for name in self._META_FIELDS:
+            setattr(self, name, getattr(self, name)[mask])
+        self.contents = [c for c, m in zip(self.contents, mask) if m]
+
+    def _append(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        vecs = np.asarray([parse_pgvector(r["embedding"]) for r in rows], dtype=np.float32)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs = vecs / np.maximum(norms, 1e-12)
+        self.vecs = np.concatenate([np.asarray(self.vecs), vecs])
+        self.ids = np.concatenate([self.ids, np.asarray([int(r["id"]) for r in rows], dtype=np.int64)])
+        self.doc_ids = np.concatenate([self.doc_ids, np.asarray([int(r["doc_id"]) for r in rows], dtype=np.int64)])
+        self.page_numbers = np.concatenate(
+            [self.page_numbers, np.asarray([int(r["page_number"]) for r in rows], dtype=np.int32)]
+        )
+        self.chunk_indexes = np.concatenate(
+            [self.chunk_indexes, np.asarray([int(r["chunk_index"]) for r in rows], dtype=np.int32)]
+        )
+        self.is_toc = np.concatenate([self.is_toc, np.asarray([bool(r.get("is_toc")) for r in rows], dtype=bool)])
+        self.contents.extend(r["content"] for r in rows)
+
+    def sync(self, force: bool = False) -> int:
+        """
+        rag_chunks 의 새 row 와 무효화된 문서를 반영. 반환값: 추가된 row 수
+        - _sync_lock 을 잡은 채로 진행 (조회 실패 시 무효화 표시는 되돌려서 다음 sync 때 다시 시도)
+        """
+        with self._sync_lock:
+            with self._lock:
+                if not force and time.time() - self._last_sync < self.sync_interval_s:
+                    return 0
+                dirty = set(self._dirty_docs)
+                self._dirty_docs.clear()
+                max_id = int(self.ids.max()) if len(self.ids) else -1
+
+            try:
+                added: List[Dict[str, Any]] = []
+                for d in dirty:
+                    added.extend(self._fetch(doc_id=d))
+                new_rows = [r for r in self._fetch(after_id=max_id) if int(r["doc_id"]) not in dirty]
+                added.extend(new_rows)
+            except Exception:
+                with self._lock:
+                    self._dirty_docs |= dirty
+                raise
+
+            with self._lock:
+                if dirty:
+                    self._keep(~np.isin(self.doc_ids, list(dirty)))
+                known = set(self.ids.tolist()) if added else set()
+                self._append([r for r in added if int(r["id"]) not in known])
+                self._last_sync = time.time()
+                self._synced = True
+                if dirty or added:
+                    self._save()
+                    if self.quantization in ("int8", "binary"):
+                        # 원본은 다시 memory-map 으로 돌려서 RAM 에는 코드만 남김
+                        self.vecs = np.load(self._paths()["vecs"], mmap_mode="r")
+                    self._quantize()
+        return len(added)
+
+    # ---------- search ----------
+    def search(self, query_embedding, top_k, doc_id_filter=None):
+        return self._search(query_embedding, top_k, None if doc_id_filter is None else [doc_id_filter])
+
+    def search_docs(self, query_embedding, top_k, doc_ids):
+        return self._search(query_embedding, top_k, doc_ids)
+
+    def _search(self, query_embedding, top_k, doc_id_filters: Optional[List[int]]):
+        if not self._synced:
+            # 디스크 인덱스도 없는 첫 조회: 비어 있는 인덱스로 답하지 않도록 한 번은 직접 sync
+            # (백그라운드 첫 sync 가 진행 중이면 _sync_lock 에서 기다렸다가 주기 안이므로 바로 반환)
+            self.sync()
+
+        with self._lock:
+            vecs, doc_ids, is_toc = self.vecs, self.doc_ids, self.is_toc
+            ids, pages, cidx, contents = self.ids, self.page_numbers, self.chunk_indexes, self.contents
+            codes, scale = self.codes, self.scale
+
+        if not len(ids):
+            return []
+
+        q = np.asarray(query_embedding, dtype=np.float32)
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+
+        mask = ~is_toc
+        if doc_id_filters is not None:
+            mask &= np.isin(doc_ids, np.asarray(doc_id_filters, dtype=doc_ids.dtype))
+        cand = np.flatnonzero(mask)
+        if not len(cand):
+            return []
+
+        order, sims = self._rank(vecs, codes, scale, q, cand, top_k)
+
+        return [
+            {
+                "id": int(ids[i]),
+                "doc_id": int(doc_ids[i]),
+                "page_number": int(pages[i]),
+                "chunk_index": int(cidx[i]),
+                "content": contents[i],
+                "similarity": float(sim),
+            }
+            for i, sim in zip(order, sims)
+        ]
+
+    def _rank(self, vecs, codes, scale, q: np.ndarray, cand: np.ndarray, top_k: int, mode: Optional[str] = None,
+              shortlist: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        cand 행 중 상위 top_k 의 (행 번호, 정확한 cosine similarity) 를 similarity 내림차순으로 반환
+        - quantized: 코드로 근사 점수 → 상위 shortlist 개만 원본 벡터로 정확히 재정렬
+        """
+        mode = mode or self.quantization
+        if mode in ("int8", "binary") and codes is not None:
+            approx = approx_scores(mode, codes, scale, q, cand)
+            n_short = min(max(shortlist or self.rerank_shortlist, top_k), len(cand))
+            # 원본은 memory-map 이므로 행 순서대로 읽도록 정렬
+            cand = np.sort(cand[np.argpartition(-approx, n_short - 1)[:n_short]])
+            sims = np.asarray(vecs[cand]) @ q
+        else:
+            # 후보 행만 복사하는 것보다 전체 내적 후 고르는 편이 메모리 이동이 적음
+            sims = (vecs @ q)[cand]
+        k = min(top_k, len(cand))
+        part = np.argpartition(-sims, k - 1)[:k]
+        part = part[np.argsort(-sims[part])]
+        return cand[part], sims[part]
+
+
+def quantization_recall(
+    index: LocalVectorIndex,
+    modes: Tuple[str, ...] = ("int8", "binary"),
+    shortlists: Tuple[int, ...] = (50, 100, 200, 400),
+    k: int = 10,
+    n_queries: int = 200,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    quantized 후보 검색 + 정확 재정렬 결과의 recall@k 를 정확 검색과 비교
+    - 인덱스에 있는 벡터에 약간의 노이즈를 더해 질의로 사용 (API 호출 없음)
+    return: [{"mode", "shortlist", "recall_at_k", "bytes_per_vector"}, ...]
+    """
+    vecs = np.asarray(index.vecs, dtype=np.float32)
+    n = len(vecs)
+    if not n:
+        return []
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(n, size=min(n_queries, n), replace=False)
+    queries = vecs[picks] + rng.normal(0.0, 0.02, size=(len(picks), vecs.shape[1])).astype(np.float32)
+    queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    cand = np.arange(n)
+
+    exact = [set(index._rank(vecs, None, None, q, cand, k, mode="none")[0].tolist()) for q in queries]
+
+    report = []
+    for mode in modes:
+        if mode == "int8":
+            codes, scale = quantize_int8(vecs)
+        else:
+            codes, scale = quantize_binary(vecs), None
+        for shortlist in shortlists:
+            hits = 0
+            for q, truth in zip(queries, exact):
+                got = index._rank(vecs, codes, scale, q, cand, k, mode=mode, shortlist=shortlist)[0]
+                hits += len(truth & set(got.tolist()))
+            report.append(
+                {
+                    "mode": mode,
+                    "shortlist": shortlist,
+                    "recall_at_k": hits / (len(queries) * min(k, n)),
+                    "bytes_per_vector": int(codes.shape[1] * codes.itemsize),
+                }
+            )
+    return report
+
+
+@st.cache_resource
+def _open_local_index(
+    index_dir: str, dims: int, sync_interval_s: float, quantization: str, rerank_shortlist: int, _sb
+) -> LocalVectorIndex:
+    index = LocalVectorIndex(_sb, index_dir, dims, sync_interval_s, quantization, rerank_shortlist)
+    on_doc_changed(index.invalidate_doc)
+    index.start_background_sync()
+    return index
+
+
+def get_retrieval_backend(settings: Settings) -> RetrievalBackend:
+    """
+    settings.retrieval_backend: "supabase" (match_rag_chunks_v3 RPC) / "local" (프로세스 내 벡터 인덱스)
+    """
+    sb = get_supabase_client(settings.supabase_url, settings.supabase_service_key)
+    if settings.retrieval_backend == "local":
+        return _open_local_index(
+            settings.local_index_dir,
+            settings.embedding_dims,
+            settings.local_index_sync_interval_s,
+            settings.local_index_quantization,
+            settings.local_index_rerank_shortlist,
+            sb,
+        )
+    return SupabaseRpcBackend(sb)
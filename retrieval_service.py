@@ -1,7 +1,17 @@
-from typing import List, Optional, Dict, Any, Tuple
+import threading
+from typing import List, Optional, Dict, Any, Set, Tuple
+import streamlit as st
 from clients import get_openai_client, get_supabase_client
 from config import Settings
-from utils_text import robust_json_loads
+from doc_router import get_doc_router
+from embedding_cache import get_embedding_cache
+from lexical_index import extract_codes, get_lexical_index, is_exact_code_query, reciprocal_rank_fusion
+from memory_cache import TTLLRUCache
+from metadata_cache import get_metadata_cache
+from retrieval_backends import embedding_to_pgvector_str, get_retrieval_backend
+from tokens import count_tokens
+from tracing import cache_event, span, usage_attrs
+from utils_text import normalize_question, robust_json_loads
 
 
 def openai_embed(client, model: str, text: str) -> List[float]:
@@ -9,38 +19,116 @@ def openai_embed(client, model: str, text: str) -> List[float]:
     return resp.data[0].embedding
 
 
-def embedding_to_pgvector_str(emb: List[float]) -> str:
-    return "[" + ",".join(f"{x:.8f}" for x in emb) + "]"
+def embed_many(
+    client,
+    model: str,
+    texts: List[str],
+    *,
+    dims: Optional[int] = None,
+    max_inputs: int = 256,
+    max_tokens: int = 100_000,
+) -> List[List[float]]:
+    """
+    여러 텍스트를 multi-input embeddings.create 요청으로 묶어서 임베딩
+    - 요청당 입력 수(max_inputs) / 토큰 수(max_tokens) 한도 내에서 최대한 채워 보냄
+    - 반환 순서는 texts 순서와 동일
+    """
+    out: List[List[float]] = []
+    batch: List[str] = []
+    batch_tokens = 0
 
+    def _flush() -> None:
+        with span("openai.embeddings", model=model, inputs=len(batch), bytes_out=sum(len(t) for t in batch)) as sp:
+            resp = client.embeddings.create(model=model, input=batch)
+            sp.set(**usage_attrs(getattr(resp, "usage", None)))
+        for item in sorted(resp.data, key=lambda d: d.index):
+            emb = item.embedding
+            if dims is not None and len(emb) != dims:
+                raise ValueError(f"Embedding dims mismatch: got {len(emb)}, expected {dims}")
+            out.append(emb)
 
-def retrieve_contexts(
-    settings: Settings,
-    question: str,
-    doc_id_filter: Optional[int] = None,
-) -> Tuple[List[Dict[str, Any]], float]:
-    oai = get_openai_client(settings.openai_api_key)
-    sb = get_supabase_client(settings.supabase_url, settings.supabase_service_key)
+    for text in texts:
+        n_tokens = count_tokens(text, model)
+        if batch and (len(batch) >= max_inputs or batch_tokens + n_tokens > max_tokens):
+            _flush()
+            batch = []
+            batch_tokens = 0
+        batch.append(text)
+        batch_tokens += n_tokens
 
-    q_emb = openai_embed(oai, settings.embedding_model, question)
-    if len(q_emb) != settings.embedding_dims:
-        raise ValueError(f"Query embedding dims mismatch: got {len(q_emb)}, expected {settings.embedding_dims}")
+    if batch:
+        _flush()
+
+    if len(out) != len(texts):
+        raise ValueError(f"Embedding count mismatch: got {len(out)}, expected {len(texts)}")
+    return out
+
+
+def cached_embed_many(settings: Settings, client, texts: List[str]) -> List[List[float]]:
+    """
+    임베딩 캐시를 먼저 조회하고, 없는 텍스트만 embed_many 로 요청한 뒤 캐시에 저장
+    """
+    cache = get_embedding_cache(settings)
+    model, dims = settings.embedding_model, settings.embedding_dims
+    found: List[Optional[List[float]]] = cache.get_many(model, dims, texts) if cache else [None] * len(texts)
+
+    miss_idx = [i for i, v in enumerate(found) if v is None]
+    if cache:
+        cache_event("embedding", "miss" if miss_idx else "hit")
+    if miss_idx:
+        # 같은 배치 안의 중복 텍스트(반복되는 안전 문구 등)는 한 번만 요청
+        uniq = list(dict.fromkeys(texts[i] for i in miss_idx))
+        embs = embed_many(
+            client,
+            model,
+            uniq,
+            dims=dims,
+            max_inputs=settings.embed_batch_max_inputs,
+            max_tokens=settings.embed_batch_max_tokens,
+        )
+        if cache:
+            cache.put_many(model, dims, uniq, embs)
+        by_text = dict(zip(uniq, embs))
+        for i in miss_idx:
+            found[i] = by_text[texts[i]]
 
-    payload = {
-        "query_embedding": embedding_to_pgvector_str(q_emb),
-        "match_count": settings.top_k,
-        "doc_id_filter": doc_id_filter,
-    }
+    return found
 
-    res = sb.rpc("match_rag_chunks_v3", payload).execute()
-    rows = res.data or []
 
+@st.cache_resource
+def _open_query_embedding_cache(max_entries: int, ttl_s: float) -> TTLLRUCache:
+    return TTLLRUCache(max_entries, ttl_s)
+
+
+def get_query_embedding_cache(settings: Settings) -> TTLLRUCache:
+    """
+    질문 임베딩 캐시 (서버 프로세스 내 모든 세션이 공유)
+    """
+    return _open_query_embedding_cache(settings.query_cache_max_entries, settings.query_cache_ttl_s)
+
+
+def embed_query(settings: Settings, client, question: str) -> List[float]:
+    """
+    정규화된 질문 기준 in-memory 캐시 → 임베딩 캐시 → API 순으로 질문 임베딩 조회
+    """
+    cache = get_query_embedding_cache(settings)
+    key = (settings.embedding_model, settings.embedding_dims, normalize_question(question))
+    q_emb = cache.get(key)
+    cache_event("query_embedding", "hit" if q_emb is not None else "miss")
+    if q_emb is None:
+        q_emb = cached_embed_many(settings, client, [question])[0]
+        cache.put(key, q_emb)
+    return q_emb
+
+
+def _rows_to_contexts(rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], float]:
     contexts = []
     top1_similarity = -1.0
 
-    for i, r in enumerate(rows):
+    for r in rows:
         sim = float(r.get("similarity", -1.0))
-        if i == 0:
-            top1_similarity = sim
+        # RRF 로 합친 경우 첫 번째가 최고 similarity 가 아닐 수 있음
+        top1_similarity = max(top1_similarity, sim)
 
         contexts.append(
             {
@@ -56,25 +144,153 @@ def retrieve_contexts(
     return contexts, top1_similarity
 
 
-def get_page_image_url(settings: Settings, doc_id: int, page_number: int) -> Optional[str]:
+def _routed_search(
+    settings: Settings, backend, q_emb: List[float], deleted: Set[int]
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    "전체 문서" 검색을 centroid 로 고른 상위 문서 안에서만 실행
+    return: 검색 결과, 라우팅하지 않았거나 결과 신뢰도가 낮으면 None (호출 측에서 전체 검색)
+    """
+    router = get_doc_router(settings)
+    if router is None:
+        return None
+    with span("doc_route") as sp:
+        doc_ids = router.route(q_emb, settings.doc_route_top_n, settings.doc_route_min_similarity)
+        if doc_ids is not None:
+            doc_ids = [d for d in doc_ids if d not in deleted]
+        sp.set(docs=len(doc_ids) if doc_ids else 0)
+    if not doc_ids:
+        cache_event("doc_route", "skip")
+        return None
+
+    with span(f"search.{settings.retrieval_backend}", docs=len(doc_ids)) as sp:
+        rows = backend.search_docs(q_emb, settings.top_k, doc_ids)
+        sp.set(rows=len(rows))
+    top1 = max((float(r.get("similarity", -1.0)) for r in rows), default=-1.0)
+    if top1 < settings.doc_route_fallback_similarity:
+        cache_event("doc_route", "fallback")
+        return None
+    cache_event("doc_route", "routed")
+    return rows
+
+
+def retrieve_contexts(
+    settings: Settings,
+    question: str,
+    doc_id_filter: Optional[int] = None,
+    query_embedding: Optional[List[float]] = None,
+) -> Tuple[List[Dict[str, Any]], float]:
+    """
+    query_embedding 을 주면 질문 임베딩 단계를 건너뜀 (이미 임베딩한 경우)
+
+    어휘 검색(BM25) 연동:
+    - 에러 코드/모델명만 묻는 질문이고 그 코드가 그대로 들어있는 chunk 가 있으면
+      임베딩 없이 어휘 검색 결과만 반환 (similarity=1.0, 정확 일치)
+    - 코드가 섞인 질문은 벡터 검색 결과와 어휘 검색 결과를 RRF 로 합침
+
+    삭제 중(tombstone)인 문서의 chunk 는 결과에서 제외 (purge 가 끝날 때까지 top_k 를 넉넉히 조회)
+
+    doc_id_filter 가 없으면 문서 라우팅(_routed_search) 후 후보 문서 안에서만 검색, 신뢰도가 낮으면 전체 검색
+    """
+    deleted = deleted_doc_ids(settings)
+    if doc_id_filter is not None and int(doc_id_filter) in deleted:
+        return [], -1.0
+    fetch_k = settings.top_k * 2 if deleted and doc_id_filter is None else settings.top_k
+
+    def _live(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [r for r in rows if int(r["doc_id"]) not in deleted] if deleted else rows
+
+    lexical = get_lexical_index(settings)
+    lex_rows: List[Dict[str, Any]] = []
+    if lexical and extract_codes(question):
+        with span("lexical.search") as sp:
+            lex_rows = _live(lexical.search(question, fetch_k, doc_id_filter=doc_id_filter))[: settings.top_k]
+            sp.set(rows=len(lex_rows))
+        if is_exact_code_query(question):
+            exact = [dict(r, similarity=1.0) for r in lex_rows if r["exact_code"]]
+            if exact:
+                return _rows_to_contexts(exact)
+
+    q_emb = query_embedding
+    if q_emb is None:
+        oai = get_openai_client(settings.openai_api_key)
+        q_emb = embed_query(settings, oai, question)
+    if len(q_emb) != settings.embedding_dims:
+        raise ValueError(f"Query embedding dims mismatch: got {len(q_emb)}, expected {settings.embedding_dims}")
+
+    backend = get_retrieval_backend(settings)
+    rows = _routed_search(settings, backend, q_emb, deleted) if doc_id_filter is None else None
+    if rows is None:
+        with span(f"search.{settings.retrieval_backend}") as sp:
+            rows = _live(backend.search(q_emb, fetch_k, doc_id_filter=doc_id_filter))[: settings.top_k]
+            sp.set(rows=len(rows))
+    if lex_rows:
+        rows = reciprocal_rank_fusion(rows, lex_rows, settings.top_k, k=settings.rrf_k)
+
+    return _rows_to_contexts(rows)
+
+
+def get_pages_images(settings: Settings, doc_id: int, page_numbers: List[int]) -> Dict[int, Optional[Dict[str, str]]]:
+    """
+    여러 페이지의 이미지를 한 번에 조회 (문서 페이지 테이블 캐시 사용, 캐시 미스 시 bulk 조회 1회)
+    return: {page_number: {"url", "thumb_url"} 또는 None(목차/없는 페이지/삭제 중인 문서)}
+    """
     sb = get_supabase_client(settings.supabase_url, settings.supabase_service_key)
+    cache = get_metadata_cache(settings)
+    if int(doc_id) in cache.deleted_doc_ids(sb):
+        return {int(p): None for p in page_numbers}
+    table = cache.page_table(sb, doc_id)
+
+    out: Dict[int, Optional[Dict[str, str]]] = {}
+    for p in page_numbers:
+        row = table.get(int(p))
+        if not row or bool(row.get("is_toc")) is True or not row.get("image_url"):
+            out[int(p)] = None
+        else:
+            out[int(p)] = {"url": row["image_url"], "thumb_url": row.get("thumb_url") or row["image_url"]}
+    return out
+
+
+def prefetch_page_images(
+    settings: Settings, contexts: List[Dict[str, Any]], cancel: Optional[threading.Event] = None
+) -> int:
+    """
+    검색된 contexts 의 문서별 페이지 테이블을 미리 메타데이터 캐시에 적재 (LLM 생성과 병렬 실행용)
+    - cancel 이 set 되면 남은 문서는 건너뜀
+    return: 적재(또는 캐시 확인)한 문서 수
+    """
+    done = 0
+    for doc_id in dict.fromkeys(int(c["doc_id"]) for c in contexts):
+        if cancel is not None and cancel.is_set():
+            break
+        get_pages_images(settings, doc_id, [int(c["page_number"]) for c in contexts if int(c["doc_id"]) == doc_id])
+        done += 1
+    return done
+
 
-    res = (
-        sb.table("manual_pages")
-        .select("image_url,is_toc")
-        .eq("doc_id", doc_id)
-        .eq("page_number", page_number)
-        .limit(1)
-        .execute()
-    )
-    if res.data:
-        if bool(res.data[0].get("is_toc")) is True:
-            return None
-        return res.data[0].get("image_url")
-    return None
+def get_page_images(settings: Settings, doc_id: int, page_number: int) -> Optional[Dict[str, str]]:
+    """
+    return: {"url": 원본 이미지 URL, "thumb_url": 썸네일 URL (없으면 원본)}, 목차 페이지/없는 페이지는 None
+    """
+    return get_pages_images(settings, doc_id, [page_number])[int(page_number)]
+
+
+def get_page_image_url(settings: Settings, doc_id: int, page_number: int) -> Optional[str]:
+    images = get_page_images(settings, doc_id, page_number)
+    return images["url"] if images else None
 
 
 def list_docs(settings: Settings) -> List[Dict[str, Any]]:
+    """
+    문서 카탈로그 (메타데이터 캐시, 적재/삭제 시 무효화, 삭제 중인 문서 제외)
+    """
+    sb = get_supabase_client(settings.supabase_url, settings.supabase_service_key)
+    return get_metadata_cache(settings).doc_catalog(sb)
+
+
+def deleted_doc_ids(settings: Settings) -> Set[int]:
+    """
+    tombstone 된(삭제 진행 중인) 문서 id
+    """
     sb = get_supabase_client(settings.supabase_url, settings.supabase_service_key)
-    res = sb.table("manual_docs").select("id,title,created_at").order("created_at", desc=True).execute()
-    return res.data or []
+    return get_metadata_cache(settings).deleted_doc_ids(sb)
@@ -0,0 +1,6 @@
+-- 증분 재적재(변경된 페이지만 갱신)용 해시 컬럼
+alter table manual_docs add column if not exists file_sha256 text;
+create index if not exists manual_docs_file_sha256_idx on manual_docs (file_sha256);
+
+alter table manual_pages add column if not exists text_sha256 text;
+alter table manual_pages add column if not exists image_sha256 text;
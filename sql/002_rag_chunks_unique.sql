@@ -0,0 +1,11 @@
+-- rag_chunks 를 (doc_id, page_number, chunk_index) 기준으로 upsert 할 수 있도록 unique 제약 추가
+-- (배치 재시도 시 row 중복 방지)
+delete from rag_chunks a
+using rag_chunks b
+where a.doc_id = b.doc_id
+  and a.page_number = b.page_number
+  and a.chunk_index = b.chunk_index
+  and a.id < b.id;
+
+alter table rag_chunks
+  add constraint rag_chunks_doc_page_chunk_key unique (doc_id, page_number, chunk_index);
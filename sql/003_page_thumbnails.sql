@@ -0,0 +1,3 @@
+-- 페이지 이미지 썸네일(그리드용) 경로/URL
+alter table manual_pages add column if not exists thumb_path text;
+alter table manual_pages add column if not exists thumb_url text;
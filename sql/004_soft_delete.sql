@@ -0,0 +1,7 @@
+-- 2단계 문서 삭제: 삭제 요청 즉시 tombstone, row / Storage 정리는 백그라운드에서
+alter table manual_docs add column if not exists deleted_at timestamptz;
+create index if not exists manual_docs_deleted_at_idx on manual_docs (deleted_at) where deleted_at is not null;
+
+-- page_number 범위 단위 purge 용
+create index if not exists rag_chunks_doc_page_idx on rag_chunks (doc_id, page_number);
+create index if not exists manual_pages_doc_page_idx on manual_pages (doc_id, page_number);
@@ -0,0 +1,50 @@
+-- 문서 라우팅용 centroid (비-목차 chunk 임베딩 평균, 적재 완료 시 refresh_doc_centroid 로 갱신)
+alter table manual_docs add column if not exists centroid vector(1536);
+
+create or replace function refresh_doc_centroid(p_doc_id bigint)
+returns void
+language sql
+as $$
+  update manual_docs
+  set centroid = (
+    select avg(embedding)
+    from rag_chunks
+    where doc_id = p_doc_id
+      and coalesce(is_toc, false) = false
+  )
+  where id = p_doc_id;
+$$;
+
+-- 라우팅된 여러 문서 안에서만 검색 (문서별 RPC 를 여러 번 부르지 않도록 doc_ids 배열로 한 번에)
+create or replace function match_rag_chunks_docs(
+  query_embedding vector(1536),
+  match_count int,
+  doc_ids bigint[]
+)
+returns table (
+  id bigint,
+  doc_id bigint,
+  page_number int,
+  chunk_index int,
+  content text,
+  similarity float
+)
+language sql
+stable
+as $$
+  select
+    rc.id::bigint,
+    rc.doc_id::bigint,
+    rc.page_number::int,
+    rc.chunk_index::int,
+    rc.content::text,
+    (1 - (rc.embedding <=> query_embedding))::float as similarity
+  from rag_chunks rc
+  where rc.doc_id = any(doc_ids)
+    and coalesce(rc.is_toc, false) = false
+  order by rc.embedding <=> query_embedding
+  limit match_count;
+$$;
+
+-- 기존 문서 backfill
+select refresh_doc_centroid(id) from manual_docs where centroid is null;
@@ -1,7 +1,15 @@
-from typing import List, Dict, Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
 from supabase import Client
 from clients import get_supabase_client
 from config import Settings
+from ingest_journal import get_ingest_journal
+from invalidation import notify_doc_changed
+from tracing import span
 
 
 def ensure_bucket_exists(sb: Client, bucket: str, public: bool = True) -> None:
@@ -20,59 +28,172 @@ def ensure_bucket_exists(sb: Client, bucket: str, public: bool = True) -> None:
         return
 
 
-def supabase_upload_png(sb: Client, bucket: str, path: str, png_bytes: bytes) -> str:
-    ensure_bucket_exists(sb, bucket, public=True)
-    try:
-        sb.storage.from_(bucket).upload(
-            path=path,
-            file=png_bytes,
-            file_options={"content-type": "image/png", "upsert": "true"},
-        )
-    except Exception:
+# 이미 존재를 확인한 bucket (업로드마다 list_buckets 호출하지 않도록)
+_known_buckets: Set[str] = set()
+
+
+def supabase_upload_bytes(sb: Client, bucket: str, path: str, data: bytes, content_type: str) -> str:
+    if bucket not in _known_buckets:
         ensure_bucket_exists(sb, bucket, public=True)
-        sb.storage.from_(bucket).upload(
-            path=path,
-            file=png_bytes,
-            file_options={"content-type": "image/png", "upsert": "true"},
-        )
+        _known_buckets.add(bucket)
+    with span("supabase.storage.upload", bytes_out=len(data)):
+        try:
+            sb.storage.from_(bucket).upload(
+                path=path,
+                file=data,
+                file_options={"content-type": content_type, "upsert": "true"},
+            )
+        except Exception:
+            ensure_bucket_exists(sb, bucket, public=True)
+            sb.storage.from_(bucket).upload(
+                path=path,
+                file=data,
+                file_options={"content-type": content_type, "upsert": "true"},
+            )
     return sb.storage.from_(bucket).get_public_url(path)
 
 
-def _chunks(lst: List[str], n: int) -> List[List[str]]:
+def supabase_upload_png(sb: Client, bucket: str, path: str, png_bytes: bytes) -> str:
+    return supabase_upload_bytes(sb, bucket, path, png_bytes, "image/png")
+
+
+def _chunks(lst: List[Any], n: int) -> List[List[Any]]:
     return [lst[i:i + n] for i in range(0, len(lst), n)]
 
 
-def delete_doc_and_assets(settings: Settings, doc_id: int) -> Dict[str, Any]:
+def _with_retry(fn: Callable[[], Any], max_retries: int, backoff_s: float = 0.5) -> Any:
+    for attempt in range(max_retries):
+        try:
+            return fn()
+        except Exception:
+            if attempt == max_retries - 1:
+                raise
+            time.sleep(backoff_s * (2 ** attempt))
+
+
+def soft_delete_doc(settings: Settings, doc_id: int) -> None:
+    """
+    1단계: manual_docs.deleted_at 만 기록 (즉시 반환)
+    - list_docs / retrieve_contexts / 페이지 이미지 조회는 tombstone 된 문서를 건너뜀
+    - 실제 row / Storage 객체 삭제는 purge_doc (백그라운드 삭제 큐)에서
+    """
     sb = get_supabase_client(settings.supabase_url, settings.supabase_service_key)
+    with span("supabase.update.manual_docs"):
+        sb.table("manual_docs").update({"deleted_at": datetime.now(timezone.utc).isoformat()}).eq("id", doc_id).execute()
+    get_ingest_journal(settings).forget_doc(doc_id)
+    notify_doc_changed(doc_id)
+
+
+def _load_page_assets(sb, doc_id: int) -> Tuple[List[int], List[str]]:
+    """
+    return: (page_number 목록, Storage 경로 목록) — 대형 매뉴얼도 전부 읽도록 페이지 단위로 조회
+    """
+    page_numbers: List[int] = []
+    paths: List[str] = []
+    page_size = 1000
+    start = 0
+    while True:
+        with span("supabase.select.manual_pages") as sp:
+            res = (
+                sb.table("manual_pages")
+                .select("page_number,image_path,thumb_path")
+                .eq("doc_id", doc_id)
+                .order("page_number")
+                .range(start, start + page_size - 1)
+                .execute()
+            )
+            rows = res.data or []
+            sp.set(rows=len(rows))
+        for r in rows:
+            page_numbers.append(int(r["page_number"]))
+            paths.extend(r[k] for k in ("image_path", "thumb_path") if r.get(k))
+        if len(rows) < page_size:
+            break
+        start += page_size
+    return page_numbers, paths
 
-    pages_res = (
-        sb.table("manual_pages")
-        .select("image_path")
-        .eq("doc_id", doc_id)
-        .execute()
-    )
-    image_paths = [r["image_path"] for r in (pages_res.data or []) if r.get("image_path")]
 
-    storage_deleted = 0
+def purge_doc(
+    settings: Settings,
+    doc_id: int,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, Any]:
+    """
+    2단계: tombstone 된 문서의 row / Storage 객체를 잘게 나눠 병렬 삭제
+    - rag_chunks / manual_pages 는 page_number 범위(delete_pages_per_batch) 단위 delete → statement timeout 회피
+    - Storage 는 delete_storage_batch 개씩 remove
+    - 요청마다 지수 백오프 재시도, 모두 멱등이라 작업 전체를 다시 실행해도 안전
+    - 검색 대상(rag_chunks) → Storage → manual_pages → manual_docs 순서
+    on_progress(done, total): 완료된 요청 수 / 전체 요청 수
+    """
+    sb = get_supabase_client(settings.supabase_url, settings.supabase_service_key)
+    page_numbers, paths = _load_page_assets(sb, doc_id)
+    page_ranges = [(b[0], b[-1]) for b in _chunks(page_numbers, max(1, settings.delete_pages_per_batch))]
+    path_batches = _chunks(paths, max(1, settings.delete_storage_batch))
+
+    total = 2 * len(page_ranges) + len(path_batches) + 3
+    done = [0]
+    lock = threading.Lock()
+
+    def _step() -> None:
+        with lock:
+            done[0] += 1
+            n = done[0]
+        if on_progress:
+            on_progress(n, total)
+
+    def _delete_range(table: str, lo: int, hi: int) -> None:
+        def _do():
+            with span(f"supabase.delete.{table}", pages=hi - lo + 1):
+                (
+                    sb.table(table).delete()
+                    .eq("doc_id", doc_id)
+                    .gte("page_number", lo)
+                    .lte("page_number", hi)
+                    .execute()
+                )
+
+        _with_retry(_do, settings.delete_max_retries)
+        _step()
+
     storage_failed: List[str] = []
-    if image_paths:
-        for batch in _chunks(image_paths, 100):
-            try:
+
+    def _remove(batch: List[str]) -> None:
+        def _do():
+            with span("supabase.storage.remove", rows=len(batch)):
                 sb.storage.from_(settings.storage_bucket).remove(batch)
-                storage_deleted += len(batch)
-            except Exception:
+
+        try:
+            _with_retry(_do, settings.delete_max_retries)
+        except Exception:
+            with lock:
                 storage_failed.extend(batch)
+        _step()
+
+    def _delete_rest(table: str, col: str) -> None:
+        # 범위 삭제 후 남은 row (manual_pages 없이 적재가 중단된 chunk 등) 정리
+        _with_retry(lambda: sb.table(table).delete().eq(col, doc_id).execute(), settings.delete_max_retries)
+        _step()
+
+    with ThreadPoolExecutor(max_workers=max(1, settings.delete_workers)) as ex:
+        list(ex.map(lambda r: _delete_range("rag_chunks", *r), page_ranges))
+        _delete_rest("rag_chunks", "doc_id")
+        list(ex.map(_remove, path_batches))
+        list(ex.map(lambda r: _delete_range("manual_pages", *r), page_ranges))
+        _delete_rest("manual_pages", "doc_id")
+    _delete_rest("manual_docs", "id")
 
+    notify_doc_changed(doc_id)
+    return {"ok": True, "storage_deleted": len(paths) - len(storage_failed), "storage_failed": storage_failed}
+
+
+def delete_doc_and_assets(settings: Settings, doc_id: int) -> Dict[str, Any]:
+    """
+    tombstone + purge 를 현재 스레드에서 끝까지 실행 (관리 화면은 get_delete_queue 사용)
+    """
     try:
-        sb.table("rag_chunks").delete().eq("doc_id", doc_id).execute()
-        sb.table("manual_pages").delete().eq("doc_id", doc_id).execute()
-        sb.table("manual_docs").delete().eq("id", doc_id).execute()
+        soft_delete_doc(settings, doc_id)
+        return purge_doc(settings, doc_id)
     except Exception as e:
-        return {
-            "ok": False,
-            "error": str(e),
-            "storage_deleted": storage_deleted,
-            "storage_failed": storage_failed,
-        }
-
-    return {"ok": True, "storage_deleted": storage_deleted, "storage_failed": storage_failed}
+        notify_doc_changed(doc_id)
+        return {"ok": False, "error": str(e), "storage_deleted": 0, "storage_failed": []}
@@ -0,0 +1,14 @@
+import pytest
+
+import context_packer
+import tokens
+
+
+@pytest.fixture(autouse=True)
+def offline_tokenizer(monkeypatch):
+    """
+    테스트는 네트워크 없이 돌아야 하므로 tiktoken 인코딩 파일을 받으러 가지 않고 근사 토크나이저로 셈
+    """
+    encoding = tokens.ApproxEncoding()
+    monkeypatch.setattr(tokens, "get_encoding", lambda model: encoding)
+    monkeypatch.setattr(context_packer, "get_encoding", lambda model: encoding)
@@ -0,0 +1,40 @@
+from answer_cache import AnswerCache
+from fake_clients import fake_embedding
+
+DIMS = 256
+SCOPE = (None, 0.3)
+
+
+def _put(cache, question, answer, doc_ids=(1,), scope=SCOPE):
+    cache.put(scope, question, fake_embedding(question, DIMS), {"answer": answer}, doc_ids)
+
+
+def _similar(cache, question, scope=SCOPE):
+    return cache.get_similar(scope, question, fake_embedding(question, DIMS))
+
+
+def test_similar_question_with_other_error_code_misses():
+    cache = AnswerCache(max_entries=100, ttl_s=600, similarity_threshold=0.8)
+    _put(cache, "e-05 에러가 떠요 어떻게 해결하나요", "배수 필터를 청소하세요")
+
+    # 임베딩은 임계치를 넘을 만큼 비슷하지만 에러 코드가 다름
+    assert _similar(cache, "e-05 에러가 떠요 어떻게 해결하나요?")["answer"] == "배수 필터를 청소하세요"
+    assert _similar(cache, "e-06 에러가 떠요 어떻게 해결하나요") is None
+    assert _similar(cache, "e-50 에러가 떠요 어떻게 해결하나요") is None
+    assert _similar(cache, "에러가 떠요 어떻게 해결하나요") is None
+    assert cache.stats()["semantic_hits"] == 1
+    assert cache.stats()["misses"] == 3
+
+
+def test_scope_and_doc_invalidation():
+    cache = AnswerCache(max_entries=100, ttl_s=600, similarity_threshold=0.8)
+    _put(cache, "필터 청소 방법", "월 1회 물로 헹굽니다", doc_ids=(1,), scope=(1, 0.3))
+    _put(cache, "전원이 안 켜져요", "플러그를 확인하세요", doc_ids=(2,), scope=(2, 0.3))
+
+    assert _similar(cache, "필터 청소 방법", scope=(2, 0.3)) is None
+    assert cache.get_exact((1, 0.3), "필터 청소 방법")["answer"] == "월 1회 물로 헹굽니다"
+
+    cache.invalidate_doc(1)
+
+    assert cache.get_exact((1, 0.3), "필터 청소 방법") is None
+    assert cache.get_exact((2, 0.3), "전원이 안 켜져요")["answer"] == "플러그를 확인하세요"
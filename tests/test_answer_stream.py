@@ -0,0 +1,67 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from answer_service import CITATION_MARKER, AnswerStream
+from config import Settings
+from process_rag_query import RagAnswerStream
+from tracing import start_trace
+
+
+def _delta(text):
+    return SimpleNamespace(type="response.output_text.delta", delta=text)
+
+
+@pytest.fixture
+def settings(tmp_path):
+    return Settings(
+        openai_api_key="", supabase_url="", supabase_service_key="",
+        trace_log_enabled=False, metrics_path=str(tmp_path / "metrics.prom"),
+    )
+
+
+def test_ttft_counts_from_request_start_and_skips_empty_deltas(settings):
+    def events():
+        yield _delta("")
+        time.sleep(0.05)
+        yield _delta("1. 전원을 끈다.")
+        yield _delta(f"\n{CITATION_MARKER} 3")
+
+    started_at = time.perf_counter() - 0.2  # create() 가 연결/대기로 200ms 걸린 상황
+    with start_trace(settings, "test") as trace:
+        stream = AnswerStream(events(), started_at)
+        text = "".join(stream)
+
+    (sp,) = [s for s in trace.spans if s.name == "openai.responses.stream"]
+    assert sp.attrs["ttft_ms"] >= 250
+    assert text.strip() == "1. 전원을 끈다."
+    assert stream.result == {"answer": "1. 전원을 끈다.", "cited_pages": [3]}
+
+
+def test_interrupted_stream_still_sets_result():
+    finalized = []
+
+    def chunks():
+        yield "1. 전원을 "
+        raise ConnectionError("stream dropped")
+
+    stream = RagAnswerStream(chunks(), lambda: finalized.append(True) or {}, top1_similarity=0.7)
+    with pytest.raises(ConnectionError):
+        for _ in stream:
+            pass
+
+    assert not finalized  # 끊긴 답변은 캐시에 넣는 정상 종료 경로를 타지 않음
+    assert stream.result == {
+        "answer": "1. 전원을", "related_pages": [], "resolved_doc_id": None, "top1_similarity": 0.7,
+    }
+
+
+def test_abandoned_stream_sets_result_on_close():
+    stream = RagAnswerStream(iter(["1. 필터를 ", "분리한다."]), lambda: {"answer": "done"})
+    it = iter(stream)
+    next(it)
+    it.close()  # st.write_stream 도중 rerun 으로 버려진 경우
+
+    assert stream.result["answer"] == "1. 필터를"
+    assert stream.result["related_pages"] == []
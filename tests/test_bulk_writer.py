@@ -0,0 +1,107 @@
+from types import SimpleNamespace
+
+import pytest
+
+from bulk_writer import BulkWriter, classify_write_error
+from fake_clients import FakeSupabase
+
+
+class _ApiError(Exception):
+    def __init__(self, message, code="", status_code=None):
+        super().__init__(message)
+        self.code = code
+        if status_code is not None:
+            self.response = SimpleNamespace(status_code=status_code)
+
+
+class FailingSupabase(FakeSupabase):
+    """
+    rag_chunks upsert 를 fail(rows) 가 돌려주는 오류로 실패시킴 (None 이면 정상 기록)
+    """
+
+    def __init__(self, fail):
+        super().__init__()
+        self.fail = fail
+        self.attempts = []
+
+    def _execute(self, q):
+        if q._table == "rag_chunks" and q._op == "upsert":
+            self.attempts.append(len(q._payload))
+            err = self.fail(q._payload)
+            if err is not None:
+                raise err
+        return super()._execute(q)
+
+
+def _rows(n):
+    return [{"doc_id": 1, "page_number": i + 1, "chunk_index": 0, "content": f"청크 {i}"} for i in range(n)]
+
+
+def _writer(sb, **kw):
+    return BulkWriter(sb, "rag_chunks", "doc_id,page_number,chunk_index", backoff_s=0, **kw)
+
+
+@pytest.mark.parametrize(
+    "err, kind",
+    [
+        (_ApiError("canceling statement due to statement timeout", code="57014"), "split"),
+        (_ApiError("Payload Too Large", status_code=413), "split"),
+        (TimeoutError("read timed out"), "split"),
+        (_ApiError("duplicate key value violates unique constraint", code="23505"), "fatal"),
+        (_ApiError("Could not find the 'x' column", code="PGRST204"), "fatal"),
+        (_ApiError("Unauthorized", status_code=401), "fatal"),
+        (_ApiError("Too Many Requests", status_code=429), "retry"),
+        (_ApiError("Bad Gateway", status_code=502), "retry"),
+        (ConnectionError("connection reset by peer"), "retry"),
+    ],
+)
+def test_classify_write_error(err, kind):
+    assert classify_write_error(err) == kind
+
+
+def test_oversized_batch_is_split_until_it_fits():
+    sb = FailingSupabase(lambda rows: _ApiError("Payload Too Large", status_code=413) if len(rows) > 2 else None)
+    writer = _writer(sb)
+
+    writer.add_many(_rows(8))
+    writer.flush()
+
+    assert writer.rows_written == 8
+    assert len(sb.tables["rag_chunks"]) == 8
+    assert sb.attempts == [8, 4, 2, 2, 4, 2, 2]
+
+
+def test_fatal_error_is_raised_without_retry():
+    sb = FailingSupabase(lambda rows: _ApiError("null value in column", code="23502"))
+    writer = _writer(sb)
+
+    writer.add_many(_rows(8))
+    with pytest.raises(_ApiError):
+        writer.flush()
+
+    assert sb.attempts == [8]
+    assert writer.rows_written == 0
+
+
+def test_transient_error_is_retried_then_written():
+    failures = [ConnectionError("connection reset by peer")]
+    sb = FailingSupabase(lambda rows: failures.pop() if failures else None)
+    writer = _writer(sb)
+
+    writer.add_many(_rows(3))
+    writer.flush()
+
+    assert sb.attempts == [3, 3]
+    assert writer.rows_written == 3
+
+
+def test_persistent_timeout_stops_at_request_budget():
+    sb = FailingSupabase(lambda rows: _ApiError("canceling statement due to statement timeout", code="57014"))
+    writer = _writer(sb, max_retries=2)
+    rows = _rows(64)
+
+    writer.add_many(rows)
+    with pytest.raises(_ApiError):
+        writer.flush()
+
+    assert len(sb.attempts) <= 2 * writer.max_retries + 4 * len(rows).bit_length()
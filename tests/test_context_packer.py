@@ -0,0 +1,45 @@
+from config import Settings
+from context_packer import CONTEXT_SEPARATOR, format_context, pack_contexts
+from tokens import count_tokens
+
+
+def _retrieved(settings: Settings):
+    """
+    top_k 개 chunk 가 모두 다른 페이지이고 각각 chunk_size 토큰 가까이 되는 최악의 검색 결과
+    """
+    contexts = []
+    for i in range(settings.top_k):
+        body = f"{i + 1}번 페이지 필터 청소 절차 " * (settings.chunk_size // 10)
+        contexts.append(
+            {"doc_id": 1, "page_number": i + 1, "chunk_index": 0, "content": body, "similarity": 0.9 - i * 0.01}
+        )
+    return contexts
+
+
+def test_every_retrieved_page_survives_default_budget():
+    settings = Settings(openai_api_key="", supabase_url="", supabase_service_key="")
+    contexts = _retrieved(settings)
+    assert sum(count_tokens(c["content"], settings.chat_model) for c in contexts) > settings.context_max_tokens
+
+    packed = pack_contexts(contexts, settings.context_max_tokens, settings.chat_model)
+
+    assert sorted(c["page_number"] for c in packed) == list(range(1, settings.top_k + 1))
+    assert all(c["content"] for c in packed)
+    text = CONTEXT_SEPARATOR.join(format_context(c) for c in packed)
+    assert count_tokens(text, settings.chat_model) <= settings.context_max_tokens + len(packed)
+    # 예산은 similarity 높은 페이지부터 본문 전체로 채움
+    assert packed[0]["content"] == contexts[0]["content"]
+
+
+def test_small_pages_are_kept_whole():
+    contexts = [
+        {"doc_id": 1, "page_number": 3, "chunk_index": 0, "content": "전원 버튼을 3초간 누른다.", "similarity": 0.8},
+        {"doc_id": 1, "page_number": 3, "chunk_index": 1, "content": "표시등이 꺼지면 플러그를 뽑는다.", "similarity": 0.7},
+        {"doc_id": 1, "page_number": 9, "chunk_index": 0, "content": "필터는 월 1회 청소한다.", "similarity": 0.6},
+    ]
+
+    packed = pack_contexts(contexts, 3000, "gpt-4o-mini")
+
+    assert [c["page_number"] for c in packed] == [3, 9]
+    assert "플러그를 뽑는다" in packed[0]["content"]
+    assert packed[1]["content"] == "필터는 월 1회 청소한다."
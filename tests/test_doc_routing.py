@@ -0,0 +1,75 @@
+import json
+
+import pytest
+import streamlit as st
+
+from clients import set_client_overrides
+from config import Settings
+from fake_clients import FakeOpenAI, FakeSupabase, fake_embedding
+from retrieval_backends import SupabaseRpcBackend
+from retrieval_service import retrieve_contexts
+
+TOPICS = [
+    "냉장고 필터 교체 방법",
+    "세탁기 배수 에러 코드",
+    "에어컨 실외기 설치",
+    "카메라 녹화 설정",
+    "도어락 비밀번호 변경",
+    "보일러 온도 조절",
+]
+
+
+@pytest.fixture
+def sb():
+    st.cache_resource.clear()
+    sb = FakeSupabase()
+    set_client_overrides(openai=FakeOpenAI(), supabase=sb)
+    for doc_id, topic in enumerate(TOPICS, start=1):
+        sb.table("manual_docs").insert({"title": topic}).execute()
+        for page in range(1, 4):
+            content = f"{topic} 페이지 {page} 상세 설명 {topic}"
+            sb.table("rag_chunks").insert(
+                {
+                    "doc_id": doc_id,
+                    "page_number": page,
+                    "chunk_index": 0,
+                    "content": content,
+                    "is_toc": False,
+                    "embedding": json.dumps(fake_embedding(content, 1536)),
+                }
+            ).execute()
+        sb.rpc("refresh_doc_centroid", {"p_doc_id": doc_id}).execute()
+    yield sb
+    set_client_overrides()
+    st.cache_resource.clear()
+
+
+def _rpc_calls(sb, name):
+    return sb.stats()["requests"].get(f"rpc.{name}", 0)
+
+
+def test_search_docs_is_a_single_rpc(sb):
+    backend = SupabaseRpcBackend(sb)
+    rows = backend.search_docs(fake_embedding("세탁기 배수 에러", 1536), 5, [1, 2, 3])
+
+    assert _rpc_calls(sb, "match_rag_chunks_docs") == 1
+    assert _rpc_calls(sb, "match_rag_chunks_v3") == 0
+    assert rows and {r["doc_id"] for r in rows} <= {1, 2, 3}
+
+
+def test_routed_all_docs_query_costs_one_search_round_trip(sb):
+    settings = Settings(
+        openai_api_key="fake",
+        supabase_url="fake://supabase/",
+        supabase_service_key="fake",
+        lexical_enabled=False,
+        embedding_cache_enabled=False,
+        doc_route_top_n=2,
+        doc_route_fallback_similarity=0.1,
+    )
+    contexts, _ = retrieve_contexts(settings, "세탁기 배수 에러 코드 해결")
+
+    assert _rpc_calls(sb, "match_rag_chunks_docs") == 1
+    assert _rpc_calls(sb, "match_rag_chunks_v3") == 0
+    doc_ids = {c["doc_id"] for c in contexts}
+    assert 2 in doc_ids and len(doc_ids) <= 2
@@ -0,0 +1,93 @@
+import fitz
+import pytest
+import streamlit as st
+
+from clients import set_client_overrides
+from config import Settings
+from fake_clients import FakeOpenAI, FakeSupabase
+from ingest_service import ingest_pdf_to_supabase
+
+
+class RecordingSupabase(FakeSupabase):
+    """
+    rag_chunks / manual_pages 에 upsert 된 페이지 번호를 기록
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.written = {"rag_chunks": [], "manual_pages": []}
+
+    def _execute(self, q):
+        if q._op == "upsert" and q._table in self.written:
+            self.written[q._table].extend(r["page_number"] for r in q._payload)
+        return super()._execute(q)
+
+
+def _pdf(page_count: int, revised: frozenset = frozenset()) -> bytes:
+    doc = fitz.open()
+    for n in range(1, page_count + 1):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Section {n}. Error code E-{n} means the filter needs cleaning.")
+        step = "Unplug the unit" if n in revised else "Turn the power off"
+        page.insert_text((72, 96), f"{step} and check part {n} before restarting.")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+@pytest.fixture
+def env(tmp_path):
+    st.cache_resource.clear()
+    sb = RecordingSupabase()
+    set_client_overrides(openai=FakeOpenAI(), supabase=sb)
+    settings = Settings(
+        openai_api_key="fake",
+        supabase_url="fake://supabase/",
+        supabase_service_key="fake",
+        embedding_cache_enabled=False,
+        ingest_render_workers=1,
+        page_image_dpi=36,
+        page_image_format="jpeg",
+        page_thumb_format="jpeg",
+        ingest_journal_path=str(tmp_path / "journal.sqlite3"),
+    )
+    yield settings, sb
+    set_client_overrides()
+    st.cache_resource.clear()
+
+
+def _chunks(sb, doc_id):
+    return {(r["page_number"], r["content"]) for r in sb.tables["rag_chunks"] if r["doc_id"] == doc_id}
+
+
+def test_revision_rewrites_only_changed_pages(env):
+    settings, sb = env
+    doc_id, _ = ingest_pdf_to_supabase(settings, _pdf(6), "manual")
+    before = _chunks(sb, doc_id)
+    uploads_before = sb.stats()["requests"]["storage.upload"]
+
+    sb.written = {"rag_chunks": [], "manual_pages": []}
+    revised_doc_id, new_chunks = ingest_pdf_to_supabase(settings, _pdf(5, frozenset({3})), "manual", doc_id=doc_id)
+
+    assert revised_doc_id == doc_id
+    assert set(sb.written["rag_chunks"]) == {3}
+    assert set(sb.written["manual_pages"]) == {3}
+    assert new_chunks == sum(1 for p, _ in before if p == 3)
+
+    after = _chunks(sb, doc_id)
+    assert {p for p, _ in after} == {1, 2, 3, 4, 5}  # 줄어든 6페이지는 삭제
+    assert {c for c in after if c[0] != 3} == {c for c in before if c[0] not in (3, 6)}
+    assert all("Unplug the unit" in content for p, content in after if p == 3)
+    assert sb.stats()["requests"]["storage.upload"] - uploads_before <= 2  # 3페이지 이미지 + 썸네일만 다시 업로드
+
+
+def test_same_file_is_not_reingested(env):
+    settings, sb = env
+    pdf = _pdf(4)
+    doc_id, _ = ingest_pdf_to_supabase(settings, pdf, "manual")
+
+    sb.written = {"rag_chunks": [], "manual_pages": []}
+    again_doc_id, new_chunks = ingest_pdf_to_supabase(settings, pdf, "manual")
+
+    assert (again_doc_id, new_chunks) == (doc_id, 0)
+    assert sb.written == {"rag_chunks": [], "manual_pages": []}
@@ -0,0 +1,131 @@
+import fitz
+import pytest
+import streamlit as st
+
+from clients import set_client_overrides
+from config import Settings
+from fake_clients import FakeOpenAI, FakeSupabase
+from ingest_journal import get_ingest_journal
+from ingest_service import ingest_pdf_to_supabase, sha256_hex
+
+PAGE_COUNT = 6
+
+
+class _Outage(Exception):
+    code = "PGRST000"  # BulkWriter 가 재시도/분할 없이 바로 실패시키는 오류
+
+
+class FlakySupabase(FakeSupabase):
+    """
+    fail_from_page 이상 페이지의 rag_chunks 쓰기를 실패시켜 적재 중단을 흉내냄
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.fail_from_page = None
+        self.chunk_pages_written = []
+
+    def _execute(self, q):
+        if q._table == "rag_chunks" and q._op == "upsert":
+            pages = [r["page_number"] for r in q._payload]
+            if self.fail_from_page is not None and max(pages) >= self.fail_from_page:
+                raise _Outage("connection lost")
+            self.chunk_pages_written.extend(pages)
+        return super()._execute(q)
+
+
+def _pdf() -> bytes:
+    doc = fitz.open()
+    for n in range(1, PAGE_COUNT + 1):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Section {n}. Error code E-{n} means the filter needs cleaning.")
+        page.insert_text((72, 96), f"Turn the power off and check part {n} before restarting.")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+@pytest.fixture
+def env(tmp_path):
+    st.cache_resource.clear()
+    sb = FlakySupabase()
+    set_client_overrides(openai=FakeOpenAI(), supabase=sb)
+    settings = Settings(
+        openai_api_key="fake",
+        supabase_url="fake://supabase/",
+        supabase_service_key="fake",
+        embedding_cache_enabled=False,
+        ingest_render_workers=1,
+        page_image_dpi=36,
+        page_image_format="jpeg",
+        page_thumb_format="jpeg",
+        ingest_checkpoint_pages=2,
+        db_write_retries=0,
+        ingest_journal_path=str(tmp_path / "journal.sqlite3"),
+    )
+    yield settings, sb
+    set_client_overrides()
+    st.cache_resource.clear()
+
+
+def _pages_with_chunks(sb, doc_id):
+    return {r["page_number"] for r in sb.tables.get("rag_chunks", []) if r["doc_id"] == doc_id}
+
+
+def test_interrupted_ingest_resumes_into_same_doc(env):
+    settings, sb = env
+    pdf = _pdf()
+
+    sb.fail_from_page = 5
+    with pytest.raises(_Outage):
+        ingest_pdf_to_supabase(settings, pdf, "manual")
+    (doc_id,) = [r["id"] for r in sb.tables["manual_docs"]]
+    committed = get_ingest_journal(settings).completed_pages(sha256_hex(pdf))
+    assert committed and max(committed) < 5
+
+    sb.fail_from_page = None
+    sb.chunk_pages_written = []
+    resumed_doc_id, _ = ingest_pdf_to_supabase(settings, pdf, "manual")
+
+    assert resumed_doc_id == doc_id
+    assert len(sb.tables["manual_docs"]) == 1
+    assert _pages_with_chunks(sb, doc_id) == set(range(1, PAGE_COUNT + 1))
+    assert not committed & set(sb.chunk_pages_written)  # 체크포인트된 페이지는 다시 쓰지 않음
+
+
+def test_ingest_into_other_doc_drops_previous_checkpoints(env):
+    settings, sb = env
+    pdf = _pdf()
+
+    sb.fail_from_page = 5
+    with pytest.raises(_Outage):
+        ingest_pdf_to_supabase(settings, pdf, "manual")
+    assert get_ingest_journal(settings).completed_pages(sha256_hex(pdf))
+
+    other_doc_id = sb.table("manual_docs").insert({"title": "other"}).execute().data[0]["id"]
+    sb.fail_from_page = 3
+    with pytest.raises(_Outage):
+        ingest_pdf_to_supabase(settings, pdf, "other", doc_id=other_doc_id)
+
+    sb.fail_from_page = None
+    resumed_doc_id, _ = ingest_pdf_to_supabase(settings, pdf, "other")
+
+    assert resumed_doc_id == other_doc_id
+    assert _pages_with_chunks(sb, other_doc_id) == set(range(1, PAGE_COUNT + 1))
+
+
+def test_concurrent_ingest_of_same_pdf_is_refused(env):
+    settings, sb = env
+    pdf = _pdf()
+    journal = get_ingest_journal(settings)
+
+    assert journal.claim(sha256_hex(pdf))
+    try:
+        with pytest.raises(RuntimeError):
+            ingest_pdf_to_supabase(settings, pdf, "manual")
+    finally:
+        journal.release(sha256_hex(pdf))
+    assert "manual_docs" not in sb.tables or not sb.tables["manual_docs"]
+
+    doc_id, _ = ingest_pdf_to_supabase(settings, pdf, "manual")
+    assert _pages_with_chunks(sb, doc_id) == set(range(1, PAGE_COUNT + 1))
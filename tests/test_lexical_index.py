@@ -0,0 +1,23 @@
+from fake_clients import FakeSupabase
+from lexical_index import LexicalIndex
+
+
+def _index(contents):
+    sb = FakeSupabase()
+    for page, content in enumerate(contents, start=1):
+        sb.table("rag_chunks").insert(
+            {"doc_id": 1, "page_number": page, "chunk_index": 0, "content": content, "is_toc": False}
+        ).execute()
+    return LexicalIndex(sb)
+
+
+def test_exact_code_does_not_match_longer_code():
+    idx = _index(["E-50 에러: 배수 필터 점검", "E-5 에러: 급수 밸브 확인", "E-5에러 표시 시 전원 재시작"])
+
+    exact = {r["content"]: r["exact_code"] for r in idx.search("E-5 에러", top_k=5)}
+
+    assert exact == {
+        "E-5 에러: 급수 밸브 확인": True,
+        "E-5에러 표시 시 전원 재시작": True,
+        "E-50 에러: 배수 필터 점검": False,
+    }
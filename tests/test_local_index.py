@@ -0,0 +1,72 @@
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from fake_clients import FakeLatency, FakeSupabase, fake_embedding
+from retrieval_backends import LocalVectorIndex
+
+DIMS = 64
+
+
+def _add_chunks(sb, doc_id, n):
+    for i in range(n):
+        content = f"문서 {doc_id} 청크 {i} 필터 청소 에러 E-{i}"
+        sb.table("rag_chunks").insert(
+            {
+                "doc_id": doc_id,
+                "page_number": i + 1,
+                "chunk_index": 0,
+                "content": content,
+                "is_toc": False,
+                "embedding": json.dumps(fake_embedding(content, DIMS)),
+            }
+        ).execute()
+
+
+def _selects(sb):
+    return sb.stats()["requests"].get("select.rag_chunks", 0)
+
+
+@pytest.fixture
+def sb():
+    sb = FakeSupabase(latency=FakeLatency(base_ms=20))
+    _add_chunks(sb, 1, 30)
+    return sb
+
+
+def test_concurrent_syncs_do_not_duplicate_rows(sb, tmp_path):
+    index = LocalVectorIndex(sb, str(tmp_path / "idx"), DIMS, sync_interval_s=3600)
+
+    threads = [threading.Thread(target=index.sync) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(index.ids) == 30
+    assert len(set(index.ids.tolist())) == 30
+    assert _selects(sb) == 1
+
+
+def test_queries_read_memory_and_background_sync_applies_changes(sb, tmp_path):
+    index = LocalVectorIndex(sb, str(tmp_path / "idx"), DIMS, sync_interval_s=3600)
+    q = fake_embedding("문서 1 청크 3 필터 청소 에러 E-3", DIMS)
+    assert index.search(q, 5)  # 첫 조회만 직접 sync
+    index.start_background_sync()
+
+    before = _selects(sb)
+    for _ in range(5):
+        index.search(q, 5)
+    assert _selects(sb) - before <= 1  # 백그라운드 첫 sync 외에는 조회 경로에서 DB 를 읽지 않음
+
+    _add_chunks(sb, 2, 3)
+    index.invalidate_doc(2)  # 적재 완료 시 notify_doc_changed 로 호출됨
+    deadline = time.time() + 5
+    while time.time() < deadline and 2 not in set(index.doc_ids.tolist()):
+        time.sleep(0.02)
+
+    assert int(np.sum(index.doc_ids == 2)) == 3
+    assert len(set(index.ids.tolist())) == len(index.ids)
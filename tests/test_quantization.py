@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from fake_clients import FakeSupabase, fake_embedding
+from retrieval_backends import LocalVectorIndex, quantization_recall
+
+DIMS = 256
+PARTS = ("필터", "배수 펌프", "도어 잠금", "히터", "급수 밸브", "모터", "센서", "전원부")
+
+
+def _content(i):
+    return f"{PARTS[i % len(PARTS)]} 점검 {i}단계: 에러 E-{i % 97:02d} 표시 시 {i * 7 % 13}번 나사를 풀고 확인"
+
+
+@pytest.fixture
+def sb():
+    sb = FakeSupabase()
+    rows = [
+        {
+            "doc_id": 1 + i % 3,
+            "page_number": i // 3 + 1,
+            "chunk_index": 0,
+            "content": _content(i),
+            "is_toc": False,
+            "embedding": json.dumps(fake_embedding(_content(i), DIMS)),
+        }
+        for i in range(600)
+    ]
+    sb.table("rag_chunks").insert(rows).execute()
+    return sb
+
+
+def _index(sb, tmp_path, quantization):
+    index = LocalVectorIndex(sb, str(tmp_path / quantization), DIMS, quantization=quantization, rerank_shortlist=100)
+    index.sync()
+    return index
+
+
+def test_int8_rerank_keeps_recall(sb, tmp_path):
+    index = _index(sb, tmp_path, "int8")
+
+    report = {(r["mode"], r["shortlist"]): r for r in quantization_recall(index, shortlists=(100,), n_queries=100)}
+
+    assert report[("int8", 100)]["recall_at_k"] >= 0.95
+    assert report[("int8", 100)]["bytes_per_vector"] == DIMS
+    assert report[("binary", 100)]["bytes_per_vector"] == DIMS // 8
+    assert index.memory_bytes()["resident"] * 4 == index.memory_bytes()["full_precision"]
+
+
+def test_quantized_search_returns_exact_similarities(sb, tmp_path):
+    exact = _index(sb, tmp_path, "none")
+    quantized = _index(sb, tmp_path, "int8")
+    q = fake_embedding(_content(42), DIMS)
+
+    want = exact.search(q, 5, doc_id_filter=1)
+    got = quantized.search(q, 5, doc_id_filter=1)
+
+    assert [r["id"] for r in got] == [r["id"] for r in want]
+    assert [r["similarity"] for r in got] == pytest.approx([r["similarity"] for r in want], abs=1e-6)
+    assert got[0]["content"] == _content(42)
@@ -0,0 +1,57 @@
+import dataclasses
+import threading
+
+import pytest
+import streamlit as st
+
+import delete_queue
+import ingest_queue
+from config import Settings
+
+
+@pytest.fixture
+def settings(tmp_path):
+    st.cache_resource.clear()
+    yield Settings(
+        openai_api_key="", supabase_url="", supabase_service_key="",
+        ingest_queue_dir=str(tmp_path / "ingest_queue"),
+        delete_queue_path=str(tmp_path / "delete_queue.sqlite3"),
+    )
+    st.cache_resource.clear()
+
+
+def test_ingest_worker_uses_latest_settings(settings, monkeypatch):
+    seen = []
+    done = threading.Event()
+
+    def fake_ingest(s, pdf_bytes, title, doc_id=None, on_progress=None):
+        seen.append(s.chunk_size)
+        done.set()
+        return 1, 0
+
+    monkeypatch.setattr(ingest_queue, "ingest_pdf_to_supabase", fake_ingest)
+    ingest_queue.get_ingest_queue(settings)
+    queue = ingest_queue.get_ingest_queue(dataclasses.replace(settings, chunk_size=321))
+    queue.enqueue("manual", b"%PDF-1.4 fake")
+
+    assert done.wait(5)
+    assert seen == [321]
+
+
+def test_delete_worker_uses_latest_settings(settings, monkeypatch):
+    seen = []
+    done = threading.Event()
+
+    def fake_purge(s, doc_id, on_progress=None):
+        seen.append(s.delete_workers)
+        done.set()
+        return {"storage_deleted": 0, "storage_failed": []}
+
+    monkeypatch.setattr(delete_queue, "soft_delete_doc", lambda s, doc_id: seen.append(s.delete_workers))
+    monkeypatch.setattr(delete_queue, "purge_doc", fake_purge)
+    delete_queue.get_delete_queue(settings)
+    queue = delete_queue.get_delete_queue(dataclasses.replace(settings, delete_workers=7))
+    queue.delete(42)
+
+    assert done.wait(5)
+    assert seen == [7, 7]
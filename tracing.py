@@ -0,0 +1,254 @@
+"""
+경량 tracing / metrics
+- span(name): 외부 호출·파이프라인 단계의 소요 시간 + 속성(토큰, payload 크기, 캐시 hit 등)
+- start_trace(settings, name): 요청 단위로 span 을 모아 JSON 한 줄로 로그, 요청별 단계 breakdown 제공
+- 모든 span 은 trace 유무와 관계없이 프로세스 전역 metrics 에 누적되고,
+  render_prometheus() / Settings.metrics_path 파일(Prometheus text format)로 노출
+- hot path 비용: span 당 perf_counter 2회 + lock 1회, 로그는 trace 당 1줄
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import Settings
+
+logger = logging.getLogger("rag.trace")
+
+_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 숫자 속성 중 metrics 로 누적할 것 (span 이름별 counter)
+_COUNTED_ATTRS = ("input_tokens", "output_tokens", "bytes_in", "bytes_out", "rows")
+
+
+class Span:
+    __slots__ = ("name", "start_ms", "duration_ms", "depth", "attrs")
+
+    def __init__(self, name: str, start_ms: float, depth: int, attrs: Dict[str, Any]):
+        self.name = name
+        self.start_ms = start_ms
+        self.duration_ms = 0.0
+        self.depth = depth
+        self.attrs = attrs
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "start_ms": round(self.start_ms, 2),
+            "ms": round(self.duration_ms, 2),
+            "depth": self.depth,
+            **self.attrs,
+        }
+
+
+class Trace:
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.spans: List[Span] = []
+        self.cache: Dict[str, str] = {}
+        self.depth = 0
+        self.t0 = time.perf_counter()
+        self.duration_ms = 0.0
+
+    def stage_ms(self) -> Dict[str, float]:
+        """
+        최상위(depth 0) span 이름별 소요 시간 합계(ms)
+        """
+        out: Dict[str, float] = {}
+        for s in self.spans:
+            if s.depth == 0:
+                out[s.name] = out.get(s.name, 0.0) + s.duration_ms
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "ms": round(self.duration_ms, 2),
+            **self.attrs,
+            "cache": dict(self.cache),
+            "spans": [s.to_dict() for s in sorted(self.spans, key=lambda s: s.start_ms)],
+        }
+
+
+class _Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hist: Dict[str, List[float]] = {}  # span -> [bucket counts..., sum, count]
+        self._counters: Dict[Any, float] = {}
+        self._errors: Dict[str, int] = {}
+        self._cache: Dict[Any, int] = {}
+        self._last_flush = 0.0
+
+    def observe(self, span: Span) -> None:
+        sec = span.duration_ms / 1000.0
+        with self._lock:
+            h = self._hist.get(span.name)
+            if h is None:
+                h = self._hist[span.name] = [0.0] * (len(_BUCKETS_S) + 2)
+            for i, le in enumerate(_BUCKETS_S):
+                if sec <= le:
+                    h[i] += 1
+            h[-2] += sec
+            h[-1] += 1
+            for key in _COUNTED_ATTRS:
+                v = span.attrs.get(key)
+                if isinstance(v, (int, float)):
+                    self._counters[(span.name, key)] = self._counters.get((span.name, key), 0.0) + v
+            if "error" in span.attrs:
+                self._errors[span.name] = self._errors.get(span.name, 0) + 1
+
+    def cache_event(self, cache: str, result: str) -> None:
+        with self._lock:
+            self._cache[(cache, result)] = self._cache.get((cache, result), 0) + 1
+
+    def render(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP rag_span_duration_seconds Duration of pipeline stages and external calls.",
+                "# TYPE rag_span_duration_seconds histogram",
+            ]
+            for name, h in sorted(self._hist.items()):
+                for i, le in enumerate(_BUCKETS_S):
+                    lines.append(f'rag_span_duration_seconds_bucket{{span="{name}",le="{le}"}} {int(h[i])}')
+                lines.append(f'rag_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {int(h[-1])}')
+                lines.append(f'rag_span_duration_seconds_sum{{span="{name}"}} {h[-2]:.6f}')
+                lines.append(f'rag_span_duration_seconds_count{{span="{name}"}} {int(h[-1])}')
+
+            lines += ["# HELP rag_span_errors_total Spans that raised.", "# TYPE rag_span_errors_total counter"]
+            for name, n in sorted(self._errors.items()):
+                lines.append(f'rag_span_errors_total{{span="{name}"}} {n}')
+
+            for key, help_text in (
+                ("input_tokens", "Input tokens reported by the API."),
+                ("output_tokens", "Output tokens reported by the API."),
+                ("bytes_in", "Payload bytes received."),
+                ("bytes_out", "Payload bytes sent."),
+                ("rows", "Rows read or written."),
+            ):
+                metric = f"rag_{key}_total"
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+                for (name, k), v in sorted(self._counters.items()):
+                    if k == key:
+                        lines.append(f'{metric}{{span="{name}"}} {v:g}')
+
+            lines += ["# HELP rag_cache_events_total Cache lookups by result.", "# TYPE rag_cache_events_total counter"]
+            for (cache, result), n in sorted(self._cache.items()):
+                lines.append(f'rag_cache_events_total{{cache="{cache}",result="{result}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def maybe_flush(self, path: str, interval_s: float) -> None:
+        now = time.time()
+        with self._lock:
+            if not path or now - self._last_flush < interval_s:
+                return
+            self._last_flush = now
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+_metrics = _Metrics()
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("rag_trace", default=None)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span]:
+    """
+    with span("openai.embeddings", inputs=3) as s:
+        resp = ...
+        s.set(input_tokens=resp.usage.total_tokens)
+    """
+    trace = _current.get()
+    t0 = time.perf_counter()
+    depth = 0
+    if trace is not None:
+        depth = trace.depth
+        trace.depth += 1
+    s = Span(name, ((t0 - trace.t0) * 1000.0) if trace is not None else 0.0, depth, attrs)
+    try:
+        yield s
+    except BaseException as e:
+        s.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        s.duration_ms = (time.perf_counter() - t0) * 1000.0
+        _metrics.observe(s)
+        if trace is not None:
+            trace.depth -= 1
+            trace.spans.append(s)
+
+
+def cache_event(cache: str, result: str) -> None:
+    """
+    캐시 조회 결과 기록 (result: "hit" / "miss" / "exact" / "semantic" ...)
+    """
+    _metrics.cache_event(cache, result)
+    trace = _current.get()
+    if trace is not None:
+        trace.cache[cache] = result
+
+
+def usage_attrs(usage) -> Dict[str, int]:
+    """
+    OpenAI Responses / Embeddings usage → span 속성 (input_tokens / output_tokens)
+    """
+    if usage is None:
+        return {}
+    out = {}
+    pairs = (("input_tokens", "input_tokens"), ("prompt_tokens", "input_tokens"), ("output_tokens", "output_tokens"))
+    for attr, key in pairs:
+        v = getattr(usage, attr, None)
+        if isinstance(v, int) and key not in out:
+            out[key] = v
+    return out
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def _ensure_log_handler() -> None:
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+@contextmanager
+def start_trace(settings: Settings, name: str, **attrs: Any) -> Iterator[Trace]:
+    """
+    요청 단위 trace. 끝나면 JSON 한 줄 로그(rag.trace logger) + metrics 파일 갱신(주기 제한)
+    """
+    trace = Trace(name, attrs)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        trace.duration_ms = (time.perf_counter() - trace.t0) * 1000.0
+        if settings.trace_log_enabled:
+            _ensure_log_handler()
+        if settings.trace_log_enabled and logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(trace.to_dict(), ensure_ascii=False, default=str))
+        try:
+            _metrics.maybe_flush(settings.metrics_path, settings.metrics_flush_interval_s)
+        except OSError:
+            pass
+
+
+def render_prometheus() -> str:
+    return _metrics.render()
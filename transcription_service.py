@@ -0,0 +1,135 @@
+"""
+음성 질문 → 텍스트 (whisper)
+- 녹음 바이트를 메모리에서 바로 처리 (임시 파일 X)
+- pydub 로 앞뒤 무음 제거 + mono / 16kHz 변환 후 압축 코덱(기본 ogg/opus)으로 업로드
+  (ffmpeg 가 없어 압축 인코딩이 실패하면 전처리된 WAV, 디코딩도 실패하면 원본 그대로)
+- 녹음 원본 sha256 기준 결과 캐시 (SQLite, 세션/재시작 간 공유)
+"""
+import hashlib
+from io import BytesIO
+from typing import Optional, Tuple
+
+import streamlit as st
+from openai import OpenAI
+from pydub import AudioSegment
+from pydub.silence import detect_leading_silence
+
+from config import Settings
+from disk_cache import SqliteCache
+from tracing import cache_event, span
+
+
+def audio_digest(audio_bytes: bytes) -> str:
+    return hashlib.sha256(audio_bytes).hexdigest()
+
+
+def trim_silence(seg: AudioSegment, margin_db: float, keep_ms: int) -> AudioSegment:
+    """
+    앞뒤 무음 제거. 기준은 녹음 평균 음량보다 margin_db 낮은 레벨 (기기마다 입력 레벨이 달라서 절대값 X)
+    - 앞뒤 keep_ms 는 남김 (첫 음절이 잘리지 않게)
+    - 전부 무음으로 판정되면 원본 그대로
+    """
+    if len(seg) == 0 or seg.dBFS == float("-inf"):
+        return seg
+    thresh = seg.dBFS - margin_db
+    start = detect_leading_silence(seg, silence_threshold=thresh)
+    end = len(seg) - detect_leading_silence(seg.reverse(), silence_threshold=thresh)
+    if end <= start:
+        return seg
+    return seg[max(0, start - keep_ms): min(len(seg), end + keep_ms)]
+
+
+def preprocess_audio(settings: Settings, audio_bytes: bytes) -> Tuple[bytes, str]:
+    """
+    return: (업로드할 바이트, 포맷 확장자)
+    """
+    try:
+        seg = AudioSegment.from_file(BytesIO(audio_bytes))
+    except Exception:
+        return audio_bytes, "wav"
+
+    seg = trim_silence(seg, settings.transcription_silence_margin_db, settings.transcription_keep_silence_ms)
+    seg = seg.set_channels(1).set_frame_rate(settings.transcription_sample_rate)
+
+    fmt = settings.transcription_format
+    if fmt != "wav":
+        try:
+            buf = BytesIO()
+            seg.export(buf, format=fmt, codec=settings.transcription_codec or None,
+                       bitrate=settings.transcription_bitrate)
+            return buf.getvalue(), fmt
+        except Exception:
+            pass  # ffmpeg 없음 / 코덱 미지원 → WAV
+
+    buf = BytesIO()
+    seg.export(buf, format="wav")
+    return buf.getvalue(), "wav"
+
+
+class TranscriptCache:
+    """
+    (모델, 언어, 전처리 설정, sha256(녹음 원본)) → 변환 텍스트
+    """
+
+    def __init__(self, store: SqliteCache):
+        self.store = store
+
+    @staticmethod
+    def make_key(settings: Settings, digest: str) -> str:
+        return (
+            f"{settings.transcription_model}:{settings.transcription_language}:"
+            f"{settings.transcription_format}:{settings.transcription_sample_rate}:{digest}"
+        )
+
+    def get(self, settings: Settings, digest: str) -> Optional[str]:
+        blob = self.store.get(self.make_key(settings, digest))
+        return blob.decode("utf-8") if blob is not None else None
+
+    def put(self, settings: Settings, digest: str, text: str) -> None:
+        self.store.put(self.make_key(settings, digest), (text or "").encode("utf-8"))
+
+    def stats(self):
+        return self.store.stats()
+
+
+@st.cache_resource
+def _open_transcript_cache(path: str, max_entries: int) -> TranscriptCache:
+    return TranscriptCache(SqliteCache(path, max_entries))
+
+
+def get_transcript_cache(settings: Settings) -> Optional[TranscriptCache]:
+    if not settings.transcription_cache_enabled:
+        return None
+    return _open_transcript_cache(settings.transcription_cache_path, settings.transcription_cache_max_entries)
+
+
+def transcribe_audio(settings: Settings, client: OpenAI, audio_bytes: bytes) -> Tuple[str, bool]:
+    """
+    캐시 조회 → (miss) 전처리 → whisper
+    return: (변환 텍스트, 캐시 히트 여부)
+    """
+    cache = get_transcript_cache(settings)
+    digest = audio_digest(audio_bytes)
+    if cache:
+        text = cache.get(settings, digest)
+        cache_event("transcription", "hit" if text is not None else "miss")
+        if text is not None:
+            return text, True
+
+    with span("audio.preprocess", bytes_in=len(audio_bytes)) as sp:
+        data, fmt = preprocess_audio(settings, audio_bytes)
+        sp.set(bytes_out=len(data), format=fmt)
+
+    f = BytesIO(data)
+    f.name = f"speech.{fmt}"  # SDK 가 파일명 확장자로 포맷을 전달
+    with span("openai.transcriptions", bytes_out=len(data), format=fmt):
+        transcript = client.audio.transcriptions.create(
+            model=settings.transcription_model,
+            file=f,
+            language=settings.transcription_language,
+            response_format="text",
+        )
+    text = (transcript if isinstance(transcript, str) else getattr(transcript, "text", "")).strip()
+    if cache and text:
+        cache.put(settings, digest, text)
+    return text, False
@@ -1,5 +1,6 @@
 import json
 import re
+import unicodedata
 from typing import List, Optional, Dict, Any
 
 
@@ -21,6 +22,18 @@ def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
     return chunks
 
 
+def normalize_question(text: str) -> str:
+    """
+    캐시 키용 질문 정규화
+    - 전각 문자 → 반각 (NFKC), 대소문자 통일
+    - 구두점 제거 (에러 코드의 '-' 는 유지), 공백 정리
+    예) "Ｅ-05 에러 해결 방법?" -> "e-05 에러 해결 방법"
+    """
+    t = unicodedata.normalize("NFKC", text or "").casefold()
+    t = re.sub(r"[^\w\s-]", " ", t)
+    return re.sub(r"\s+", " ", t).strip()
+
+
 def robust_json_loads(s: str) -> Optional[Dict[str, Any]]:
     try:
         return json.loads(s)